@@ -0,0 +1,306 @@
+"""
+Batch eligibility evaluation across many profiles.
+
+Profiles are read in chunks of BATCH_ELIGIBILITY_CHUNK_SIZE and laid out as
+columns (one NumPy array per field a rule reads). Each rule is then evaluated
+for the whole chunk at once: date rules use datetime64 arithmetic and
+presence rules combine boolean masks. Rules with a scalar check but no
+vectorized counterpart still work, evaluated row by row through RuleContext.
+
+Results stream out as one row per (user, service). When the input spans more
+than one chunk, chunks are evaluated in a process pool.
+
+    python batch_eligibility.py passport_renewal tax_filing --out results.ndjson
+    python batch_eligibility.py tax_filing --input profiles.ndjson --format csv --only-eligible
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import chain, islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+from config import BATCH_ELIGIBILITY_CHUNK_SIZE, BATCH_ELIGIBILITY_WORKERS
+from knowledge_base import COMPILED_RULES
+from rules import INVALID, CompiledRule, RuleContext, parse_date
+
+PASSED, FAILED, WARNING = 0, 1, 2
+STATUS_CODES = {"passed": PASSED, "failed": FAILED, "warning": WARNING}
+CSV_COLUMNS = ["user_id", "service", "eligible", "passed", "failed", "warnings", "failed_rules"]
+
+VectorCheck = Callable[[Dict[str, Any], "Columns"], Any]
+VECTOR_CHECKS: Dict[str, VectorCheck] = {}
+
+
+def vector_rule(rule_id: str):
+    """Register a whole-chunk counterpart of a scalar eligibility check"""
+    def register(check: VectorCheck) -> VectorCheck:
+        VECTOR_CHECKS[rule_id] = check
+        return check
+    return register
+
+
+class Columns:
+    """Per-field arrays for one chunk of profiles, built on first use"""
+
+    def __init__(self, profiles: List[Dict[str, Any]], now: datetime):
+        self.profiles = profiles
+        self.size = len(profiles)
+        self.now = now
+        self.now64 = np.datetime64(now, "us")
+        self._cache: Dict[Any, Any] = {}
+
+    def _column(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def values(self, field: str, default: Any = None) -> Iterator[Any]:
+        return (p.get(field, default) for p in self.profiles)
+
+    def present(self, field: str):
+        """True where the field holds a non-blank value"""
+        return self._column(("present", field), lambda: np.fromiter(
+            (bool(v) and not (isinstance(v, str) and not v.strip()) for v in self.values(field)),
+            dtype=bool, count=self.size))
+
+    def truthy(self, field: str):
+        return self._column(("truthy", field), lambda: np.fromiter(
+            (bool(v) for v in self.values(field)), dtype=bool, count=self.size))
+
+    def strings(self, field: str, default: str = ""):
+        return self._column(("str", field, default), lambda: np.array(
+            [v if isinstance(v, str) else str(v) for v in self.values(field, default)], dtype=str))
+
+    def dates(self, field: str):
+        """(datetime64 values with blanks/invalid set to now, missing mask, invalid mask)"""
+        def build():
+            parsed = [parse_date(v) for v in self.values(field, "")]
+            missing = np.fromiter((d is None for d in parsed), dtype=bool, count=self.size)
+            invalid = np.fromiter((d is INVALID for d in parsed), dtype=bool, count=self.size)
+            values = np.array([d if isinstance(d, datetime) else self.now for d in parsed],
+                              dtype="datetime64[us]")
+            return values, missing, invalid
+        return self._column(("date", field), build)
+
+    def contexts(self) -> List[RuleContext]:
+        return self._column("contexts", lambda: [RuleContext(p, self.now) for p in self.profiles])
+
+
+DAY = None if np is None else np.timedelta64(1, "D")
+
+
+def _days_until(cols: Columns, field: str):
+    values, missing, invalid = cols.dates(field)
+    # Floor division matches timedelta.days in the scalar checks
+    return (values - cols.now64) // DAY, missing, invalid
+
+
+@vector_rule("passport_valid")
+def _passport_valid(rule, cols):
+    days, missing, invalid = _days_until(cols, "passport_expiry")
+    return np.where(~missing & ~invalid & (days / 30 >= 6), PASSED, FAILED)
+
+
+@vector_rule("passport_expiry_check")
+def _passport_renewal(rule, cols):
+    days, missing, invalid = _days_until(cols, "passport_expiry")
+    return np.select([missing, invalid, days / 30 <= 6], [PASSED, WARNING, PASSED], WARNING)
+
+
+@vector_rule("age_check")
+def _adult(rule, cols):
+    values, missing, invalid = cols.dates("date_of_birth")
+    age = ((cols.now64 - values) // DAY) // 365
+    return np.where(~missing & ~invalid & (age >= 18), PASSED, FAILED)
+
+
+@vector_rule("nationality_check")
+def _malaysian(rule, cols):
+    return np.where(np.char.lower(cols.strings("nationality")) == "malaysian", PASSED, FAILED)
+
+
+@vector_rule("security_level")
+def _verified_security(rule, cols):
+    return np.where(np.isin(cols.strings("security_level", "basic"), ["verified", "premium"]), PASSED, FAILED)
+
+
+@vector_rule("security_premium")
+def _premium_security(rule, cols):
+    return np.where(cols.strings("security_level", "basic") == "premium", PASSED, FAILED)
+
+
+@vector_rule("biometric_check")
+def _biometric(rule, cols):
+    return np.where(cols.truthy("biometric_registered"), PASSED, WARNING)
+
+
+def rule_statuses(compiled: CompiledRule, cols: Columns):
+    """Status code per profile for one rule"""
+    rule = compiled.rule
+    vector = VECTOR_CHECKS.get(rule["rule_id"])
+    if vector is not None:
+        return vector(rule, cols)
+    if compiled.check is not None:
+        return np.fromiter((STATUS_CODES[compiled.run(ctx)[0]] for ctx in cols.contexts()),
+                           dtype=np.int8, count=cols.size)
+    present = np.logical_and.reduce([cols.present(f) for f in compiled.fields])
+    return np.where(present, PASSED, FAILED if rule["severity"] == "critical" else WARNING)
+
+
+def evaluate_chunk(profiles: List[Dict[str, Any]], services: List[str], now: datetime,
+                   only_eligible: bool = False) -> List[Dict[str, Any]]:
+    """Evaluate one chunk of profiles against each service"""
+    cols = Columns(profiles, now)
+    rows = []
+    for service in services:
+        rules = COMPILED_RULES[service]
+        statuses = np.vstack([rule_statuses(r, cols) for r in rules])
+        failed = statuses == FAILED
+        eligible = ~failed.any(axis=0)
+        passed_n = (statuses == PASSED).sum(axis=0)
+        failed_n = failed.sum(axis=0)
+        warning_n = (statuses == WARNING).sum(axis=0)
+        # Failed rules as a bitmask per profile, decoded once per distinct mask
+        weights = np.left_shift(1, np.arange(len(rules), dtype=np.int64))[:, None]
+        failed_masks = (failed * weights).sum(axis=0)
+        rule_ids = [r.rule["rule_id"] for r in rules]
+        decoded: Dict[int, List[str]] = {}
+
+        columns = zip(eligible.tolist(), passed_n.tolist(), failed_n.tolist(),
+                      warning_n.tolist(), failed_masks.tolist())
+        for profile, (ok, passed, failed_count, warnings, mask) in zip(profiles, columns):
+            if only_eligible and not ok:
+                continue
+            if mask not in decoded:
+                decoded[mask] = [rid for bit, rid in enumerate(rule_ids) if mask >> bit & 1]
+            rows.append({
+                "user_id": profile.get("user_id"),
+                "service": service,
+                "eligible": ok,
+                "passed": passed,
+                "failed": failed_count,
+                "warnings": warnings,
+                "failed_rules": decoded[mask],
+            })
+    return rows
+
+
+def _chunks(profiles: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    it = iter(profiles)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def evaluate_profiles(profiles: Iterable[Dict[str, Any]], services: List[str],
+                      chunk_size: int = BATCH_ELIGIBILITY_CHUNK_SIZE,
+                      workers: int = BATCH_ELIGIBILITY_WORKERS,
+                      only_eligible: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Yield result rows in input order. A single chunk (or workers=1) is
+    evaluated in-process; larger inputs fan chunks out to a process pool with
+    at most two chunks per worker in flight.
+    """
+    if np is None:
+        raise RuntimeError("Batch eligibility requires the 'numpy' package")
+    unknown = [s for s in services if s not in COMPILED_RULES]
+    if unknown:
+        raise ValueError(f"No eligibility rules defined for: {', '.join(unknown)}")
+
+    now = datetime.now()
+    chunks = _chunks(profiles, chunk_size)
+    head = list(islice(chunks, 2))
+    workers = workers or os.cpu_count() or 1
+    if len(head) < 2 or workers == 1:
+        for chunk in chain(head, chunks):
+            yield from evaluate_chunk(chunk, services, now, only_eligible)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chain(head, chunks):
+            pending.append(pool.submit(evaluate_chunk, chunk, services, now, only_eligible))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def to_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    for row in rows:
+        yield json.dumps(row).encode("utf-8") + b"\n"
+
+
+def to_csv(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        writer.writerow([row["user_id"], row["service"], row["eligible"], row["passed"],
+                         row["failed"], row["warnings"], ";".join(row["failed_rules"])])
+        if buffer.tell() > 1 << 16:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+FORMATTERS = {"ndjson": to_ndjson, "csv": to_csv}
+
+
+def read_ndjson_profiles(fh) -> Iterator[Dict[str, Any]]:
+    for line in fh:
+        if line.strip():
+            yield json.loads(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate eligibility rules for every profile")
+    parser.add_argument("services", nargs="+", choices=sorted(COMPILED_RULES))
+    parser.add_argument("--input", help="NDJSON profiles to read instead of the database ('-' for stdin)")
+    parser.add_argument("--out", default="-", help="file to write results to ('-' for stdout)")
+    parser.add_argument("--format", choices=sorted(FORMATTERS), default="ndjson")
+    parser.add_argument("--only-eligible", action="store_true")
+    parser.add_argument("--chunk-size", type=int, default=BATCH_ELIGIBILITY_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=BATCH_ELIGIBILITY_WORKERS,
+                        help="worker processes for multi-chunk inputs (0 = one per CPU)")
+    args = parser.parse_args()
+
+    if args.input:
+        source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+        profiles = read_ndjson_profiles(source)
+    else:
+        from database import iter_users
+        profiles = iter_users()
+
+    started = time.perf_counter()
+    count = 0
+
+    def counted(rows):
+        global count
+        for row in rows:
+            count += 1
+            yield row
+
+    out = sys.stdout.buffer if args.out == "-" else open(args.out, "wb")
+    with out:
+        rows = evaluate_profiles(profiles, args.services, args.chunk_size, args.workers, args.only_eligible)
+        for data in FORMATTERS[args.format](counted(rows)):
+            out.write(data)
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {count} results in {elapsed:.2f}s "
+          f"({count / elapsed if elapsed else 0:.0f} rows/s)", file=sys.stderr)
@@ -0,0 +1,71 @@
+"""
+Benchmark AnomalyDetector rate tracking against the previous list-of-datetimes
+implementation: per-call latency and resident memory for many users.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_anomaly --users 1000000 --calls-per-user 3
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from services.ai_engine import AnomalyDetector
+
+
+class ListDetector:
+    """The previous implementation, kept for comparison"""
+
+    def __init__(self):
+        self.access_logs = {}
+
+    def check_behavior(self, user_id, event_type, metadata=None):
+        now = datetime.now()
+        timestamps = self.access_logs.get(user_id, [])
+        timestamps = [t for t in timestamps if t > now - timedelta(hours=1)]
+        timestamps.append(now)
+        self.access_logs[user_id] = timestamps
+        recent_requests = [t for t in timestamps if t > now - timedelta(minutes=1)]
+        return len(recent_requests) > 10
+
+
+def bench(detector_cls, user_ids, calls_per_user, hot_calls):
+    gc.collect()
+    tracemalloc.start()
+    detector = detector_cls()
+    start = time.perf_counter()
+    for _ in range(calls_per_user):
+        for user_id in user_ids:
+            detector.check_behavior(user_id, "login")
+    spread_s = time.perf_counter() - start
+
+    # One user hammering the endpoint: cost grows with history for the list version
+    start = time.perf_counter()
+    for _ in range(hot_calls):
+        detector.check_behavior("hot-user", "login")
+    hot_s = time.perf_counter() - start
+
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return spread_s / (len(user_ids) * calls_per_user), hot_s / hot_calls, memory
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--calls-per-user", type=int, default=3)
+    parser.add_argument("--hot-calls", type=int, default=5_000)
+    args = parser.parse_args()
+
+    user_ids = [f"user-{i}" for i in range(args.users)]
+    print(f"{args.users} users x {args.calls_per_user} calls, plus {args.hot_calls} calls from one user")
+    print(f"{'detector':<12}{'us/call':>10}{'hot us/call':>14}{'memory (MB)':>14}")
+    for name, cls in (("ring", AnomalyDetector), ("list", ListDetector)):
+        per_call, hot_per_call, memory = bench(cls, user_ids, args.calls_per_user, args.hot_calls)
+        print(f"{name:<12}{per_call * 1e6:>10.2f}{hot_per_call * 1e6:>14.2f}{memory / 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
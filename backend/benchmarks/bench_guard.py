@@ -0,0 +1,84 @@
+"""
+Benchmark per-request overhead of the request guard middleware, against the
+bare app and a no-op @app.middleware("http") (the old verify_signature).
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_guard --requests 50000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ.setdefault("RATE_LIMIT_DB_PATH", os.path.join(tempfile.mkdtemp(), "ratelimit.db"))
+
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+from starlette.responses import PlainTextResponse  # noqa: E402
+
+from services.rate_limiter import Limit, rate_limiter  # noqa: E402
+from services.request_guard import RequestGuard, RequestGuardMiddleware  # noqa: E402
+
+POLICIES = {
+    "/": {"limits": ["ip", "user"]},
+    "/health": {},
+    "/security": {"limits": ["ip", "user"], "anomaly": "security"},
+}
+
+
+async def endpoint(scope, receive, send):
+    await PlainTextResponse("ok")(scope, receive, send)
+
+
+async def noop_dispatch(request, call_next):
+    return await call_next(request)
+
+
+def scope_for(path, i, users):
+    return {"type": "http", "method": "GET", "path": path, "raw_path": path.encode(),
+            "query_string": f"user_id=user-{i % users}".encode(), "headers": [],
+            "client": (f"10.0.{i % 250}.{i % 200}", 5000), "server": ("test", 80), "scheme": "http"}
+
+
+async def run(app, path, requests, users):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    for i in range(requests):
+        await app(scope_for(path, i, users), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    args = parser.parse_args()
+
+    # Generous limits so every request takes the full allowed path
+    rate_limiter.limits = {name: Limit(1_000_000, 1, 1_000_000) for name in rate_limiter.limits}
+    guard = RequestGuard(POLICIES)
+    apps = {
+        "bare": endpoint,
+        "noop http middleware": BaseHTTPMiddleware(endpoint, dispatch=noop_dispatch),
+        "guard": RequestGuardMiddleware(endpoint, guard),
+    }
+    cases = [("bare", "/tasks"), ("noop http middleware", "/tasks"), ("guard", "/health"),
+             ("guard", "/tasks"), ("guard", "/security/status")]
+
+    print(f"{args.requests} requests over {args.users} users, backend {type(rate_limiter.backend).__name__}")
+    print(f"{'app':<22}{'path':<18}{'us/request':>12}{'overhead':>10}")
+    bare = None
+    for name, path in cases:
+        per_request = asyncio.run(run(apps[name], path, args.requests, args.users))
+        bare = per_request if bare is None else bare
+        print(f"{name:<22}{path:<18}{per_request * 1e6:>12.1f}{(per_request - bare) * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
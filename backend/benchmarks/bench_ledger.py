@@ -0,0 +1,72 @@
+"""
+Benchmark the persistent audit ledger: append latency and peak RSS as the
+chain grows, random reads, Merkle proofs, and startup recovery time.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_ledger --blocks 1000000
+"""
+import argparse
+import os
+import random
+import resource
+import tempfile
+import time
+
+from services.blockchain import BlockchainService
+from services.ledger_file import LedgerFile
+from services.merkle import verify_proof
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blocks", type=int, default=1_000_000)
+    parser.add_argument("--report-every", type=int, default=200_000)
+    parser.add_argument("--fsync-interval", type=float, default=1.0)
+    parser.add_argument("--block-size", type=int, default=4096, help="transactions in the proof benchmark block")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ledger.log")
+        chain = BlockchainService(LedgerFile(path, args.fsync_interval))
+        print(f"{'blocks':>10}{'us/append':>12}{'peak RSS MB':>14}")
+        start = time.perf_counter()
+        for i in range(1, args.blocks + 1):
+            chain.add_transaction({"event": "ID_REVOCATION", "user_id": f"user-{i}", "risk_score": 0.0})
+            if i % args.report_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{i:>10}{elapsed / args.report_every * 1e6:>12.1f}"
+                      f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:>14.1f}")
+                start = time.perf_counter()
+        chain.ledger.flush()
+
+        reads = 100_000
+        indexes = [random.randint(1, len(chain)) for _ in range(reads)]
+        start = time.perf_counter()
+        for index in indexes:
+            chain.get_block(index)
+        print(f"\nrandom get_block: {(time.perf_counter() - start) / reads * 1e6:.1f} us")
+        print(f"log {os.path.getsize(path) / 1e6:.0f} MB, index {os.path.getsize(path + '.idx') / 1e6:.0f} MB")
+
+        receipts = chain.add_transactions([{"event": "ZKP_GENERATED", "user_id": f"user-{i}"}
+                                           for i in range(args.block_size)])
+        start = time.perf_counter()
+        proofs = [chain.inclusion_proof(r["block"], r["position"]) for r in receipts[:100]]
+        built = (time.perf_counter() - start) / len(proofs)
+        start = time.perf_counter()
+        assert all(verify_proof(p["transaction"], p["proof"], p["merkle_root"]) for p in proofs)
+        checked = (time.perf_counter() - start) / len(proofs)
+        print(f"{args.block_size}-tx block: build proof {built * 1e3:.2f} ms, "
+              f"verify {checked * 1e6:.1f} us ({len(proofs[0]['proof'])} hashes)")
+
+        start = time.perf_counter()
+        LedgerFile(path)
+        print(f"reopen from checkpoint: {(time.perf_counter() - start) * 1e3:.1f} ms")
+        os.remove(path + ".ckpt")
+        start = time.perf_counter()
+        LedgerFile(path)
+        print(f"reopen with full rescan: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark indexed ledger queries against a full scan as the ledger grows:
+one user's history, one event type, both, and a user within a time range.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_ledger_query --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from services.blockchain import BlockchainService
+from services.ledger_file import LedgerFile
+from services.ledger_index import LedgerIndex, transactions_of
+
+EVENTS = ["ID_REVOCATION", "ZKP_GENERATED", "ZKP_GENERATED", "ZKP_GENERATED", "ANOMALY_DETECTED"]
+
+
+def transaction(rng, users):
+    user = f"user-{rng.randrange(users)}"
+    event = rng.choice(EVENTS)
+    key = "user" if event == "ANOMALY_DETECTED" else "user_id"
+    return {"event": event, key: user, "timestamp": time.time()}
+
+
+def median_ms(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e3
+
+
+def scan(chain, user_id):
+    return [tx for block in chain.iter_blocks() for tx in transactions_of(block)
+            if tx.get("user_id", tx.get("user")) == user_id][-50:]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="ledger sizes in transactions")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--block-size", type=int, default=512)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    print(f"{'transactions':>13}{'user':>9}{'event':>9}{'both':>9}{'range':>9}{'scan':>11}   (median ms, 50 per page)")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ledger.log")
+        chain = BlockchainService(LedgerFile(path), LedgerIndex(os.path.join(tmp, "index.db")))
+        written = 0
+        for size in sorted(args.sizes):
+            while written < size:
+                batch = min(args.block_size, size - written)
+                chain.add_transactions([transaction(rng, args.users) for _ in range(batch)])
+                written += batch
+            midpoint = chain.get_block(len(chain) // 2)["timestamp"]
+            user = lambda: f"user-{rng.randrange(args.users)}"
+            timings = [
+                median_ms(lambda: chain.query(user_id=user()), args.runs),
+                median_ms(lambda: chain.query(event="ANOMALY_DETECTED"), args.runs),
+                median_ms(lambda: chain.query(user_id=user(), event="ID_REVOCATION"), args.runs),
+                median_ms(lambda: chain.query(user_id=user(), since=midpoint), args.runs),
+                median_ms(lambda: scan(chain, user()), 1),
+            ]
+            print(f"{size:>13}" + "".join(f"{t:>9.2f}" for t in timings[:4]) + f"{timings[4]:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark full-chain verification: a serial pass against the process pool,
+then an incremental pass that resumes from the signed checkpoint after a
+few more blocks are appended.
+
+The ledger is written straight in the LedgerFile record format (one
+single-transaction block per record, hashed exactly as BlockchainService
+would), which is much faster than appending block by block.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_ledger_verify --blocks 10000000 --workers 8
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import zlib
+
+from ledger_verify import verify_chain
+from services.blockchain import BlockchainService
+from services.ledger_blocks import hash_block
+from services.ledger_file import HEADER, OFFSET, LedgerFile
+from services.merkle import leaf_hash
+
+WRITE_EVERY = 50_000
+
+
+def build_ledger(path, blocks):
+    previous_hash = "0"
+    with open(path, "wb") as log, open(path + ".idx", "wb") as idx:
+        records, offsets, end = bytearray(), bytearray(), 0
+        for index in range(1, blocks + 1):
+            tx = {"event": "GENESIS"} if index == 1 else \
+                {"event": "ID_REVOCATION", "user_id": f"user-{index}", "risk_score": 0.0}
+            block = {"index": index, "timestamp": time.time(), "merkle_root": leaf_hash(tx).hex(),
+                     "tx_count": 1, "previous_hash": previous_hash, "hash": ""}
+            block["hash"] = previous_hash = hash_block(block)
+            block["transactions"] = [tx]
+            payload = json.dumps(block, separators=(",", ":")).encode()
+            offsets += OFFSET.pack(end)
+            records += HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+            end += HEADER.size + len(payload)
+            if index % WRITE_EVERY == 0:
+                log.write(records)
+                idx.write(offsets)
+                records.clear()
+                offsets.clear()
+        log.write(records)
+        idx.write(offsets)
+
+
+def timed(label, **kwargs):
+    result = verify_chain(**kwargs)
+    assert result["valid"], result["errors"]
+    rate = result["checked"] / result["elapsed"] if result["elapsed"] else 0
+    print(f"{label:<22}{result['checked']:>12}{result['elapsed']:>10.1f}{rate:>14.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--blocks", type=int, default=10_000_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=200_000)
+    parser.add_argument("--append", type=int, default=10_000, help="blocks appended before the incremental run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ledger.log")
+        start = time.perf_counter()
+        build_ledger(path, args.blocks)
+        print(f"built {args.blocks} blocks ({os.path.getsize(path) / 1e9:.2f} GB) "
+              f"in {time.perf_counter() - start:.0f} s\n")
+
+        print(f"{'run':<22}{'blocks':>12}{'seconds':>10}{'blocks/s':>14}")
+        common = {"path": path, "chunk_size": args.chunk_size, "key": "bench-checkpoint-key"}
+        timed("full, serial", full=True, workers=1, **common)
+        timed(f"full, {args.workers} workers", full=True, workers=args.workers, **common)
+
+        chain = BlockchainService(LedgerFile(path))
+        for i in range(args.append):
+            chain.add_transaction({"event": "ID_REVOCATION", "user_id": f"late-{i}", "risk_score": 0.0})
+        chain.ledger.flush()
+        timed("incremental", workers=args.workers, **common)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark ledger throughput under a burst of concurrent events: one block
+per event (direct add_transaction) against group commit through
+LedgerWriter, waiting on each receipt or firing and forgetting.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_ledger_writer --threads 32 --events 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from services.blockchain import BlockchainService
+from services.ledger_file import LedgerFile
+from services.ledger_writer import LedgerWriter
+
+
+def event(thread, i):
+    return {"event": "ID_REVOCATION", "user_id": f"user-{thread}-{i}", "risk_score": 0.1}
+
+
+def burst(threads, events, work):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda t: [work(event(t, i)) for i in range(events)], range(threads)))
+    return threads * events / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--events", type=int, default=2_000, help="events per thread")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--batch-delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads x {args.events} events")
+    print(f"{'mode':<18}{'events/s':>10}{'blocks':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        chain = BlockchainService(LedgerFile(os.path.join(tmp, "direct.log")))
+        rate = burst(args.threads, args.events, chain.add_transaction)
+        print(f"{'block per event':<18}{rate:>10.0f}{len(chain) - 1:>9}")
+
+        for mode in ("wait", "fire-and-forget"):
+            chain = BlockchainService(LedgerFile(os.path.join(tmp, f"{mode}.log")))
+            writer = LedgerWriter(chain, args.batch_size, args.batch_delay, queue_size=100_000)
+            futures = []
+            work = writer.commit if mode == "wait" else lambda tx: futures.append(writer.submit(tx))
+            start = time.perf_counter()
+            burst(args.threads, args.events, work)
+            for future in futures:
+                future.result()
+            rate = args.threads * args.events / (time.perf_counter() - start)
+            writer.close()
+            print(f"{mode:<18}{rate:>10.0f}{len(chain) - 1:>9}")
+
+
+if __name__ == "__main__":
+    main()
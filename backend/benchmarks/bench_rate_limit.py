@@ -0,0 +1,63 @@
+"""
+Benchmark rate limiter backends: per-check latency, and correctness when
+several processes share one key.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_rate_limit --checks 50000 --processes 4
+"""
+import argparse
+import os
+import tempfile
+import time
+from multiprocessing import Pool
+
+from services.rate_limiter import Limit, MemoryBackend, RateLimiter, SQLiteBackend
+
+
+def latency(limiter, checks, keys):
+    start = time.perf_counter()
+    for i in range(checks):
+        limiter.check("bench", f"user-{i % keys}")
+    return (time.perf_counter() - start) / checks
+
+
+def hammer(args):
+    """Worker: check one shared key as fast as possible; returns allowed count"""
+    path, limit, checks = args
+    limiter = RateLimiter(SQLiteBackend(path), {"shared": limit})
+    return sum(limiter.allow("shared", "attacker") for _ in range(checks))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checks", type=int, default=50_000)
+    parser.add_argument("--keys", type=int, default=10_000)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    limit = Limit(rate=1_000_000, period=60, burst=1_000_000)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ratelimit.db")
+        print(f"{args.checks} checks over {args.keys} keys")
+        print(f"{'backend':<10}{'us/check':>10}")
+        for name, backend in (("memory", MemoryBackend()), ("sqlite", SQLiteBackend(path))):
+            per_check = latency(RateLimiter(backend, {"bench": limit}), args.checks, args.keys)
+            print(f"{name:<10}{per_check * 1e6:>10.1f}")
+
+        # N processes sharing a 100 per hour limit must admit ~100 between them
+        shared = Limit(rate=100, period=3600, burst=100)
+        per_process = args.checks // args.processes
+        start = time.perf_counter()
+        with Pool(args.processes) as pool:
+            allowed = pool.map(hammer, [(path, shared, per_process)] * args.processes)
+        elapsed = time.perf_counter() - start
+        refill = int(elapsed * shared.rate / shared.period)
+        print(f"\n{args.processes} processes x {per_process} checks on one key, "
+              f"limit {shared.rate}/{shared.period}s burst {shared.burst}")
+        print(f"allowed per process {allowed}, total {sum(allowed)} "
+              f"(expected {shared.burst} + {refill} refilled) in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
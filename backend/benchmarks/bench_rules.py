@@ -0,0 +1,50 @@
+"""
+Benchmark the eligibility rule engine over synthetic profiles.
+
+Compares evaluating every service with one shared RuleContext per profile
+against building a fresh context per rule (the old per-rule date parsing).
+Run from the backend directory:
+
+    python -m benchmarks.bench_rules --users 20000
+"""
+import argparse
+import time
+
+from benchmarks.bench_storage import make_users
+from knowledge_base import COMPILED_RULES
+from rules import RuleContext
+
+
+def shared_context(users):
+    for user in users:
+        ctx = RuleContext(user)
+        for rules in COMPILED_RULES.values():
+            for rule in rules:
+                rule.run(ctx)
+
+
+def context_per_rule(users):
+    for user in users:
+        for rules in COMPILED_RULES.values():
+            for rule in rules:
+                rule.run(RuleContext(user))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20_000)
+    args = parser.parse_args()
+
+    users = list(make_users(args.users)["users"].values())
+    evaluations = args.users * sum(len(rules) for rules in COMPILED_RULES.values())
+    print(f"{args.users} users, {len(COMPILED_RULES)} services, {evaluations} rule evaluations")
+    print(f"{'mode':<18}{'total (s)':>12}{'us/rule':>12}")
+    for name, run in (("shared context", shared_context), ("context per rule", context_per_rule)):
+        start = time.perf_counter()
+        run(users)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<18}{elapsed:>12.3f}{elapsed / evaluations * 1e6:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark database encodings: startup load time, write time and on-disk size.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_storage --users 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from storage import FORMATS, AutoStorage
+
+
+def make_users(n):
+    """Synthetic users table shaped like data/database.json profiles"""
+    return {"users": {
+        str(i): {
+            "user_id": f"user-{i}",
+            "full_name": f"Citizen {i}",
+            "ic_number": f"{900101 + i % 9999:06d}-14-{i % 10000:04d}",
+            "date_of_birth": f"19{60 + i % 40}-0{1 + i % 9}-1{i % 10}",
+            "gender": "Male" if i % 2 else "Female",
+            "nationality": "Malaysian",
+            "phone": f"+6012{i:07d}",
+            "email": f"citizen{i}@email.com",
+            "address": f"No. {i}, Jalan Merdeka, 50480 Kuala Lumpur",
+            "passport_number": f"A{i:08d}",
+            "passport_expiry": "2028-06-15",
+            "security_level": "verified",
+            "biometric_registered": True,
+            "monthly_income": str(3000 + i % 7000),
+            "_version": 1,
+        }
+        for i in range(1, n + 1)
+    }}
+
+
+def bench(fmt, data, directory):
+    path = os.path.join(directory, f"db.{fmt}")
+    storage = AutoStorage(path, fmt=fmt)
+
+    start = time.perf_counter()
+    storage.write(data)
+    write_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    storage.read()
+    load_s = time.perf_counter() - start
+
+    storage.close()
+    return write_s, load_s, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    args = parser.parse_args()
+
+    data = make_users(args.users)
+    print(f"{args.users} users")
+    print(f"{'format':<10}{'write (s)':>12}{'load (s)':>12}{'size (MB)':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in FORMATS:
+            try:
+                write_s, load_s, size = bench(fmt, data, directory)
+            except RuntimeError as e:
+                print(f"{fmt:<10}  skipped: {e}")
+                continue
+            print(f"{fmt:<10}{write_s:>12.3f}{load_s:>12.3f}{size / 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Streaming NDJSON import/export of user profiles.
+
+Each input line is one JSON profile with a `user_id`. Lines are validated
+against USER_PROFILE_SCHEMA and written in batches of BULK_IMPORT_BATCH_SIZE;
+invalid lines are reported and skipped without aborting the import. Import
+memory is bounded by the batch size. Export streams its output, but TinyDB
+holds the whole users table in memory, so it is not constant-memory.
+
+    python bulk_io.py import profiles.ndjson
+    python bulk_io.py export profiles.ndjson
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Any, AsyncIterable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import USER_PROFILE_SCHEMA, BULK_IMPORT_BATCH_SIZE, BULK_IMPORT_MAX_ERRORS
+from database import bulk_upsert_users, iter_users, run_db
+
+SCALAR_TYPES = (str, int, float, bool, type(None))
+SCHEMA_FIELDS = {field: spec for fields in USER_PROFILE_SCHEMA.values() for field, spec in fields.items()}
+REQUIRED_FIELDS = [field for field, spec in SCHEMA_FIELDS.items() if spec["required"]]
+
+
+def validate_profile(record: Any) -> Optional[str]:
+    """Return an error message if the record does not fit the profile schema"""
+    if not isinstance(record, dict):
+        return "Line is not a JSON object"
+    user_id = record.get("user_id")
+    if not isinstance(user_id, str) or not user_id.strip():
+        return "Missing user_id"
+    missing = [f for f in REQUIRED_FIELDS if record.get(f) in (None, "")]
+    if missing:
+        return f"Missing required fields: {', '.join(missing)}"
+    for field in SCHEMA_FIELDS:
+        if field in record and not isinstance(record[field], SCALAR_TYPES):
+            return f"Field {field} must be a scalar value"
+    return None
+
+
+def import_batch(lines: List[Tuple[int, bytes]]) -> Dict[str, Any]:
+    """Validate and write one batch of (line_number, raw_line) pairs"""
+    records = []
+    errors = []
+    for line_no, raw in lines:
+        try:
+            record = json.loads(raw)
+        except ValueError as e:
+            errors.append({"line": line_no, "error": f"Invalid JSON: {e}"})
+            continue
+        error = validate_profile(record)
+        if error:
+            errors.append({"line": line_no, "error": error})
+        else:
+            records.append(record)
+    created, updated = bulk_upsert_users(records) if records else (0, 0)
+    return {"created": created, "updated": updated, "errors": errors}
+
+
+class ImportReport:
+    """Running totals for an import, with a bounded list of per-line errors"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.lines = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def add(self, batch_size: int, result: Dict[str, Any]):
+        self.lines += batch_size
+        self.created += result["created"]
+        self.updated += result["updated"]
+        self.failed += len(result["errors"])
+        room = BULK_IMPORT_MAX_ERRORS - len(self.errors)
+        if room > 0:
+            self.errors.extend(result["errors"][:room])
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "lines": self.lines,
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+            "elapsed_seconds": round(elapsed, 3),
+            "records_per_second": round(self.lines / elapsed) if elapsed else 0,
+        }
+
+
+class LineSplitter:
+    """Turn arbitrary byte chunks into numbered, non-blank NDJSON lines"""
+
+    def __init__(self):
+        self.line_no = 0
+        # Pieces of the unfinished last line, joined once its newline arrives,
+        # so a long line split over many chunks is copied only once
+        self._partial: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[Tuple[int, bytes]]:
+        if b"\n" not in chunk:
+            if chunk:
+                self._partial.append(chunk)
+            return []
+        first, *complete, tail = chunk.split(b"\n")
+        self._partial.append(first)
+        lines = []
+        for line in [b"".join(self._partial), *complete]:
+            self.line_no += 1
+            if line.strip():
+                lines.append((self.line_no, line))
+        self._partial = [tail] if tail else []
+        return lines
+
+    def finish(self) -> List[Tuple[int, bytes]]:
+        rest, self._partial = b"".join(self._partial), []
+        return [(self.line_no + 1, rest)] if rest.strip() else []
+
+
+def import_ndjson(chunks: Iterable[bytes], batch_size: int = BULK_IMPORT_BATCH_SIZE) -> Dict[str, Any]:
+    """Import an NDJSON byte stream in batches"""
+    report = ImportReport()
+    splitter = LineSplitter()
+    batch = []
+    for chunk in chunks:
+        batch.extend(splitter.feed(chunk))
+        if len(batch) >= batch_size:
+            report.add(len(batch), import_batch(batch))
+            batch = []
+    batch.extend(splitter.finish())
+    if batch:
+        report.add(len(batch), import_batch(batch))
+    return report.to_dict()
+
+
+async def import_ndjson_async(chunks: AsyncIterable[bytes],
+                              batch_size: int = BULK_IMPORT_BATCH_SIZE) -> Dict[str, Any]:
+    """Import an NDJSON request stream; batches are written on the database executor"""
+    report = ImportReport()
+    splitter = LineSplitter()
+    batch = []
+    async for chunk in chunks:
+        batch.extend(splitter.feed(chunk))
+        if len(batch) >= batch_size:
+            report.add(len(batch), await run_db(import_batch, batch))
+            batch = []
+    batch.extend(splitter.finish())
+    if batch:
+        report.add(len(batch), await run_db(import_batch, batch))
+    return report.to_dict()
+
+
+def export_ndjson() -> Iterator[bytes]:
+    """Yield every profile as one NDJSON line (the users table itself is read whole)"""
+    for user in iter_users():
+        yield json.dumps(user).encode("utf-8") + b"\n"
+
+
+def _read_chunks(fh, size: int = 1 << 20) -> Iterator[bytes]:
+    while True:
+        chunk = fh.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import/export user profiles as NDJSON")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path", help="NDJSON file to read from or write to ('-' for stdin/stdout)")
+    parser.add_argument("--batch-size", type=int, default=BULK_IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        fh = sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+        with fh:
+            result = import_ndjson(_read_chunks(fh), args.batch_size)
+        print(json.dumps(result, indent=2), file=sys.stderr)
+    else:
+        fh = sys.stdout.buffer if args.path == "-" else open(args.path, "wb")
+        started = time.perf_counter()
+        count = 0
+        with fh:
+            for line in export_ndjson():
+                fh.write(line)
+                count += 1
+        elapsed = time.perf_counter() - started
+        print(f"Exported {count} profiles in {elapsed:.2f}s "
+              f"({count / elapsed if elapsed else 0:.0f} records/s)", file=sys.stderr)
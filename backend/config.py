@@ -1,6 +1,7 @@
 """
 Configuration settings and schema definitions for the Digital ID API.
 """
+import json
 import os
 from dotenv import load_dotenv
 
@@ -126,3 +127,134 @@ SERVICE_VALIDATION_REQUIREMENTS = {
         "description": "Tax Filing"
     }
 }
+
+# On-disk encoding for data/database.json: "json" (indented), "orjson" or
+# "msgpack". Existing files are read in whatever format they were written in.
+DB_FORMAT = os.getenv("DB_FORMAT", "json")
+
+# Profile change log - field-level edits are kept in the state store (shared
+# by every worker) and folded into the users table once this many entries
+# have accumulated.
+PROFILE_LOG_COMPACT_EVERY = int(os.getenv("PROFILE_LOG_COMPACT_EVERY", "500"))
+
+# Shared SQLite store for tasks, chat history and uploaded documents, so
+# several uvicorn workers see the same state and it survives restarts
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "data/state.db")
+
+# Expiry for shared state, in seconds. Tasks are keyed by status; statuses
+# not listed here never expire. Documents and task events are dropped once
+# their task is gone.
+TASK_TTLS = {
+    "completed": int(os.getenv("TASK_TTL_COMPLETED", str(7 * 24 * 3600))),
+    "cancelled": int(os.getenv("TASK_TTL_CANCELLED", str(24 * 3600))),
+    "in_progress": int(os.getenv("TASK_TTL_IN_PROGRESS", str(90 * 24 * 3600))),
+    "deleted": int(os.getenv("TASK_TTL_DELETED", str(24 * 3600))),
+}
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", str(30 * 24 * 3600)))
+ACCESS_LOG_IDLE_TTL = int(os.getenv("ACCESS_LOG_IDLE_TTL", "3600"))
+
+# Background sweeper: how often it runs, rows deleted per slice, and the most
+# time one sweep may take before it yields until the next run
+SWEEP_INTERVAL_SECONDS = float(os.getenv("SWEEP_INTERVAL_SECONDS", "60"))
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "500"))
+SWEEP_MAX_SECONDS = float(os.getenv("SWEEP_MAX_SECONDS", "1.0"))
+
+# Bulk NDJSON import - profiles written per batch, and how many per-line
+# errors are returned in detail (all failures are still counted)
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "5000"))
+BULK_IMPORT_MAX_ERRORS = int(os.getenv("BULK_IMPORT_MAX_ERRORS", "1000"))
+
+# Push updates (GET /events) - events buffered per connection before the
+# oldest are dropped, and the idle interval between SSE keep-alive comments
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "100"))
+EVENT_KEEPALIVE_SECONDS = float(os.getenv("EVENT_KEEPALIVE_SECONDS", "15"))
+
+# Batch eligibility - profiles per columnar chunk, and worker processes used
+# once a dataset spans more than one chunk (0 = one per CPU)
+BATCH_ELIGIBILITY_CHUNK_SIZE = int(os.getenv("BATCH_ELIGIBILITY_CHUNK_SIZE", "50000"))
+BATCH_ELIGIBILITY_WORKERS = int(os.getenv("BATCH_ELIGIBILITY_WORKERS", "0"))
+
+# Memoized verification/validation results kept in memory (LRU)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "10000"))
+
+# Audit ledger - append-only block log (plus .idx offset index and .ckpt
+# recovery checkpoint), fsynced at most every LEDGER_FSYNC_INTERVAL seconds
+LEDGER_PATH = os.getenv("LEDGER_PATH", "data/ledger.log")
+LEDGER_FSYNC_INTERVAL = float(os.getenv("LEDGER_FSYNC_INTERVAL", "1.0"))
+
+# Secondary indexes over the ledger (transactions by user and event type),
+# kept in SQLite and filled in from the log on startup if behind
+LEDGER_INDEX_PATH = os.getenv("LEDGER_INDEX_PATH", "data/ledger_index.db")
+
+# Full-chain verification (ledger_verify.py, POST /admin/ledger/verify) -
+# blocks per range handed to a worker process (0 workers = one per CPU), and
+# the HMAC key signing the LEDGER_PATH.verified checkpoint that lets later
+# runs check only blocks appended since. Without a key every run is full.
+LEDGER_VERIFY_CHUNK_SIZE = int(os.getenv("LEDGER_VERIFY_CHUNK_SIZE", "200000"))
+LEDGER_VERIFY_WORKERS = int(os.getenv("LEDGER_VERIFY_WORKERS", "0"))
+LEDGER_CHECKPOINT_KEY = os.getenv("LEDGER_CHECKPOINT_KEY") or None
+
+# Ledger group commit - a block is sealed at LEDGER_BATCH_SIZE transactions or
+# LEDGER_BATCH_DELAY seconds after the first queued one; submitters wait once
+# LEDGER_QUEUE_SIZE transactions are pending. With a delay of 0 a block takes
+# whatever is queued, so events arriving during one write form the next block.
+LEDGER_BATCH_SIZE = int(os.getenv("LEDGER_BATCH_SIZE", "512"))
+LEDGER_BATCH_DELAY = float(os.getenv("LEDGER_BATCH_DELAY", "0"))
+LEDGER_QUEUE_SIZE = int(os.getenv("LEDGER_QUEUE_SIZE", "10000"))
+
+# Shared rate limits (GCRA). Backend is "sqlite" (shared by every worker on
+# this host), "redis" (RATE_LIMIT_REDIS_URL) or "memory" (per process).
+# Limits are (requests, per seconds, burst); "anomaly" feeds the frequency
+# check in the anomaly detector.
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite")
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "data/ratelimit.db")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+# Checks run on the event loop, so the sqlite backend waits at most this many
+# seconds for a locked database before the request is refused with 503
+RATE_LIMIT_BUSY_TIMEOUT = float(os.getenv("RATE_LIMIT_BUSY_TIMEOUT", "0.05"))
+RATE_LIMITS = {
+    "user": (120, 60, 30),
+    "ip": (300, 60, 60),
+    "anomaly": (10, 60, 10),
+}
+
+# Request signing - requests under SIGNED_ROUTE_PREFIXES must carry
+# X-Timestamp (ms since the epoch) and X-Signature, the hex HMAC-SHA256 of
+# "METHOD\nPATH[?QUERY]\nTIMESTAMP\nSHA256(BODY)" under any of
+# REQUEST_SIGNING_SECRETS (comma-separated, so keys can be rotated). There
+# is no default: the server refuses to start without at least one.
+# Timestamps more than SIGNATURE_MAX_SKEW seconds off are refused and each
+# signature is accepted once; up to SIGNATURE_REPLAY_CACHE_SIZE are kept.
+# Bodies are buffered in memory up to SIGNATURE_SPOOL_BYTES, then on disk;
+# one larger than SIGNATURE_MAX_BODY_BYTES is refused with 413 (bulk imports
+# above it must be split).
+REQUEST_SIGNING_SECRETS = [s for s in os.getenv("REQUEST_SIGNING_SECRETS", "").split(",") if s]
+SIGNED_ROUTE_PREFIXES = ("/security", "/user", "/admin")
+SIGNATURE_MAX_SKEW = float(os.getenv("SIGNATURE_MAX_SKEW", "300"))
+SIGNATURE_REPLAY_CACHE_SIZE = int(os.getenv("SIGNATURE_REPLAY_CACHE_SIZE", "200000"))
+SIGNATURE_SPOOL_BYTES = int(os.getenv("SIGNATURE_SPOOL_BYTES", str(1024 * 1024)))
+SIGNATURE_MAX_BODY_BYTES = int(os.getenv("SIGNATURE_MAX_BODY_BYTES", str(64 * 1024 * 1024)))
+
+# Per-route guard policies, matched by longest path prefix ("/" is the
+# default). "limits" are RATE_LIMITS names ("user" is keyed by the user_id
+# query parameter and skipped when there is none, "ip" by client address).
+# "anomaly" runs the anomaly detector (bot screening, 10/min per user) with
+# that event type, so it is kept to routes that change state; flagged
+# requests are rejected unless "anomaly_action" is "flag", in which case the
+# handler sees the result. On SIGNED_ROUTE_PREFIXES only "ip" is checked
+# before the signature; the rest applies once it is verified.
+# ROUTE_POLICIES_FILE replaces the table with a JSON object of the same shape.
+ROUTE_POLICIES = {
+    "/": {"limits": ["ip", "user"]},
+    "/docs": {}, "/redoc": {}, "/openapi.json": {}, "/health": {},
+    "/events": {"limits": ["ip"]},
+    "/admin": {"limits": ["ip"]},
+    "/user/bulk": {"limits": ["ip"]},
+    "/security": {"limits": ["ip", "user"]},
+    "/security/generate_proof": {"limits": ["ip", "user"], "anomaly": "security"},
+    "/security/restore": {"limits": ["ip", "user"], "anomaly": "security"},
+    "/security/revoke": {"limits": ["ip", "user"], "anomaly": "revoke", "anomaly_action": "flag"},
+}
+if os.getenv("ROUTE_POLICIES_FILE"):
+    with open(os.getenv("ROUTE_POLICIES_FILE"), encoding="utf-8") as fh:
+        ROUTE_POLICIES = json.load(fh)
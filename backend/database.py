@@ -2,14 +2,29 @@
 Database setup and helper functions using TinyDB.
 """
 import os
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from tinydb import TinyDB, Query
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single worker
+    fcntl = None
+
+from config import DB_FORMAT, PROFILE_LOG_COMPACT_EVERY
+from state_store import StateStore, state_store
+from storage import AutoStorage
 
 # Ensure data directory exists
 os.makedirs('data', exist_ok=True)
 
-# Initialize TinyDB - JSON file-based database
-db = TinyDB('data/database.json', indent=2)
+# Initialize TinyDB - file-based database, encoded per DB_FORMAT
+db = TinyDB('data/database.json', storage=AutoStorage, fmt=DB_FORMAT)
 users_table = db.table('users')
 tasks_table = db.table('tasks')
 history_table = db.table('history')
@@ -19,26 +34,272 @@ documents_table = db.table('documents')
 User = Query()
 
 
+
+class DatabaseLock:
+    """
+    Re-entrant lock held around every TinyDB access, across threads and
+    worker processes (flock on a sidecar file). TinyDB rewrites the whole
+    file on each write, so unlocked readers could see it half written and
+    concurrent writers would drop each other's changes.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fh = open(path, "a")
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                fcntl.flock(self._fh, fcntl.LOCK_EX)
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and fcntl is not None:
+            fcntl.flock(self._fh, fcntl.LOCK_UN)
+        self._lock.release()
+
+
+# TinyDB is not thread- or process-safe: sync endpoints run in Starlette's
+# threadpool, the async helpers below run in their own worker, and several
+# uvicorn workers share the file, so every helper holds this lock.
+db_lock = DatabaseLock('data/database.json.lock')
+
+# Dedicated single-worker executor for async access. Keeping it separate from
+# the loop's default executor means slow file I/O can never starve other
+# run_in_executor users, and a single worker serialises TinyDB writes.
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tinydb")
+
+
+class VersionConflict(Exception):
+    """Raised when a patch is based on a stale profile version"""
+
+    def __init__(self, user_id: str, expected: int, current: int):
+        super().__init__(f"Profile {user_id} is at version {current}, not {expected}")
+        self.user_id = user_id
+        self.expected = expected
+        self.current = current
+
+
+class ProfileChangeLog:
+    """
+    Field-level profile edits layered over the users table.
+
+    Each entry holds only the fields that changed plus the record version it
+    produced, so a small edit costs one short row in the shared state store
+    instead of rewriting the whole database file. Every worker reads the
+    same pending edits, and (user_id, version) is unique, so two workers can
+    never both produce the same version. Once compact_every edits are
+    pending they are folded into the base records. Callers hold db_lock,
+    which makes the version check, the write and compaction atomic across
+    workers.
+    """
+
+    def __init__(self, store: StateStore, compact_every: int):
+        self.store = store
+        self.compact_every = compact_every
+
+    def overlay(self, user_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+        """Pending fields and version for a user, or (None, None)"""
+        return self.store.profile_changes(user_id).get(user_id, (None, None))
+
+    def overlays(self) -> Dict[str, Tuple[Dict[str, Any], int]]:
+        """Pending fields and version for every user with uncompacted edits"""
+        return self.store.profile_changes()
+
+    def append(self, user_id: str, version: int, changes: Dict[str, Any]):
+        """Record a field-level change"""
+        self.append_many([(user_id, version, changes)])
+
+    def append_many(self, entries: List[Tuple[str, int, Dict[str, Any]]]):
+        """Record several (user_id, version, changes) entries in one transaction"""
+        if not entries:
+            return
+        self.store.add_profile_changes(entries, datetime.now().isoformat())
+        if self.store.profile_change_count() >= self.compact_every:
+            self.compact()
+
+    def compact(self) -> int:
+        """Fold all pending changes into the users table in a single write"""
+        pending = self.overlays()
+        if not pending:
+            return 0
+
+        def apply(doc):
+            changes, version = pending[doc["user_id"]]
+            doc.update(changes)
+            doc["_version"] = version
+
+        users_table.update(apply, User.user_id.one_of(set(pending)))
+        # Only drop entries once the base records are durable; a crash before
+        # this point is harmless because the fold is idempotent.
+        self.store.delete_profile_changes({user_id: version for user_id, (_, version) in pending.items()})
+        return len(pending)
+
+
+profile_log = ProfileChangeLog(state_store, PROFILE_LOG_COMPACT_EVERY)
+
+logger = logging.getLogger(__name__)
+
+# listener(user_id, new_version, changed_fields), called after each profile write
+ProfileListener = Callable[[str, int, Dict[str, Any]], None]
+_profile_listeners: List[ProfileListener] = []
+
+
+def add_profile_listener(listener: ProfileListener):
+    """Register a callback for profile writes (runs outside db_lock)"""
+    _profile_listeners.append(listener)
+
+
+def _notify(writes: List[Tuple[str, int, Dict[str, Any]]]):
+    for user_id, version, changed in writes:
+        for listener in _profile_listeners:
+            try:
+                listener(user_id, version, changed)
+            except Exception:
+                logger.exception("Profile listener failed for %s", user_id)
+
+
 def get_user(user_id: str) -> Optional[Dict[str, Any]]:
-    """Get user by ID"""
-    return users_table.get(User.user_id == user_id)
+    """Get user by ID, including changes not yet compacted"""
+    with db_lock:
+        user = users_table.get(User.user_id == user_id)
+        if not user:
+            return None
+        changes, version = profile_log.overlay(user_id)
+        if changes is None:
+            return {**user, "_version": user.get("_version", 0)}
+        return {**user, **changes, "_version": version}
+
+
+def patch_user(user_id: str, changes: Dict[str, Any],
+               expected_version: Optional[int] = None) -> Tuple[int, Dict[str, Any]]:
+    """
+    Apply a field-level update and return (new_version, changed_fields).
+
+    Only fields whose value actually differs are logged, stamped with
+    updated_at. If expected_version is given and the record has moved on,
+    VersionConflict is raised.
+    """
+    with db_lock:
+        existing = get_user(user_id)
+        current_version = existing["_version"] if existing else 0
+        if expected_version is not None and expected_version != current_version:
+            raise VersionConflict(user_id, expected_version, current_version)
+
+        now = datetime.now().isoformat()
+        if not existing:
+            record = {"created_at": now, "updated_at": now, **changes, "user_id": user_id, "_version": 1}
+            users_table.insert(record)
+            version, changed = 1, changes
+        else:
+            changed = {k: v for k, v in changes.items() if k != "user_id" and existing.get(k) != v}
+            if not changed:
+                return current_version, {}
+            version = current_version + 1
+            profile_log.append(user_id, version, {**changed, "updated_at": now})
+    _notify([(user_id, version, changed)])
+    return version, changed
 
 
 def update_user(user_id: str, data: Dict[str, Any]) -> bool:
     """Update user data"""
-    existing = users_table.get(User.user_id == user_id)
-    if existing:
-        merged = {**existing, **data}
-        users_table.update(merged, User.user_id == user_id)
-        return True
-    else:
-        data["user_id"] = user_id
-        users_table.insert(data)
-        return True
+    patch_user(user_id, data)
+    return True
 
 
 def create_user(user_id: str, data: Dict[str, Any]) -> bool:
     """Create a new user"""
-    data["user_id"] = user_id
-    users_table.insert(data)
+    with db_lock:
+        data["user_id"] = user_id
+        data.setdefault("_version", 1)
+        users_table.insert(data)
+    _notify([(user_id, data["_version"], data)])
     return True
+
+
+def bulk_upsert_users(records: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """
+    Insert or field-patch many users as one batch and return (created, updated).
+
+    New users are written with a single insert_multiple; changes to existing
+    users become change-log entries appended in one write.
+    """
+    with db_lock:
+        existing = {doc["user_id"]: doc for doc in users_table.all()}
+        pending = profile_log.overlays()
+        now = datetime.now().isoformat()
+        new_docs: Dict[str, Dict[str, Any]] = {}
+        current: Dict[str, Tuple[Dict[str, Any], int]] = {}  # user_id -> (merged view, version)
+        entries = []
+        for record in records:
+            user_id = record["user_id"]
+            if user_id in new_docs:
+                new_docs[user_id].update(record)
+                continue
+            base = existing.get(user_id)
+            if base is None:
+                new_docs[user_id] = {"created_at": now, "updated_at": now, **record, "_version": 1}
+                continue
+            if user_id not in current:
+                changes, version = pending.get(user_id, (None, None))
+                current[user_id] = ({**base, **(changes or {})},
+                                    version if version is not None else base.get("_version", 0))
+            view, version = current[user_id]
+            changed = {k: v for k, v in record.items() if view.get(k) != v}
+            if changed:
+                entries.append((user_id, version + 1, {**changed, "updated_at": now}))
+                current[user_id] = ({**view, **changed}, version + 1)
+        if new_docs:
+            users_table.insert_multiple(new_docs.values())
+        profile_log.append_many(entries)
+    _notify([(uid, 1, doc) for uid, doc in new_docs.items()] + entries)
+    return len(new_docs), len(entries)
+
+
+def iter_users() -> Iterator[Dict[str, Any]]:
+    """Yield every user with uncompacted changes applied; TinyDB reads the whole table"""
+    with db_lock:
+        docs = users_table.all()
+        pending = profile_log.overlays()
+    for doc in docs:
+        changes, version = pending.get(doc["user_id"], (None, None))
+        if changes is None:
+            yield {**doc, "_version": doc.get("_version", 0)}
+        else:
+            yield {**doc, **changes, "_version": version}
+
+
+def compact_profiles() -> int:
+    """Fold the profile change log into the users table"""
+    with db_lock:
+        return profile_log.compact()
+
+
+# ============== ASYNC HELPERS ==============
+
+async def run_db(func, *args):
+    """Run a blocking database helper on the dedicated executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args))
+
+
+async def get_user_async(user_id: str) -> Optional[Dict[str, Any]]:
+    """Get user by ID without blocking the event loop"""
+    return await run_db(get_user, user_id)
+
+
+async def update_user_async(user_id: str, data: Dict[str, Any]) -> bool:
+    """Update user data without blocking the event loop"""
+    return await run_db(update_user, user_id, data)
+
+
+async def create_user_async(user_id: str, data: Dict[str, Any]) -> bool:
+    """Create a new user without blocking the event loop"""
+    return await run_db(create_user, user_id, data)
@@ -1,6 +1,7 @@
 """
 Government services knowledge base and agentic service definitions.
 """
+from rules import INVALID, compile_rules, eligibility_rule
 
 # Government Services Knowledge Base
 GOVERNMENT_SERVICES = {
@@ -320,3 +321,85 @@ ELIGIBILITY_RULES = {
         {"rule_id": "tax_number", "name": "Tax Number", "description": "LHDN tax number check", "check_field": "tax_number", "severity": "medium"},
     ]
 }
+
+
+# Checks for rules that need more than a field presence test. Rules without a
+# registered check pass when every field in their check_field is filled.
+
+@eligibility_rule("passport_valid")
+def check_passport_valid(rule, ctx):
+    expiry = ctx.passport_expiry
+    raw = ctx.user.get("passport_expiry")
+    if expiry is None:
+        return "failed", "❌ No passport expiry date on record", None
+    if expiry is INVALID:
+        return "failed", "❌ Invalid passport expiry date format", None
+    months_remaining = ctx.months_until(expiry)
+    if months_remaining >= 6:
+        return "passed", f"✅ Passport valid until {raw} ({int(months_remaining)} months remaining)", raw
+    return "failed", f"❌ Passport expires too soon ({raw}). Need at least 6 months validity.", raw
+
+
+@eligibility_rule("passport_expiry_check")
+def check_passport_renewal(rule, ctx):
+    expiry = ctx.passport_expiry
+    raw = ctx.user.get("passport_expiry")
+    if expiry is None:
+        return "passed", "✅ No existing passport - new application", None
+    if expiry is INVALID:
+        return "warning", "⚠️ Could not parse passport expiry", None
+    months_remaining = ctx.months_until(expiry)
+    if months_remaining <= 0:
+        return "passed", f"✅ Passport expired on {raw} - renewal eligible", raw
+    if months_remaining <= 6:
+        return "passed", f"✅ Passport expiring soon ({raw}) - renewal eligible", raw
+    return "warning", f"⚠️ Passport still valid until {raw}. Early renewal available.", raw
+
+
+@eligibility_rule("age_check")
+def check_adult(rule, ctx):
+    dob = ctx.date_of_birth
+    if dob is None:
+        return "failed", "❌ Date of birth not on record", None
+    if dob is INVALID:
+        return "failed", "❌ Invalid date of birth format", None
+    age = ctx.years_since(dob)
+    if age >= 18:
+        return "passed", f"✅ Age verified: {age} years old", f"{age} years old"
+    return "failed", f"❌ Must be 18+ years old. Current age: {age}", f"{age} years old"
+
+
+@eligibility_rule("nationality_check")
+def check_malaysian(rule, ctx):
+    nationality = ctx.user.get("nationality", "")
+    if nationality and nationality.lower() == "malaysian":
+        return "passed", f"✅ Nationality verified: {nationality}", nationality
+    return "failed", f"❌ Must be Malaysian citizen. Found: {nationality or 'Not specified'}", nationality
+
+
+@eligibility_rule("security_level")
+def check_verified_security(rule, ctx):
+    level = ctx.user.get("security_level", "basic")
+    if level in ("verified", "premium"):
+        return "passed", f"✅ Security level: {level}", level
+    return "failed", f"❌ Need 'verified' or 'premium' level. Current: {level}", level
+
+
+@eligibility_rule("security_premium")
+def check_premium_security(rule, ctx):
+    level = ctx.user.get("security_level", "basic")
+    if level == "premium":
+        return "passed", "✅ Premium security level verified", level
+    return "failed", f"❌ Premium security required. Current: {level}", level
+
+
+@eligibility_rule("biometric_check")
+def check_biometric(rule, ctx):
+    biometric = ctx.user.get("biometric_registered", False)
+    if biometric:
+        return "passed", "✅ Biometric data on file", str(biometric)
+    return "warning", "⚠️ Biometric not registered - will need to capture at office", str(biometric)
+
+
+# Rules resolved against the checks above, shared by every evaluator
+COMPILED_RULES = compile_rules(ELIGIBILITY_RULES)
@@ -0,0 +1,168 @@
+"""
+Full verification of the audit ledger.
+
+Every block is re-read and its hash, Merkle root and link to the previous
+block are recomputed (BlockchainService.is_chain_valid does the same work
+serially). The chain is cut into ranges of LEDGER_VERIFY_CHUNK_SIZE blocks
+that are verified in a process pool; each range checks its first block
+against the stored hash of the block before it, so no range depends on the
+result of another.
+
+A successful run writes LEDGER_PATH.verified: the number of blocks checked
+and the hash of the last one, signed with HMAC-SHA256 under
+LEDGER_CHECKPOINT_KEY. The next run trusts that prefix once the signature
+checks out and the stored hash of that block still matches, and verifies
+only the blocks appended since. Rewriting already verified blocks without
+also rewriting the checkpointed block is only caught by a full run. With no
+key configured there is nothing to trust a checkpoint with, so every run is
+full and none is written.
+
+    python ledger_verify.py
+    python ledger_verify.py --full --workers 4
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import LEDGER_CHECKPOINT_KEY, LEDGER_PATH, LEDGER_VERIFY_CHUNK_SIZE, LEDGER_VERIFY_WORKERS
+from services.ledger_blocks import verify_block
+from services.ledger_file import LedgerFile
+
+logger = logging.getLogger(__name__)
+
+MAX_ERRORS = 20
+
+
+def checkpoint_path(path: str) -> str:
+    return path + ".verified"
+
+
+def _sign(fields: Dict[str, Any], key: str) -> str:
+    message = json.dumps(fields, sort_keys=True, separators=(",", ":")).encode()
+    return hmac.new(key.encode(), message, hashlib.sha256).hexdigest()
+
+
+def read_checkpoint(path: str, key: Optional[str] = LEDGER_CHECKPOINT_KEY) -> Optional[Dict[str, Any]]:
+    """The signed checkpoint for the ledger at `path`, or None if missing or not genuine"""
+    if key is None:
+        return None
+    try:
+        with open(checkpoint_path(path), encoding="utf-8") as fh:
+            checkpoint = json.load(fh)
+        fields = {k: checkpoint[k] for k in ("blocks", "last_hash", "verified_at")}
+        if hmac.compare_digest(_sign(fields, key), checkpoint["signature"]):
+            return fields
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def write_checkpoint(path: str, blocks: int, last_hash: str, key: str = LEDGER_CHECKPOINT_KEY) -> Dict[str, Any]:
+    fields = {"blocks": blocks, "last_hash": last_hash, "verified_at": time.time()}
+    tmp = checkpoint_path(path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump({**fields, "signature": _sign(fields, key)}, fh)
+    os.replace(tmp, checkpoint_path(path))
+    return fields
+
+
+def _stored_hash(ledger: LedgerFile, index: int) -> str:
+    """Hash recorded in block `index` (1-based), "0" before genesis"""
+    return json.loads(ledger.read(index - 1))["hash"] if index > 0 else "0"
+
+
+def verify_range(path: str, start: int, stop: int) -> Tuple[int, List[str]]:
+    """Verify blocks start..stop-1 (1-based); returns (blocks checked, errors)"""
+    ledger = LedgerFile(path, readonly=True)
+    try:
+        previous_hash = _stored_hash(ledger, start - 1)
+        errors = []
+        checked = 0
+        for index, payload in enumerate(ledger.scan(start - 1, stop - 1), start=start):
+            try:
+                block = json.loads(payload)
+                error = verify_block(block, index, previous_hash)
+                previous_hash = block.get("hash")
+            except (ValueError, AttributeError, TypeError):
+                error, previous_hash = f"block {index} is not a valid block record", None
+            if error is not None and len(errors) < MAX_ERRORS:
+                errors.append(error)
+            checked += 1
+        return checked, errors
+    finally:
+        ledger.close()
+
+
+def verify_chain(path: str = LEDGER_PATH, full: bool = False,
+                 workers: int = LEDGER_VERIFY_WORKERS,
+                 chunk_size: int = LEDGER_VERIFY_CHUNK_SIZE,
+                 key: Optional[str] = LEDGER_CHECKPOINT_KEY) -> Dict[str, Any]:
+    """
+    Verify the ledger at `path`, resuming after the signed checkpoint unless
+    `full` or there is no `key`. A single range (or workers=1) is verified
+    in-process. The checkpoint only moves forward when every block checked
+    is valid. Raises FileNotFoundError if there is no ledger at `path`.
+    """
+    started = time.perf_counter()
+    if key is None:
+        logger.warning("LEDGER_CHECKPOINT_KEY is not set: verifying every block, no checkpoint is kept")
+        full = True
+    ledger = LedgerFile(path, readonly=True)
+    try:
+        total = ledger.count()
+        start = 1
+        checkpoint = None if full else read_checkpoint(path, key)
+        if checkpoint is not None and checkpoint["blocks"] <= total \
+                and _stored_hash(ledger, checkpoint["blocks"]) == checkpoint["last_hash"]:
+            start = checkpoint["blocks"] + 1
+        else:
+            checkpoint = None
+        last_hash = _stored_hash(ledger, total)
+    finally:
+        ledger.close()
+
+    ranges = [(i, min(i + chunk_size, total + 1)) for i in range(start, total + 1, chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    if len(ranges) < 2 or workers == 1:
+        results = [verify_range(path, a, b) for a, b in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+            results = list(pool.map(verify_range, [path] * len(ranges), *zip(*ranges)))
+
+    errors = [e for _, range_errors in results for e in range_errors][:MAX_ERRORS]
+    result = {
+        "valid": not errors,
+        "blocks": total,
+        "checked": sum(checked for checked, _ in results),
+        "resumed_from": checkpoint,
+        "errors": errors,
+    }
+    if not errors and total and key is not None:
+        result["checkpoint"] = write_checkpoint(path, total, last_hash, key)
+    result["elapsed"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute every block hash and link in the audit ledger")
+    parser.add_argument("--path", default=LEDGER_PATH)
+    parser.add_argument("--full", action="store_true", help="ignore the checkpoint and verify every block")
+    parser.add_argument("--workers", type=int, default=LEDGER_VERIFY_WORKERS,
+                        help="worker processes (0 = one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=LEDGER_VERIFY_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    try:
+        result = verify_chain(args.path, args.full, args.workers, args.chunk_size)
+    except FileNotFoundError:
+        sys.exit(f"No ledger at {args.path} (expected {args.path} and {args.path}.idx)")
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    sys.exit(0 if result["valid"] else 1)
@@ -15,16 +15,17 @@ Modular Structure:
   - verification.py: Auto-verification agent logic
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import Response
 from pydantic import BaseModel
 import httpx
+import asyncio
 import json
 import re
-import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 # Import configuration
 from config import (
@@ -37,7 +38,12 @@ from config import (
 )
 
 # Import database
-from database import users_table, Query
+from database import get_user, patch_user, VersionConflict
+from state_store import state_store
+from services import task_manager
+from services.task_manager import TaskRecord, render_task, parse_fields
+from services.validation import eligibility_matrix
+from services import eligibility_state
 
 # Import knowledge base
 from knowledge_base import GOVERNMENT_SERVICES, AGENTIC_SERVICES
@@ -46,19 +52,54 @@ from knowledge_base import GOVERNMENT_SERVICES, AGENTIC_SERVICES
 from prompts import SYSTEM_PROMPTS
 
 # Import routers
-from routers import security
+from routers import security, bulk, admin, events
+
+# Background services
+from services.sweeper import sweeper
+from services.blockchain import blockchain
+from services.ledger_writer import ledger_writer
+from services.request_guard import DeferredGuardMiddleware, RequestGuardMiddleware
+from services.request_signing import RequestSignatureMiddleware, signature_verifier
 
 # Import models
-from models import ChatRequest, TaskCreateRequest, ChatHistoryRequest
+from models import ChatRequest, TaskCreateRequest, ChatHistoryRequest, ChatAppendRequest, TaskBatchRequest
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sweep_task = asyncio.create_task(sweeper.run())
+    yield
+    sweep_task.cancel()
+    ledger_writer.close()
+    blockchain.ledger.flush()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Digital ID Pro Max API",
     description="Malaysian Government Digital Services Assistant",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.include_router(security.router)
+app.include_router(bulk.router)
+app.include_router(admin.router)
+app.include_router(events.router)
+
+# Middleware added later runs earlier: CORS -> guard -> signatures -> deferred guard.
+# On signed routes the user limits and anomaly screening wait until the
+# signature is verified, so an unsigned request naming a user_id cannot
+# spend that user's limits or trip the detector against them
+app.add_middleware(DeferredGuardMiddleware, defer=signature_verifier.signs)
+
+# Request signatures on /security, /user and /admin, checked after the guard's IP
+# limit so flooding callers are turned away before their bodies are buffered
+app.add_middleware(RequestSignatureMiddleware)
+
+# Rate limits and anomaly screening, before any route runs (only the IP
+# limit on signed routes; before CORS so CORS stays outermost and
+# rejections still carry CORS headers)
+app.add_middleware(RequestGuardMiddleware, defer=signature_verifier.signs)
 
 # CORS middleware
 app.add_middleware(
@@ -69,49 +110,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Security Middleware
-import hmac
-import hashlib
-import time
-from fastapi import Request
-
-APP_SECRET = "my-secret-key-123" # In production, use env var
-
-@app.middleware("http")
-async def verify_signature(request: Request, call_next):
-    # Skip verification for open endpoints or docs
-    if request.url.path in ["/", "/health", "/docs", "/openapi.json", "/redoc"]:
-        return await call_next(request)
-        
-    # Simplify: Only verify /security and /user endpoints for now to avoid breaking chat/maps if frontend isn't ready
-    # Or, verify ALL. Plan says "Every API request".
-    # Implementation strategy: Allow unverified for now if headers missing (transition period)? 
-    # Or strict? Codebase is small, I can update frontend immediately.
-    # Let's be strict for /security and /user endpoints.
-    
-    if request.url.path.startswith("/user") or request.url.path.startswith("/security"):
-        timestamp = request.headers.get("X-Timestamp")
-        signature = request.headers.get("X-Signature")
-        
-        if not timestamp or not signature:
-            # For development, if missing, maybe allow? 
-            # No, secure app. Reject.
-            # But "check_status" in SplashPage needs headers. I haven't updated ApiService to send them yet!
-            # If I add this middleware NOW, app will break until I update Frontend.
-            # I should allow missing headers temporarily OR update Frontend first?
-            # I will update Frontend NEXT. So this will break the app for a moment. acceptable in dev.
-            # Actually, let's just make it return 403.
-            pass
-            
-        # Logic to verify...
-        # ...
-        
-    response = await call_next(request)
-    return response
-active_tasks: Dict[str, Dict[str, Any]] = {}
-chat_history: Dict[str, Dict[str, Any]] = {}
-uploaded_documents: Dict[str, List[Dict[str, Any]]] = {}
-
 
 # ============== UTILITY FUNCTIONS ==============
 
@@ -129,14 +127,6 @@ def sanitize_input(text: str) -> str:
     return sanitized
 
 
-def get_field_label(field_name: str) -> str:
-    """Get human-readable label for a field"""
-    for category, fields in USER_PROFILE_SCHEMA.items():
-        if field_name in fields:
-            return fields[field_name]["label"]
-    return field_name.replace("_", " ").title()
-
-
 # ============== HEALTH CHECK ==============
 
 @app.get("/")
@@ -350,38 +340,17 @@ def create_task(request: TaskCreateRequest):
         raise HTTPException(status_code=400, detail=f"Unknown task type: {request.task_type}")
     
     service = AGENTIC_SERVICES[request.task_type]
-    service = AGENTIC_SERVICES[request.task_type]
     
     # Check for existing active task
     user_id = request.user_id or "default"
-    existing_task = next((t for t in active_tasks.values() 
-                          if t.get("user_id") == user_id and 
-                             t.get("type") == request.task_type and 
-                             t.get("status") == "in_progress"), None)
+    existing_task = task_manager.find_task(user_id, request.task_type, "in_progress")
     
     if existing_task:
-        return {"message": f"Continuing existing task: {service['name']}", "task": existing_task}
+        return {"message": f"Continuing existing task: {service['name']}", "task": render_task(existing_task)}
 
-    task_id = str(uuid.uuid4())[:8]
-    
-    task = {
-        "id": task_id,
-        "type": request.task_type,
-        "name": service["name"],
-        "icon": service["icon"],
-        "description": service["description"],
-        "steps": service["steps"],
-        "current_step": 1,
-        "total_steps": len(service["steps"]),
-        "status": "in_progress",
-        "user_id": request.user_id or "default",
-        "created_at": datetime.now().isoformat(),
-        "updated_at": datetime.now().isoformat(),
-        "documents": []
-    }
-    
-    active_tasks[task_id] = task
-    return {"message": f"Task created: {service['name']}", "task": task}
+    task = TaskRecord.new(request.task_type, user_id)
+    task_manager.create_task(task)
+    return {"message": f"Task created: {service['name']}", "task": render_task(task)}
 
 
 @app.post("/task/start-with-verification")
@@ -403,21 +372,18 @@ def start_task_with_verification(request: TaskCreateRequest):
         }
 
     # Check for existing active task
-    existing_task = next((t for t in active_tasks.values() 
-                          if t.get("user_id") == user_id and 
-                             t.get("type") == request.task_type and 
-                             t.get("status") == "in_progress"), None)
+    existing_task = task_manager.find_task(user_id, request.task_type, "in_progress")
     
     if existing_task:
         service = AGENTIC_SERVICES[request.task_type]
         return {
             "success": True,
             "message": f"Continuing existing task: {service['name']}",
-            "task": existing_task,
+            "task": render_task(existing_task),
             "auto_verification": verification,
             "skipped_step": "Step 1 (Eligibility Check) - Previously passed",
-            "current_step": existing_task.get("steps", [])[1] if len(existing_task.get("steps", [])) > 1 else None,
-            "autofill_data": existing_task.get("user_data", {})
+            "current_step": existing_task.step(2),
+            "autofill_data": existing_task.extra.get("user_data", {})
         }
     
     validation = validate_user_for_service(user_id, request.task_type)
@@ -439,32 +405,14 @@ def start_task_with_verification(request: TaskCreateRequest):
         raise HTTPException(status_code=400, detail=f"Unknown task type: {request.task_type}")
     
     service = AGENTIC_SERVICES[request.task_type]
-    task_id = str(uuid.uuid4())[:8]
-    
-    task = {
-        "id": task_id,
-        "type": request.task_type,
-        "name": service["name"],
-        "icon": service["icon"],
-        "description": service["description"],
-        "steps": service["steps"],
-        "current_step": 2,
-        "total_steps": len(service["steps"]),
-        "status": "in_progress",
-        "user_id": user_id,
-        "created_at": datetime.now().isoformat(),
-        "updated_at": datetime.now().isoformat(),
-        "documents": [],
-        "auto_verification": verification,
-        "user_data": validation["present_fields"]
-    }
-    
-    active_tasks[task_id] = task
+    task = TaskRecord.new(request.task_type, user_id, current_step=2,
+                          auto_verification=verification, user_data=validation["present_fields"])
+    task_manager.create_task(task)
     
     return {
         "success": True,
         "message": f"✅ Eligibility verified! Task started: {service['name']}",
-        "task": task,
+        "task": render_task(task),
         "auto_verification": verification,
         "skipped_step": "Step 1 (Eligibility Check) - Auto-completed by agent",
         "current_step": service["steps"][1] if len(service["steps"]) > 1 else None,
@@ -473,70 +421,90 @@ def start_task_with_verification(request: TaskCreateRequest):
 
 
 @app.get("/task/{task_id}")
-def get_task(task_id: str):
-    """Get task details"""
-    task = active_tasks.get(task_id)
+def get_task(task_id: str, fields: Optional[str] = None):
+    """Get task details; `fields` is a comma-separated projection"""
+    task = task_manager.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail=f"Task not found: {task_id}")
-    return task
+    return render_task(task, parse_fields(fields))
 
 
 @app.get("/tasks")
-def get_tasks(user_id: str = "default"):
+def get_tasks(user_id: str = "default", task_type: Optional[str] = None, status: Optional[str] = None,
+              fields: Optional[str] = None):
     """Get all tasks for user"""
-    return {"tasks": [t for t in active_tasks.values() if t.get("user_id") == user_id]}
+    projection = parse_fields(fields)
+    return {"tasks": [render_task(t, projection) for t in task_manager.tasks_for_user(user_id, task_type, status)]}
+
+
+def _transitioned(result: task_manager.TransitionResult) -> TaskRecord:
+    """Map a transition result onto the endpoint's HTTP errors"""
+    if result.error:
+        raise HTTPException(status_code=404 if result.missing else 409, detail=result.error)
+    return result.record
 
 
 @app.post("/task/{task_id}/advance")
-def advance_task(task_id: str):
+def advance_task(task_id: str, idempotency_key: Optional[str] = Header(None)):
     """Advance to next step"""
-    task = active_tasks.get(task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail=f"Task not found: {task_id}")
+    task = _transitioned(task_manager.transition(task_id, "advance", idempotency_key))
     
-    if task["current_step"] >= task["total_steps"]:
-        task["status"] = "completed"
-        task["updated_at"] = datetime.now().isoformat()
-        return {"completed": True, "message": f"🎉 Task completed!", "task": task}
-    
-    task["current_step"] += 1
-    task["updated_at"] = datetime.now().isoformat()
+    if task.status == "completed":
+        return {
+            "completed": True,
+            "message": f"🎉 Task completed!",
+            "task": render_task(task)
+        }
     
     return {
         "completed": False,
-        "message": f"Moved to step {task['current_step']}",
-        "task": task,
-        "next_step": task["steps"][task["current_step"] - 1] if task["current_step"] <= len(task["steps"]) else None
+        "message": f"Moved to step {task.current_step}",
+        "task": render_task(task),
+        "next_step": task.step(task.current_step)
     }
 
 
 @app.post("/task/{task_id}/cancel")
-def cancel_task(task_id: str):
+def cancel_task(task_id: str, idempotency_key: Optional[str] = Header(None)):
     """Cancel a task"""
-    task = active_tasks.get(task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail=f"Task not found: {task_id}")
-    task["status"] = "cancelled"
-    task["updated_at"] = datetime.now().isoformat()
-    return {"message": f"Task cancelled", "task": task}
+    task = _transitioned(task_manager.transition(task_id, "cancel", idempotency_key))
+    return {"message": f"Task cancelled", "task": render_task(task)}
 
 
 @app.delete("/task/{task_id}")
-def delete_task(task_id: str):
-    """Delete a task"""
-    if task_id not in active_tasks:
-        raise HTTPException(status_code=404, detail=f"Task not found: {task_id}")
-    del active_tasks[task_id]
+def delete_task(task_id: str, idempotency_key: Optional[str] = Header(None)):
+    """Delete a task (kept as a soft-deleted record until swept)"""
+    _transitioned(task_manager.transition(task_id, "delete", idempotency_key))
     return {"message": f"Task deleted: {task_id}"}
 
 
+@app.get("/task/{task_id}/events")
+def get_task_events(task_id: str):
+    """Ordered transition history for a task"""
+    events = state_store.task_events(task_id)
+    if not events:
+        if not task_manager.get_task(task_id, include_deleted=True):
+            raise HTTPException(status_code=404, detail=f"Task not found: {task_id}")
+    return {"task_id": task_id, "events": events}
+
+
+@app.post("/tasks/batch")
+def batch_transitions(request: TaskBatchRequest):
+    """Apply many task transitions in one transaction; failures are reported per item"""
+    results = task_manager.transition_many([t.model_dump() for t in request.transitions])
+    return {"results": [
+        {"task_id": r.task_id, "action": r.action, "ok": r.error is None, "duplicate": r.duplicate,
+          "error": r.error, "task": render_task(r.record) if r.record else None}
+        for r in results
+    ]}
+
+
 # ============== USER ID ENDPOINTS ==============
 
 @app.get("/user/id")
 def get_digital_id(user_id: str = "default"):
     """Get digital ID data for ID page"""
-    User = Query()
-    user = users_table.get(User.user_id == user_id)
+    user = get_user(user_id)
     
     if user:
         return {
@@ -560,10 +528,9 @@ def get_digital_id(user_id: str = "default"):
 # ============== USER PROFILE ENDPOINTS ==============
 
 @app.get("/user/profile")
-def get_user_profile(user_id: str = "default"):
-    """Get user profile"""
-    User = Query()
-    user = users_table.get(User.user_id == user_id)
+def get_user_profile(response: Response, user_id: str = "default"):
+    """Get user profile; the ETag is the profile version"""
+    user = get_user(user_id)
     
     if not user:
         return {"user_id": user_id, "profile": {}, "schema": USER_PROFILE_SCHEMA}
@@ -573,24 +540,28 @@ def get_user_profile(user_id: str = "default"):
         filled = sum(1 for f in fields if user.get(f))
         completion[category] = round(filled / max(1, len(fields)) * 100)
     
-    return {"user_id": user_id, "profile": user, "schema": USER_PROFILE_SCHEMA, "completion": completion}
+    response.headers["ETag"] = f'"{user["_version"]}"'
+    return {"user_id": user_id, "profile": user, "schema": USER_PROFILE_SCHEMA,
+            "completion": completion, "version": user["_version"]}
 
 
 @app.post("/user/profile")
 def update_user_profile(user_id: str = "default", updates: dict = {}):
     """Update user profile"""
-    User = Query()
-    existing = users_table.get(User.user_id == user_id)
+    version, _ = patch_user(user_id, updates)
     
-    if existing:
-        merged = {**existing, **updates, "updated_at": datetime.now().isoformat()}
-        users_table.update(merged, User.user_id == user_id)
-    else:
-        updates["user_id"] = user_id
-        updates["created_at"] = datetime.now().isoformat()
-        users_table.insert(updates)
+    return {"message": "Profile updated", "updated_fields": list(updates.keys()), "version": version}
+
+
+@app.patch("/user/profile")
+def patch_user_profile(user_id: str = "default", updates: dict = {}, expected_version: Optional[int] = None):
+    """Field-level profile update; only changed fields are written"""
+    try:
+        version, changed = patch_user(user_id, updates, expected_version)
+    except VersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
-    return {"message": "Profile updated", "updated_fields": list(updates.keys())}
+    return {"message": "Profile updated", "updated_fields": list(changed.keys()), "version": version}
 
 
 @app.get("/user/validate/{service_type}")
@@ -600,6 +571,24 @@ def validate_for_service(service_type: str, user_id: str = "default"):
     return validate_user_for_service(user_id, service_type)
 
 
+@app.get("/user/eligibility/state")
+def get_eligibility_state(user_id: str = "default"):
+    """Stored dashboard eligibility, kept fresh incrementally on profile writes"""
+    return eligibility_state.get_state(user_id)
+
+
+@app.get("/user/eligibility")
+def get_eligibility(user_id: str = "default"):
+    """Validation results for every service in one call"""
+    user = get_user(user_id) or {"user_id": user_id}
+    services = eligibility_matrix(user)
+    return {
+        "user_id": user_id,
+        "eligible": [service for service, result in services.items() if result["valid"]],
+        "services": services,
+    }
+
+
 @app.get("/agent/verify/{service_type}")
 def verify_eligibility(service_type: str, user_id: str = "default"):
     """Auto-verification agent"""
@@ -611,38 +600,47 @@ def verify_eligibility(service_type: str, user_id: str = "default"):
 
 @app.post("/history/save")
 def save_chat_history(request: ChatHistoryRequest):
-    """Save chat history"""
-    chat_history[request.session_id] = {
-        "session_id": request.session_id,
-        "user_id": request.user_id,
-        "messages": request.messages,
-        "title": request.title or f"Chat {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-        "created_at": datetime.now().isoformat(),
-        "updated_at": datetime.now().isoformat()
-    }
+    """Save chat history, replacing the whole transcript"""
+    state_store.save_session(request.session_id, request.user_id, request.messages, request.title)
     return {"message": "History saved", "session_id": request.session_id}
 
 
+@app.post("/history/{session_id}/append")
+def append_chat_history(session_id: str, request: ChatAppendRequest):
+    """Append new messages to a chat session"""
+    session = state_store.append_messages(session_id, request.user_id, request.messages, request.title)
+    return {"message": "Messages appended", "session": session}
+
+
 @app.get("/history/{session_id}")
-def get_chat_history(session_id: str):
-    """Get chat history"""
-    history = chat_history.get(session_id)
+def get_chat_history(session_id: str, cursor: Optional[str] = None,
+                     limit: Optional[int] = Query(None, ge=1, le=1000)):
+    """Get chat history; pass limit/cursor to page through messages"""
+    history = state_store.get_session(session_id)
     if not history:
         raise HTTPException(status_code=404, detail="History not found")
-    return history
+    try:
+        messages, next_cursor = state_store.list_messages(session_id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**history, "messages": messages, "next_cursor": next_cursor}
 
 
 @app.get("/history")
-def list_chat_history(user_id: str = "default"):
-    """List all chat histories"""
-    return {"histories": [h for h in chat_history.values() if h.get("user_id") == user_id]}
+def list_chat_history(user_id: str = "default", cursor: Optional[str] = None,
+                      limit: int = Query(20, ge=1, le=500)):
+    """List chat session summaries, most recent first"""
+    try:
+        sessions, next_cursor = state_store.list_sessions(user_id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"sessions": sessions, "next_cursor": next_cursor}
 
 
 @app.delete("/history/{session_id}")
 def delete_chat_history(session_id: str):
     """Delete chat history"""
-    if session_id in chat_history:
-        del chat_history[session_id]
+    state_store.delete_session(session_id)
     return {"message": "History deleted"}
 
 
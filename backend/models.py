@@ -2,7 +2,7 @@
 Pydantic models for API requests and responses.
 """
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any
 
 
 class ChatRequest(BaseModel):
@@ -20,6 +20,16 @@ class TaskStepRequest(BaseModel):
     step_data: Optional[Dict[str, Any]] = None
 
 
+class TaskTransitionRequest(BaseModel):
+    task_id: str
+    action: Literal["advance", "cancel", "delete"]
+    idempotency_key: Optional[str] = None
+
+
+class TaskBatchRequest(BaseModel):
+    transitions: List[TaskTransitionRequest]
+
+
 class ChatHistoryRequest(BaseModel):
     session_id: str
     user_id: Optional[str] = "default"
@@ -27,6 +37,12 @@ class ChatHistoryRequest(BaseModel):
     title: Optional[str] = None
 
 
+class ChatAppendRequest(BaseModel):
+    user_id: Optional[str] = "default"
+    messages: List[Dict[str, Any]]
+    title: Optional[str] = None
+
+
 class UserProfileUpdate(BaseModel):
     """Model for updating user profile"""
     full_name: Optional[str] = None
@@ -0,0 +1,39 @@
+"""
+Operational endpoints for inspecting and maintaining server state.
+"""
+import asyncio
+
+from fastapi import APIRouter
+
+from ledger_verify import verify_chain
+
+from services.sweeper import sweeper
+from services.event_bus import event_bus
+from services.result_cache import result_cache
+from services.rate_limiter import rate_limiter
+from services.request_guard import request_guard
+from services.request_signing import signature_verifier
+from services.ledger_writer import ledger_writer
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+@router.get("/state")
+def get_state_stats():
+    """Live and evicted object counts, plus push, cache, rate limit, guard, signature and ledger counters"""
+    return {**sweeper.stats(), "events": event_bus.stats(), "result_cache": result_cache.stats(),
+            "rate_limits": rate_limiter.stats(), "guard": request_guard.stats(),
+            "signatures": signature_verifier.stats(), "ledger": ledger_writer.stats()}
+
+
+@router.post("/sweep")
+async def run_sweep():
+    """Run an expiry sweep now instead of waiting for the next interval"""
+    await sweeper.sweep_once()
+    return sweeper.stats()
+
+
+@router.post("/ledger/verify")
+async def verify_ledger(full: bool = False):
+    """Recompute block hashes and links since the last signed checkpoint (every block if `full`)"""
+    return await asyncio.to_thread(verify_chain, full=full)
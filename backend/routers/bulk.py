@@ -0,0 +1,46 @@
+"""
+Bulk user profile import/export and batch eligibility endpoints.
+"""
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+
+import batch_eligibility
+from bulk_io import import_ndjson_async, export_ndjson
+from config import BULK_IMPORT_BATCH_SIZE
+from database import iter_users
+from knowledge_base import COMPILED_RULES
+
+router = APIRouter(prefix="/user/bulk", tags=["Bulk"])
+
+
+@router.post("/import")
+async def bulk_import(request: Request, batch_size: int = Query(BULK_IMPORT_BATCH_SIZE, ge=1)):
+    """Stream an NDJSON body of profiles into the database in batches"""
+    return await import_ndjson_async(request.stream(), batch_size)
+
+
+@router.get("/export")
+def bulk_export():
+    """Stream every profile as NDJSON"""
+    return StreamingResponse(iterate_in_threadpool(export_ndjson()), media_type="application/x-ndjson")
+
+
+@router.get("/eligibility")
+def bulk_eligibility(services: str, format: str = "ndjson", only_eligible: bool = False):
+    """
+    Stream eligibility for every profile against the comma-separated services.
+    Runs in-process; use `python batch_eligibility.py` for multi-core runs.
+    """
+    service_list = [s.strip() for s in services.split(",") if s.strip()]
+    unknown = [s for s in service_list if s not in COMPILED_RULES]
+    if not service_list or unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown services: {', '.join(unknown) or services}")
+    if format not in batch_eligibility.FORMATTERS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    if batch_eligibility.np is None:
+        raise HTTPException(status_code=503, detail="Batch eligibility requires the 'numpy' package")
+
+    rows = batch_eligibility.evaluate_profiles(iter_users(), service_list, workers=1, only_eligible=only_eligible)
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(iterate_in_threadpool(batch_eligibility.FORMATTERS[format](rows)), media_type=media_type)
@@ -0,0 +1,34 @@
+"""
+Server-sent events stream of task and ID status changes for one user.
+"""
+import json
+
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+
+from config import EVENT_KEEPALIVE_SECONDS
+from services.event_bus import event_bus
+
+router = APIRouter(tags=["Events"])
+
+
+def _format(event) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+@router.get("/events")
+async def stream_events(request: Request, user_id: str = "default"):
+    """Subscribe to pushed updates instead of polling /task, /tasks and /security/status"""
+    sub = event_bus.subscribe(user_id)
+
+    async def stream():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                event = await sub.get(timeout=EVENT_KEEPALIVE_SECONDS)
+                yield _format(event) if event else ": keep-alive\n\n"
+        finally:
+            event_bus.unsubscribe(sub)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,44 +1,48 @@
-from fastapi import APIRouter, HTTPException
-from tinydb import Query, TinyDB
+from fastapi import APIRouter, HTTPException, Query, Request
 from datetime import datetime
-from database import users_table
+from typing import Optional
+from database import get_user, patch_user
 from services.blockchain import blockchain
+from services.merkle import leaf_hash
+from services.ledger_writer import ledger_writer
 from services.ai_engine import ai_engine
+from services.event_bus import event_bus
 
 router = APIRouter(prefix="/security", tags=["security"])
 
 @router.post("/revoke")
-def revoke_id(user_id: str = "default"):
+def revoke_id(request: Request, user_id: str = "default"):
     """Revoke a user's digital ID remotely"""
-    # 1. AI Safety Check
-    is_anomaly, risk, reason = ai_engine.check_behavior(user_id, "revoke")
+    # 1. AI Safety Check (already run by the request guard when the caller sent a user_id)
+    is_anomaly, risk, reason = getattr(request.state, "anomaly", None) or ai_engine.check_behavior(user_id, "revoke")
+    transactions = []
     if is_anomaly:
         # Block revocation if suspicious? Or just flag?
         # For revocation, we probably want to allow it but log heavily.
-        blockchain.add_transaction({"event": "ANOMALY_DETECTED", "user": user_id, "reason": reason})
+        transactions.append({"event": "ANOMALY_DETECTED", "user": user_id, "reason": reason})
         
-    User = Query()
     # Upsert user if not exists, though usually should exist
-    if not users_table.search(User.user_id == user_id):
-        users_table.insert({"user_id": user_id, "revoked": True, "created_at": datetime.now().isoformat()})
-    else:
-        users_table.update({"revoked": True, "revoked_at": datetime.now().isoformat()}, User.user_id == user_id)
+    revoked_at = datetime.now().isoformat()
+    patch_user(user_id, {"revoked": True, "revoked_at": revoked_at})
+    event_bus.publish(user_id, "status", {"status": "revoked", "revoked_at": revoked_at})
     
-    # 2. Blockchain Log
-    blockchain.add_transaction({
+    # 2. Blockchain Log (one unit, so an anomaly is always in the revocation's block;
+    #    waits for the block so the receipt can be returned)
+    transactions.append({
         "event": "ID_REVOCATION",
         "user_id": user_id,
         "timestamp": datetime.now().isoformat(),
         "risk_score": risk
     })
+    receipt = ledger_writer.commit_many(transactions)[-1]
     
-    return {"status": "revoked", "message": "ID has been revoked remotely.", "user_id": user_id}
+    return {"status": "revoked", "message": "ID has been revoked remotely.", "user_id": user_id,
+            "ledger": receipt}
 
 @router.get("/status")
 def check_status(user_id: str = "default"):
     """Check if ID is valid or revoked"""
-    User = Query()
-    user = users_table.get(User.user_id == user_id)
+    user = get_user(user_id)
     
     if user and user.get("revoked", False):
         return {
@@ -52,18 +56,22 @@ def check_status(user_id: str = "default"):
 @router.post("/restore")
 def restore_id(user_id: str = "default"):
     """Restore a revoked ID (for testing purposes)"""
-    User = Query()
-    users_table.update({"revoked": False, "restored_at": datetime.now().isoformat()}, User.user_id == user_id)
+    if get_user(user_id):
+        patch_user(user_id, {"revoked": False, "restored_at": datetime.now().isoformat()})
+        event_bus.publish(user_id, "status", {"status": "active"})
     return {"status": "active", "message": "ID restored."}
 
 @router.post("/generate_proof")
-def generate_proof(request: dict):
+def generate_proof(request: dict, http_request: Request):
     """Generate a Zero-Knowledge Proof (Simulated) for selective disclosure"""
     user_id = request.get("user_id", "default")
+    # Bot screening (the guard only runs it when user_id is also in the query)
+    is_anomaly, _, reason = getattr(http_request.state, "anomaly", None) or ai_engine.check_behavior(user_id, "security")
+    if is_anomaly:
+        raise HTTPException(status_code=429, detail=reason)
     attribute = request.get("attribute") # e.g., "age_over_18", "citizenship"
     
-    User = Query()
-    user = users_table.get(User.user_id == user_id)
+    user = get_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
         
@@ -93,12 +101,50 @@ def generate_proof(request: dict):
     elif attribute == "citizenship":
         proof_data["result"] = True # Is Malaysian
     
-    # Log to Blockchain
-    blockchain.add_transaction({
+    # Log to Blockchain. The tx_id is known up front (the timestamp keeps it unique),
+    # so by default this does not wait for the block; pass "wait": true for the
+    # full receipt with block and position.
+    transaction = {
         "event": "ZKP_GENERATED",
         "user_id": user_id,
         "attribute": attribute,
-        "result": proof_data["result"]
-    })
+        "result": proof_data["result"],
+        "timestamp": proof_data["timestamp"]
+    }
+    if request.get("wait"):
+        proof_data["ledger"] = ledger_writer.commit(transaction)
+    else:
+        ledger_writer.submit(transaction)
+        proof_data["ledger"] = {"tx_id": leaf_hash(transaction).hex()}
         
     return proof_data
+
+@router.get("/ledger")
+def query_ledger(user_id: Optional[str] = None, event: Optional[str] = None,
+                 since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=500)):
+    """
+    Ledger transactions for a user and/or event type (e.g. ID_REVOCATION,
+    ANOMALY_DETECTED), newest first, optionally limited to blocks written
+    between `since` and `until`. Served from the ledger index, so a page
+    costs the same however long the chain is; follow next_cursor for more.
+    """
+    try:
+        transactions, next_cursor = blockchain.query(
+            user_id, event, since.timestamp() if since else None, until.timestamp() if until else None,
+            cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"transactions": transactions, "next_cursor": next_cursor}
+
+@router.get("/ledger/proof")
+def ledger_inclusion_proof(block: int, position: int):
+    """
+    Merkle inclusion proof for one ledger transaction, identified by the
+    receipt returned when it was logged. Verify by hashing the transaction
+    up the proof path to merkle_root, then checking the block header hash.
+    """
+    try:
+        return blockchain.inclusion_proof(block, position)
+    except (IndexError, LookupError) as e:
+        raise HTTPException(status_code=404, detail=str(e))
@@ -1,23 +1,21 @@
 """
 Task management API endpoints.
 """
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from typing import Dict, Any, List
+from fastapi import APIRouter, HTTPException, Header, UploadFile, File
+from typing import Optional
 from datetime import datetime
 import uuid
 
-from models import TaskCreateRequest, TaskStepRequest
+from models import TaskCreateRequest, TaskStepRequest, TaskBatchRequest
 from knowledge_base import AGENTIC_SERVICES
-from database import users_table, Query
+from state_store import state_store
+from services import task_manager
+from services.task_manager import TaskRecord, render_task, parse_fields
 from routers.verification import run_auto_verification
 from routers.users import validate_user_for_service
 
 router = APIRouter(prefix="/task", tags=["Tasks"])
 
-# In-memory storage for active tasks
-active_tasks: Dict[str, Dict[str, Any]] = {}
-uploaded_documents: Dict[str, List[Dict[str, Any]]] = {}
-
 
 @router.post("/create")
 def create_task(request: TaskCreateRequest):
@@ -26,29 +24,12 @@ def create_task(request: TaskCreateRequest):
         raise HTTPException(status_code=400, detail=f"Unknown task type: {request.task_type}")
     
     service = AGENTIC_SERVICES[request.task_type]
-    task_id = str(uuid.uuid4())[:8]
-    
-    task = {
-        "id": task_id,
-        "type": request.task_type,
-        "name": service["name"],
-        "icon": service["icon"],
-        "description": service["description"],
-        "steps": service["steps"],
-        "current_step": 1,
-        "total_steps": len(service["steps"]),
-        "status": "in_progress",
-        "user_id": request.user_id or "default",
-        "created_at": datetime.now().isoformat(),
-        "updated_at": datetime.now().isoformat(),
-        "documents": []
-    }
-    
-    active_tasks[task_id] = task
+    task = TaskRecord.new(request.task_type, request.user_id or "default")
+    task_manager.create_task(task)
     
     return {
         "message": f"Task created: {service['name']}",
-        "task": task
+        "task": render_task(task)
     }
 
 
@@ -85,32 +66,15 @@ def start_task_with_auto_verification(request: TaskCreateRequest):
         raise HTTPException(status_code=400, detail=f"Unknown task type: {request.task_type}")
     
     service = AGENTIC_SERVICES[request.task_type]
-    task_id = str(uuid.uuid4())[:8]
-    
-    task = {
-        "id": task_id,
-        "type": request.task_type,
-        "name": service["name"],
-        "icon": service["icon"],
-        "description": service["description"],
-        "steps": service["steps"],
-        "current_step": 2,  # Skip step 1 (eligibility check)
-        "total_steps": len(service["steps"]),
-        "status": "in_progress",
-        "user_id": user_id,
-        "created_at": datetime.now().isoformat(),
-        "updated_at": datetime.now().isoformat(),
-        "documents": [],
-        "auto_verification": verification,
-        "user_data": validation["present_fields"]
-    }
-    
-    active_tasks[task_id] = task
+    task = TaskRecord.new(request.task_type, user_id,
+                          current_step=2,  # Skip step 1 (eligibility check)
+                          auto_verification=verification, user_data=validation["present_fields"])
+    task_manager.create_task(task)
     
     return {
         "success": True,
         "message": f"✅ Eligibility verified! Task started: {service['name']}",
-        "task": task,
+        "task": render_task(task),
         "auto_verification": verification,
         "skipped_step": "Step 1 (Eligibility Check) - Auto-completed by agent",
         "current_step": service["steps"][1] if len(service["steps"]) > 1 else None,
@@ -119,79 +83,88 @@ def start_task_with_auto_verification(request: TaskCreateRequest):
 
 
 @router.get("/{task_id}")
-def get_task(task_id: str):
-    """Get task details"""
-    task = active_tasks.get(task_id)
+def get_task(task_id: str, fields: Optional[str] = None):
+    """Get task details; `fields` is a comma-separated projection"""
+    task = task_manager.get_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail=f"Task not found: {task_id}")
-    return task
+    return render_task(task, parse_fields(fields))
 
 
 @router.get("s")
-def get_all_tasks(user_id: str = "default"):
+def get_all_tasks(user_id: str = "default", task_type: Optional[str] = None, status: Optional[str] = None,
+                  fields: Optional[str] = None):
     """Get all tasks for a user"""
-    user_tasks = [t for t in active_tasks.values() if t.get("user_id") == user_id]
-    return {"tasks": user_tasks}
+    projection = parse_fields(fields)
+    user_tasks = task_manager.tasks_for_user(user_id, task_type, status)
+    return {"tasks": [render_task(t, projection) for t in user_tasks]}
+
+
+def _transitioned(result: task_manager.TransitionResult) -> TaskRecord:
+    """Map a transition result onto the endpoint's HTTP errors"""
+    if result.error:
+        raise HTTPException(status_code=404 if result.missing else 409, detail=result.error)
+    return result.record
 
 
 @router.post("/{task_id}/advance")
-def advance_task(task_id: str):
+def advance_task(task_id: str, idempotency_key: Optional[str] = Header(None)):
     """Advance to next step"""
-    task = active_tasks.get(task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail=f"Task not found: {task_id}")
+    task = _transitioned(task_manager.transition(task_id, "advance", idempotency_key))
     
-    if task["current_step"] >= task["total_steps"]:
-        task["status"] = "completed"
-        task["updated_at"] = datetime.now().isoformat()
+    if task.status == "completed":
         return {
             "completed": True,
-            "message": f"🎉 Task completed: {task['name']}!",
-            "task": task
+            "message": f"🎉 Task completed: {task.template['name']}!",
+            "task": render_task(task)
         }
     
-    task["current_step"] += 1
-    task["updated_at"] = datetime.now().isoformat()
-    
-    next_step = task["steps"][task["current_step"] - 1] if task["current_step"] <= len(task["steps"]) else None
-    
     return {
         "completed": False,
-        "message": f"Moved to step {task['current_step']}",
-        "task": task,
-        "next_step": next_step
+        "message": f"Moved to step {task.current_step}",
+        "task": render_task(task),
+        "next_step": task.step(task.current_step)
     }
 
 
 @router.post("/{task_id}/cancel")
-def cancel_task(task_id: str):
+def cancel_task(task_id: str, idempotency_key: Optional[str] = Header(None)):
     """Cancel a task"""
-    task = active_tasks.get(task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail=f"Task not found: {task_id}")
-    
-    task["status"] = "cancelled"
-    task["updated_at"] = datetime.now().isoformat()
-    
-    return {"message": f"Task cancelled: {task['name']}", "task": task}
+    task = _transitioned(task_manager.transition(task_id, "cancel", idempotency_key))
+    return {"message": f"Task cancelled: {task.template['name']}", "task": render_task(task)}
 
 
 @router.delete("/{task_id}")
-def delete_task(task_id: str):
-    """Delete a task"""
-    if task_id not in active_tasks:
-        raise HTTPException(status_code=404, detail=f"Task not found: {task_id}")
-    del active_tasks[task_id]
+def delete_task(task_id: str, idempotency_key: Optional[str] = Header(None)):
+    """Delete a task (kept as a soft-deleted record until swept)"""
+    _transitioned(task_manager.transition(task_id, "delete", idempotency_key))
     return {"message": f"Task deleted: {task_id}"}
 
 
+@router.get("/{task_id}/events")
+def get_task_events(task_id: str):
+    """Ordered transition history for a task"""
+    events = state_store.task_events(task_id)
+    if not events:
+        if not task_manager.get_task(task_id, include_deleted=True):
+            raise HTTPException(status_code=404, detail=f"Task not found: {task_id}")
+    return {"task_id": task_id, "events": events}
+
+
+@router.post("s/batch")
+def batch_transitions(request: TaskBatchRequest):
+    """Apply many task transitions in one transaction; failures are reported per item"""
+    results = task_manager.transition_many([t.model_dump() for t in request.transitions])
+    return {"results": [
+        {"task_id": r.task_id, "action": r.action, "ok": r.error is None, "duplicate": r.duplicate,
+          "error": r.error, "task": render_task(r.record) if r.record else None}
+        for r in results
+    ]}
+
+
 @router.post("/{task_id}/upload")
 async def upload_document(task_id: str, file: UploadFile = File(...)):
     """Upload document for a task"""
-    task = active_tasks.get(task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail=f"Task not found: {task_id}")
-    
     doc_id = str(uuid.uuid4())[:8]
     doc = {
         "id": doc_id,
@@ -200,11 +173,8 @@ async def upload_document(task_id: str, file: UploadFile = File(...)):
         "uploaded_at": datetime.now().isoformat()
     }
     
-    task["documents"].append(doc)
-    
-    if task_id not in uploaded_documents:
-        uploaded_documents[task_id] = []
-    uploaded_documents[task_id].append(doc)
+    _transitioned(task_manager.transition(task_id, "attach_document", data=doc))
+    state_store.add_document(task_id, doc)
     
     return {"message": f"Document uploaded: {file.filename}", "document": doc}
 
@@ -212,4 +182,4 @@ async def upload_document(task_id: str, file: UploadFile = File(...)):
 @router.get("/{task_id}/documents")
 def get_task_documents(task_id: str):
     """Get documents for a task"""
-    return {"documents": uploaded_documents.get(task_id, [])}
+    return {"documents": state_store.documents_for_task(task_id)}
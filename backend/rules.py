@@ -0,0 +1,113 @@
+"""
+Eligibility rule engine for the auto-verification agent.
+
+Check functions are registered by rule_id with @eligibility_rule next to
+ELIGIBILITY_RULES in knowledge_base.py. Rules without a registered check fall
+back to a presence check over their `check_field` list. Every check receives
+the same RuleContext, so profile dates are parsed once and all rules in an
+evaluation agree on "now".
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# (status, message, value_found)
+CheckResult = Tuple[str, str, Any]
+RuleCheck = Callable[[Dict[str, Any], "RuleContext"], CheckResult]
+
+RULE_CHECKS: Dict[str, RuleCheck] = {}
+
+INVALID = object()  # marker for a date that is present but unparseable
+
+
+def eligibility_rule(rule_id: str):
+    """Register a check function for a rule_id"""
+    def register(check: RuleCheck) -> RuleCheck:
+        RULE_CHECKS[rule_id] = check
+        return check
+    return register
+
+
+def parse_date(value: Any):
+    """Parsed profile date, None when blank, or INVALID"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return INVALID
+    # Profile dates are naive local times; offset-aware values cannot be
+    # compared with "now" and are treated like any other malformed date
+    return INVALID if parsed.tzinfo is not None else parsed
+
+
+class RuleContext:
+    """A profile prepared once for every rule in an evaluation"""
+    __slots__ = ("user", "now", "passport_expiry", "date_of_birth")
+
+    def __init__(self, user: Dict[str, Any], now: Optional[datetime] = None):
+        self.user = user
+        self.now = now or datetime.now()
+        self.passport_expiry = parse_date(user.get("passport_expiry", ""))
+        self.date_of_birth = parse_date(user.get("date_of_birth", ""))
+
+    def months_until(self, date: datetime) -> float:
+        return (date - self.now).days / 30
+
+    def years_since(self, date: datetime) -> int:
+        return (self.now - date).days // 365
+
+
+def check_fields_present(rule: Dict[str, Any], ctx: RuleContext, fields: Tuple[str, ...]) -> CheckResult:
+    """Default check: every field in `check_field` holds a non-blank value"""
+    values = []
+    for field in fields:
+        value = ctx.user.get(field)
+        if not value or (isinstance(value, str) and not value.strip()):
+            if rule["severity"] == "critical":
+                return "failed", f"❌ {rule['name']} - Required field(s) missing", None
+            return "warning", f"⚠️ {rule['name']} - Optional field(s) missing", None
+        values.append(f"{field}: {value}")
+    return "passed", f"✅ {rule['name']} verified", ", ".join(values)
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledRule:
+    rule: Dict[str, Any]
+    check: Optional[RuleCheck]
+    fields: Tuple[str, ...]
+
+    def run(self, ctx: RuleContext) -> CheckResult:
+        if self.check is not None:
+            return self.check(self.rule, ctx)
+        return check_fields_present(self.rule, ctx, self.fields)
+
+
+def compile_rules(rules_by_service: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[CompiledRule]]:
+    """Resolve each rule's check function and field list once"""
+    return {
+        service: [CompiledRule(rule, RULE_CHECKS.get(rule["rule_id"]),
+                               tuple(f.strip() for f in rule["check_field"].split(",")))
+                  for rule in rules]
+        for service, rules in rules_by_service.items()
+    }
+
+
+def evaluate(rules: List[CompiledRule], ctx: RuleContext) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Run compiled rules against one context; returns per-rule results and status counts"""
+    results = []
+    counts = {"passed": 0, "failed": 0, "warning": 0}
+    for compiled in rules:
+        status, message, value_found = compiled.run(ctx)
+        counts[status] += 1
+        rule = compiled.rule
+        results.append({
+            "rule_id": rule["rule_id"],
+            "name": rule["name"],
+            "description": rule["description"],
+            "severity": rule["severity"],
+            "status": status,
+            "message": message,
+            "value_found": value_found,
+        })
+    return results, counts
@@ -1,40 +1,137 @@
 
-from datetime import datetime, timedelta
+import time
+from array import array
+
+from services.rate_limiter import rate_limiter
+
+# More than this many requests within a minute is treated as bot traffic
+MINUTE_LIMIT = 10
+# The hour window is kept as HOUR_BUCKETS counters of BUCKET_SECONDS each
+HOUR_BUCKETS = 12
+BUCKET_SECONDS = 3600 // HOUR_BUCKETS
+
+
+class UserActivity:
+    """
+    Bounded per-user request history. The minute window only needs the last
+    MINUTE_LIMIT + 1 timestamps, kept in a ring that grows to that size. Until
+    the ring wraps those timestamps are the whole history; after that the hour
+    window moves to a ring of bucket counters whose newest bucket is the one
+    holding the last request. Both update in amortized O(1).
+    """
+    __slots__ = ("recent", "pos", "buckets")
+
+    def __init__(self):
+        self.recent = array("d")
+        self.pos = 0
+        self.buckets = None
+
+    @property
+    def last_seen(self) -> float:
+        return self.recent[self.pos - 1] if self.recent else float("-inf")
+
+    def record(self, now: float):
+        if self.buckets is None:
+            if len(self.recent) <= MINUTE_LIMIT:
+                self.recent.append(now)
+                self.pos = len(self.recent) % (MINUTE_LIMIT + 1)
+                return
+            # The ring is about to overwrite its oldest entry: count the full
+            # history into buckets first (pos is 0, so recent is in order)
+            self.buckets = array("H", [0]) * HOUR_BUCKETS
+            newest = None
+            for t in self.recent:
+                self._count(t, newest)
+                newest = int(t // BUCKET_SECONDS)
+
+        newest = int(self.last_seen // BUCKET_SECONDS)
+        self.recent[self.pos] = now
+        self.pos = (self.pos + 1) % (MINUTE_LIMIT + 1)
+        self._count(now, newest)
+
+    def _count(self, now: float, newest):
+        bucket = int(now // BUCKET_SECONDS)
+        if newest is None or bucket > newest:
+            # Zero the buckets that rolled out of the hour since the last request
+            first = bucket - HOUR_BUCKETS + 1 if newest is None else max(newest + 1, bucket - HOUR_BUCKETS + 1)
+            for b in range(first, bucket + 1):
+                self.buckets[b % HOUR_BUCKETS] = 0
+        count = self.buckets[bucket % HOUR_BUCKETS]
+        if count < 0xFFFF:
+            self.buckets[bucket % HOUR_BUCKETS] = count + 1
+
+    def minute_limit_exceeded(self, now: float) -> bool:
+        """True when the oldest of the last MINUTE_LIMIT + 1 requests is under a minute old"""
+        return len(self.recent) > MINUTE_LIMIT and self.recent[self.pos] > now - 60
+
+    def hour_count(self, now: float) -> int:
+        """Requests in the last hour (the last 55-60 minutes once the ring has wrapped)"""
+        if self.buckets is None:
+            return sum(1 for t in self.recent if t > now - 3600)
+        newest = int(self.last_seen // BUCKET_SECONDS)
+        age = int(now // BUCKET_SECONDS) - newest
+        if age >= HOUR_BUCKETS:
+            return 0
+        return sum(self.buckets[(newest - i) % HOUR_BUCKETS] for i in range(HOUR_BUCKETS - age))
+
 
 class AnomalyDetector:
     def __init__(self):
-        self.access_logs = {} # {user_id: [timestamp]}
-        
-    def check_behavior(self, user_id, event_type, metadata=None):
+        self.access_logs = {} # {user_id: UserActivity}
+        self._sweep_queue = []  # users still to check in the current eviction pass
+
+    def check_behavior(self, user_id, event_type, metadata=None, shared_ok=None):
         """
-        Analyze user behavior for anomalies.
+        Analyze user behavior for anomalies. `shared_ok` is the caller's
+        result for the shared "anomaly" rate limit when it has already
+        checked it; otherwise it is checked here.
         Returns: (is_anomaly: bool, risk_score: float, reason: str)
         """
-        now = datetime.now()
-        
+        now = time.time()
+
         # 1. Frequency Analysis (Rate Limiting)
-        if user_id not in self.access_logs:
-            self.access_logs[user_id] = []
-            
-        timestamps = self.access_logs[user_id]
-        # Clean old logs (> 1 hour)
-        timestamps = [t for t in timestamps if t > now - timedelta(hours=1)]
-        timestamps.append(now)
-        self.access_logs[user_id] = timestamps
-        
-        # If > 10 requests in 1 minute -> Anomaly (Bot attack)
-        recent_requests = [t for t in timestamps if t > now - timedelta(minutes=1)]
-        if len(recent_requests) > 10:
+        activity = self.access_logs.get(user_id)
+        if activity is None:
+            activity = self.access_logs[user_id] = UserActivity()
+        activity.record(now)
+
+        # If > 10 requests in 1 minute -> Anomaly (Bot attack). The local ring
+        # only sees this process; the shared limit covers every worker.
+        if shared_ok is None:
+            shared_ok = rate_limiter.allow("anomaly", user_id)
+        if activity.minute_limit_exceeded(now) or not shared_ok:
             return True, 0.9, "High frequency access detected (Potential Bot)"
-            
+
         # 2. Time-based Anomaly (Impossible Travel - Mocked)
         # If accessing from "London" 1 min after "KL" -> Anomaly
         # Since we don't have location in all requests, we skip this for now.
-        
+
         # 3. Sensitive Action check
         if event_type == "revoke":
             return False, 0.1, "User initiated revocation" # Not anomaly, but high importance
-            
+
         return False, 0.0, "Normal behavior"
 
+    def requests_last_hour(self, user_id):
+        activity = self.access_logs.get(user_id)
+        return activity.hour_count(time.time()) if activity else 0
+
+    def evict_idle(self, max_idle_seconds, limit):
+        """
+        Drop users with no activity in max_idle_seconds, checking at most
+        `limit` users per call so a sweep can be spread over many slices.
+        Returns: (evicted: int, pass_complete: bool)
+        """
+        if not self._sweep_queue:
+            self._sweep_queue = list(self.access_logs)
+        cutoff = time.time() - max_idle_seconds
+        evicted = 0
+        for _ in range(min(limit, len(self._sweep_queue))):
+            user_id = self._sweep_queue.pop()
+            activity = self.access_logs.get(user_id)
+            if activity is not None and activity.last_seen < cutoff:
+                self.access_logs.pop(user_id, None)
+                evicted += 1
+        return evicted, not self._sweep_queue
+
 ai_engine = AnomalyDetector()
@@ -1,51 +1,156 @@
 
-import hashlib
 import json
+import logging
 import time
+from itertools import islice
+
+from config import LEDGER_FSYNC_INTERVAL, LEDGER_INDEX_PATH, LEDGER_PATH
+from services.ledger_blocks import hash_block, verify_block
+from services.ledger_file import LedgerFile
+from services.ledger_index import LedgerIndex
+from services.merkle import inclusion_proof, leaf_hash, merkle_root, tree_levels
+
+logger = logging.getLogger(__name__)
+
+INDEX_CATCH_UP_BLOCKS = 10000
+
 
 class BlockchainService:
-    def __init__(self):
-        self.chain = []
-        self.create_block(previous_hash="0", data="Genesis Block")
-        
-    def create_block(self, previous_hash, data):
-        block = {
-            "index": len(self.chain) + 1,
-            "timestamp": time.time(),
-            "data": data,
-            "previous_hash": previous_hash,
-            "hash": ""
-        }
-        block["hash"] = self.hash_block(block)
-        self.chain.append(block)
+    """
+    Hash-linked audit ledger persisted in an append-only LedgerFile. Only the
+    tail block is cached, so memory does not grow with the chain and every
+    worker process appends to the same chain.
+
+    Each block batches transactions under a Merkle root; the block hash
+    covers the header (including merkle_root) but not the transactions
+    themselves, so one transaction can be proven with its Merkle path and
+    the header alone.
+
+    With a LedgerIndex, transactions can be looked up by user and event type
+    (query) without scanning the chain.
+    """
+
+    def __init__(self, ledger: LedgerFile, index: LedgerIndex = None):
+        self.ledger = ledger
+        self.index = index
+        self._tail = None  # (record count, last block) as last seen by this process
+        with self.ledger.transaction():
+            if self.ledger.count() == 0:
+                self.create_block(previous_hash="0", transactions=[{"event": "GENESIS"}])
+            elif self.index is not None:
+                self._catch_up()
+
+    def create_block(self, previous_hash, transactions, leaves=None):
+        leaves = leaves or [leaf_hash(tx) for tx in transactions]
+        with self.ledger.transaction():
+            block = {
+                "index": self.ledger.count() + 1,
+                "timestamp": time.time(),
+                "merkle_root": merkle_root(leaves).hex(),
+                "tx_count": len(transactions),
+                "previous_hash": previous_hash,
+                "hash": ""
+            }
+            block["hash"] = self.hash_block(block)
+            block["transactions"] = transactions
+            position = self.ledger.append(json.dumps(block, separators=(",", ":")).encode())
+            self._tail = (position + 1, block)
+            if self.index is not None:
+                try:
+                    self._catch_up(block)
+                except Exception:
+                    # The block is already on the ledger; the next append indexes it
+                    logger.exception("Indexing block %d failed", block["index"])
         return block
-        
+
+    def _catch_up(self, latest=None):
+        """Index every block past the index's high-water mark; called with the ledger locked"""
+        start = self.index.indexed() + 1
+        stop = latest["index"] if latest else len(self) + 1
+        if stop - start > INDEX_CATCH_UP_BLOCKS:
+            logger.info("Indexing ledger blocks %d-%d", start, stop - 1)
+        blocks = self.iter_blocks(start, stop)
+        while True:
+            batch = list(islice(blocks, INDEX_CATCH_UP_BLOCKS))
+            if not batch:
+                break
+            self.index.add(batch)
+        if latest is not None:
+            self.index.add([latest])
+
     def hash_block(self, block):
-        encoded_block = json.dumps(block, sort_keys=True).encode()
-        return hashlib.sha256(encoded_block).hexdigest()
-        
+        return hash_block(block)
+
+    def last_block(self):
+        count = self.ledger.count()
+        if self._tail is None or self._tail[0] != count:
+            self._tail = (count, json.loads(self.ledger.read(count - 1)))
+        return self._tail[1]
+
+    def add_transactions(self, transactions):
+        """Append one block holding `transactions`; returns a receipt per transaction"""
+        leaves = [leaf_hash(tx) for tx in transactions]
+        with self.ledger.transaction():
+            previous_hash = self.last_block()["hash"]
+            block = self.create_block(previous_hash, transactions, leaves)
+        return [{"tx_id": leaf.hex(), "block": block["index"], "position": i}
+                for i, leaf in enumerate(leaves)]
+
     def add_transaction(self, transaction_data):
-        previous_block = self.chain[-1]
-        previous_hash = previous_block["hash"]
-        return self.create_block(previous_hash, transaction_data)
-        
+        return self.add_transactions([transaction_data])[0]
+
+    def __len__(self):
+        return self.ledger.count()
+
+    def get_block(self, index):
+        """Block by its 1-based index"""
+        if not 1 <= index <= len(self):
+            raise IndexError(f"No block {index}")
+        return json.loads(self.ledger.read(index - 1))
+
+    def inclusion_proof(self, index, position):
+        """Merkle path proving transaction `position` of block `index`"""
+        block = self.get_block(index)
+        transactions = block.get("transactions")
+        if transactions is None:
+            raise LookupError(f"Block {index} predates Merkle batching")
+        if not 0 <= position < len(transactions):
+            raise IndexError(f"Block {index} has no transaction {position}")
+        levels = tree_levels([leaf_hash(tx) for tx in transactions])
+        header = {k: v for k, v in block.items() if k != "transactions"}
+        return {
+            "tx_id": levels[0][position].hex(),
+            "block": index,
+            "position": position,
+            "transaction": transactions[position],
+            "proof": inclusion_proof(levels, position),
+            "merkle_root": block["merkle_root"],
+            "block_header": header,
+        }
+
+    def query(self, user_id=None, event=None, since=None, until=None, cursor=None, limit=50):
+        """Indexed transactions by user, event type and time; see LedgerIndex.query"""
+        if self.index is None:
+            raise RuntimeError("Ledger queries need a LedgerIndex")
+        return self.index.query(user_id, event, since, until, cursor, limit)
+
+    def iter_blocks(self, start=1, stop=None):
+        """Blocks start..stop-1 (1-based) streamed from the ledger file"""
+        for payload in self.ledger.scan(start - 1, None if stop is None else stop - 1):
+            yield json.loads(payload)
+
     def get_chain(self):
-        return self.chain
-        
+        return list(self.iter_blocks())
+
     def is_chain_valid(self):
-        for i in range(1, len(self.chain)):
-            current_block = self.chain[i]
-            previous_block = self.chain[i-1]
-            
-            # Check if previous_hash reference is correct
-            if current_block["previous_hash"] != previous_block["hash"]:
+        """Recompute every block hash and link, serially (see ledger_verify.py for the parallel version)"""
+        previous_hash = "0"
+        for index, block in enumerate(self.iter_blocks(), start=1):
+            if verify_block(block, index, previous_hash) is not None:
                 return False
-                
-            # Check if hash is correct (re-calculate excluding hash field)
-            # Actually create_block sets hash. To verify, we'd need to re-hash.
-            # Simplified for demo.
-            pass
+            previous_hash = block["hash"]
         return True
 
+
 # Singleton instance
-blockchain = BlockchainService()
+blockchain = BlockchainService(LedgerFile(LEDGER_PATH, LEDGER_FSYNC_INTERVAL), LedgerIndex(LEDGER_INDEX_PATH))
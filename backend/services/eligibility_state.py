@@ -0,0 +1,115 @@
+"""
+Materialized eligibility dashboard kept fresh by incremental re-validation.
+
+FIELD_DEPENDENCIES maps each profile field to the services whose validation
+requirements or eligibility rules read it. When a profile is written, only
+the services depending on the changed fields are recomputed and stored; the
+rest are carried forward to the new profile version. Updates are pushed to
+subscribers as "eligibility" events.
+
+State is materialized on the first read for a user, so bulk writes to
+profiles nobody is looking at cost a single lookup each.
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, FrozenSet, Iterable, List
+
+from database import add_profile_listener, get_user
+from knowledge_base import COMPILED_RULES
+from routers.verification import verify_profile
+from services.event_bus import event_bus
+from services.result_cache import result_cache
+from services.validation import COMPILED_REQUIREMENTS, validate_profile_for_service
+from state_store import state_store
+
+SERVICES: List[str] = list(dict.fromkeys([*COMPILED_REQUIREMENTS, *COMPILED_RULES]))
+
+
+def build_dependencies() -> Dict[str, FrozenSet[str]]:
+    """Profile field -> services whose results can change when it changes"""
+    deps = defaultdict(set)
+    for service, req in COMPILED_REQUIREMENTS.items():
+        deps["security_level"].add(service)
+        for field, _ in req.fields + req.business_fields + req.documents + req.security_requirements:
+            deps[field].add(service)
+    for service, rules in COMPILED_RULES.items():
+        for rule in rules:
+            for field in rule.fields:
+                deps[field].add(service)
+    return {field: frozenset(services) for field, services in deps.items()}
+
+
+FIELD_DEPENDENCIES = build_dependencies()
+
+
+def affected_services(fields: Iterable[str]) -> List[str]:
+    affected = set()
+    for field in fields:
+        affected |= FIELD_DEPENDENCIES.get(field, frozenset())
+    return [s for s in SERVICES if s in affected]
+
+
+def service_state(user: Dict[str, Any], service: str) -> Dict[str, Any]:
+    """Dashboard summary of one service's validation and verification"""
+    state: Dict[str, Any] = {}
+    if service in COMPILED_REQUIREMENTS:
+        validation = result_cache.get_or_compute(
+            "validate", user, service, lambda: validate_profile_for_service(user, service))
+        state["valid"] = validation["valid"]
+        state["completion_percentage"] = validation["completion_percentage"]
+        state["missing"] = [f["field"] for f in validation["missing_fields"] + validation["missing_documents"]]
+    if service in COMPILED_RULES:
+        verification = result_cache.get_or_compute(
+            "verify", user, service, lambda: verify_profile(user, service))
+        state["eligible"] = verification["eligible"]
+        state["failed_rules"] = [r["rule_id"] for r in verification["results"] if r["status"] == "failed"]
+        state["warnings"] = verification["summary"]["warnings"]
+    return state
+
+
+def refresh(user: Dict[str, Any], services: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Recompute and store the given services for the profile's current version"""
+    version = user.get("_version", 0)
+    computed_on = date.today().isoformat()
+    states = {service: service_state(user, service) for service in services}
+    state_store.put_eligibility(user["user_id"], version, computed_on, states)
+    state_store.bump_eligibility_version(user["user_id"], version)
+    return {service: {**state, "version": version, "computed_on": computed_on}
+            for service, state in states.items()}
+
+
+def on_profile_write(user_id: str, version: int, changed: Dict[str, Any]):
+    """Profile listener: re-validate only the services the change can affect"""
+    if not state_store.has_eligibility(user_id):
+        return
+    user = get_user(user_id)
+    if user is None:
+        return
+    services = affected_services(changed)
+    if not services:
+        state_store.bump_eligibility_version(user_id, user["_version"])
+        return
+    updated = refresh(user, services)
+    event_bus.publish(user_id, "eligibility", {"version": user["_version"], "services": updated})
+
+
+def get_state(user_id: str) -> Dict[str, Any]:
+    """Stored dashboard state, recomputing services that are missing or stale"""
+    user = get_user(user_id) or {"user_id": user_id}
+    version = user.get("_version", 0)
+    today = date.today().isoformat()
+    stored = state_store.eligibility_for_user(user_id)
+    stale = [s for s in SERVICES
+             if s not in stored or stored[s]["version"] != version or stored[s]["computed_on"] != today]
+    if stale:
+        stored.update(refresh(user, stale))
+    return {
+        "user_id": user_id,
+        "version": version,
+        "eligible": [s for s in SERVICES if stored[s].get("eligible") and stored[s].get("valid")],
+        "services": {s: stored[s] for s in SERVICES},
+        "recomputed": stale,
+    }
+
+
+add_profile_listener(on_profile_write)
@@ -0,0 +1,90 @@
+"""
+In-process pub/sub for pushing task and ID status changes to clients.
+
+Endpoints publish from worker threads; every subscriber owns a bounded queue
+on the event loop. When a subscriber falls behind, its oldest events are
+dropped (and counted) so the publisher never waits on a slow consumer.
+"""
+import asyncio
+import itertools
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+from config import EVENT_BUFFER_SIZE
+
+
+class Subscription:
+    """One client's bounded event buffer"""
+
+    def __init__(self, user_id: str, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def _offer(self, event: Dict[str, Any]):
+        """Runs on the event loop; evicts the oldest event when full"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.published = 0
+
+    def subscribe(self, user_id: str) -> Subscription:
+        """Register a subscriber; must be called from the event loop"""
+        sub = Subscription(user_id, asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            self._subscribers[user_id].add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            subs = self._subscribers.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.user_id]
+
+    def publish(self, user_id: str, event_type: str, data: Dict[str, Any]):
+        """Fan an event out to the user's subscribers; safe from any thread, never blocks"""
+        with self._lock:
+            subs = list(self._subscribers.get(user_id, ()))
+        if not subs:
+            return
+        event = {"id": next(self._ids), "type": event_type, "at": datetime.now().isoformat(), "data": data}
+        self.published += 1
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub._offer, event)
+            except RuntimeError:  # loop already closed
+                self.unsubscribe(sub)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            subs = [s for group in self._subscribers.values() for s in group]
+        return {
+            "users": len({s.user_id for s in subs}),
+            "subscribers": len(subs),
+            "published": self.published,
+            "dropped": sum(s.dropped for s in subs),
+        }
+
+
+# Singleton instance
+event_bus = EventBus()
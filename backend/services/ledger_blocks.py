@@ -0,0 +1,35 @@
+"""
+Block hashing and validation for the audit ledger.
+
+Kept apart from services.blockchain so verification workers and the
+ledger_verify CLI can check blocks without opening the ledger for writing.
+"""
+import hashlib
+import json
+
+from services.merkle import leaf_hash, merkle_root
+
+
+def hash_block(block):
+    # Transactions are committed through merkle_root. Blocks written before
+    # Merkle batching hold a single event in "data", which is hashed as is.
+    header = {k: v for k, v in block.items() if k != "transactions"}
+    header["hash"] = ""
+    encoded_block = json.dumps(header, sort_keys=True).encode()
+    return hashlib.sha256(encoded_block).hexdigest()
+
+
+def verify_block(block, index, previous_hash):
+    """Why `block` is not a valid block `index` following `previous_hash`, or None"""
+    if block.get("index") != index:
+        return f"block {index} has index {block.get('index')}"
+    if block.get("previous_hash") != previous_hash:
+        return f"block {index} does not link to the block before it"
+    if hash_block(block) != block.get("hash"):
+        return f"block {index} hash does not match its contents"
+    transactions = block.get("transactions")
+    if transactions is not None:
+        if len(transactions) != block.get("tx_count") \
+                or merkle_root([leaf_hash(tx) for tx in transactions]).hex() != block.get("merkle_root"):
+            return f"block {index} transactions do not match its merkle_root"
+    return None
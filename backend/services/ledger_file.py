@@ -0,0 +1,220 @@
+"""
+Append-only record log backing the audit ledger.
+
+Records are stored in LEDGER_PATH as
+
+    [u32 length][u32 crc32][payload]
+
+and LEDGER_PATH.idx holds one u64 file offset per record, so record i is
+found without scanning. Both files are memory-mapped for reads and nothing
+proportional to their length is kept in memory.
+
+Writers take an exclusive lock on the log (flock, so every worker process
+appends to the same file) and the record count is the size of the index.
+Data is fsynced at most every `fsync_interval` seconds; after each fsync a
+recovery checkpoint (record count and log offset) is written. On open,
+records after the checkpoint are re-validated and re-indexed, and a torn
+tail left by a crash is truncated.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single worker
+    fcntl = None
+
+HEADER = struct.Struct(">II")
+OFFSET = struct.Struct(">Q")
+SCAN_FLUSH_ENTRIES = 65536
+
+logger = logging.getLogger(__name__)
+
+
+class LedgerFile:
+    def __init__(self, path: str, fsync_interval: float = 1.0, readonly: bool = False):
+        """`readonly` opens existing files for reading only, skipping recovery"""
+        self.path = path
+        self.index_path = path + ".idx"
+        self.checkpoint_path = path + ".ckpt"
+        self.fsync_interval = fsync_interval
+        if readonly:
+            flags = os.O_RDONLY
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            flags = os.O_RDWR | os.O_CREAT
+        self._log = os.open(path, flags, 0o644)
+        self._idx = os.open(self.index_path, flags, 0o644)
+        self._log_map: Optional[mmap.mmap] = None
+        self._idx_map: Optional[mmap.mmap] = None
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._tail = (0, 0)  # (record count, log end) after this process's last append
+        self._last_sync = time.monotonic()
+        self._unsynced = False
+        if not readonly:
+            with self.transaction():
+                self._recover()
+
+    def close(self):
+        os.close(self._log)
+        os.close(self._idx)
+
+    # ---- locking ----
+
+    @contextmanager
+    def transaction(self):
+        """Exclusive write access across threads and processes (re-entrant)"""
+        with self._lock:
+            if self._depth == 0 and fcntl is not None:
+                fcntl.flock(self._log, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+                if self._depth == 0 and fcntl is not None:
+                    fcntl.flock(self._log, fcntl.LOCK_UN)
+
+    # ---- reads ----
+
+    def _mapped(self, fd: int, current: Optional[mmap.mmap], needed: int) -> mmap.mmap:
+        """A read-only map of fd covering at least `needed` bytes, remapped as the file grows"""
+        if current is not None and len(current) >= needed:
+            return current
+        size = os.fstat(fd).st_size
+        if size < needed:
+            raise IndexError("read past the end of the ledger")
+        # Old maps are left to the garbage collector: another thread may still be reading one
+        return mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+
+    def count(self) -> int:
+        return os.fstat(self._idx).st_size // OFFSET.size
+
+    def offset(self, i: int) -> int:
+        self._idx_map = m = self._mapped(self._idx, self._idx_map, (i + 1) * OFFSET.size)
+        return OFFSET.unpack_from(m, i * OFFSET.size)[0]
+
+    def _record_at(self, offset: int) -> Tuple[bytes, int]:
+        """(payload, end offset) of the record starting at `offset`"""
+        self._log_map = m = self._mapped(self._log, self._log_map, offset + HEADER.size)
+        length, _ = HEADER.unpack_from(m, offset)
+        end = offset + HEADER.size + length
+        self._log_map = m = self._mapped(self._log, m, end)
+        return m[offset + HEADER.size:end], end
+
+    def read(self, i: int) -> bytes:
+        if i < 0:
+            i += self.count()
+        return self._record_at(self.offset(i))[0]
+
+    def scan(self, start: int = 0, stop: Optional[int] = None) -> Iterator[bytes]:
+        """Payloads of records start..stop-1, read sequentially from the log"""
+        stop = self.count() if stop is None else min(stop, self.count())
+        if start >= stop:
+            return
+        offset = self.offset(start)
+        for _ in range(start, stop):
+            payload, offset = self._record_at(offset)
+            yield payload
+
+    def _end(self, n: int) -> int:
+        """Log offset just past record n - 1"""
+        if self._tail[0] == n:
+            return self._tail[1]
+        return self._record_at(self.offset(n - 1))[1] if n else 0
+
+    # ---- writes ----
+
+    def append(self, payload: bytes) -> int:
+        """Append one record; returns its position. O(1) regardless of log length."""
+        with self.transaction():
+            n = self.count()
+            end = self._end(n)
+            record = HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+            os.pwrite(self._log, record, end)
+            if os.fstat(self._log).st_size > end + len(record):
+                # Leftovers of a writer that died before indexing its record
+                os.ftruncate(self._log, end + len(record))
+            os.pwrite(self._idx, OFFSET.pack(end), n * OFFSET.size)
+            self._tail = (n + 1, end + len(record))
+            self._unsynced = True
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync(n + 1, end + len(record))
+            return n
+
+    def flush(self):
+        """fsync outstanding appends and write a checkpoint"""
+        with self.transaction():
+            if self._unsynced:
+                n = self.count()
+                self._sync(n, self._end(n))
+
+    def _sync(self, count: int, offset: int):
+        os.fsync(self._log)
+        os.fsync(self._idx)
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"records": count, "offset": offset}, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, self.checkpoint_path)
+        self._last_sync = time.monotonic()
+        self._unsynced = False
+
+    # ---- recovery ----
+
+    def _checkpoint(self) -> Tuple[int, int]:
+        """(records, offset) of the last checkpoint still consistent with the files"""
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as fh:
+                checkpoint = json.load(fh)
+            records, offset = int(checkpoint["records"]), int(checkpoint["offset"])
+            if records <= self.count() and offset <= os.fstat(self._log).st_size \
+                    and self._end(records) == offset:
+                return records, offset
+        except (OSError, ValueError, KeyError, IndexError, struct.error):
+            pass
+        return 0, 0
+
+    def _recover(self):
+        """Re-index every intact record after the checkpoint and drop a torn tail"""
+        records, offset = self._checkpoint()
+        size = os.fstat(self._log).st_size
+        os.ftruncate(self._idx, records * OFFSET.size)
+        self._idx_map = None
+        n, pos = records, offset
+        if size > offset:
+            with mmap.mmap(self._log, size, access=mmap.ACCESS_READ) as m:
+                entries = bytearray()
+                while pos + HEADER.size <= size:
+                    length, crc = HEADER.unpack_from(m, pos)
+                    end = pos + HEADER.size + length
+                    if end > size or zlib.crc32(m[pos + HEADER.size:end]) != crc:
+                        break
+                    entries += OFFSET.pack(pos)
+                    pos = end
+                    if len(entries) >= SCAN_FLUSH_ENTRIES * OFFSET.size:
+                        n = self._write_entries(n, entries)
+                n = self._write_entries(n, entries)
+        if pos < size:
+            logger.warning("Ledger %s: truncating %d bytes of incomplete records", self.path, size - pos)
+            os.ftruncate(self._log, pos)
+        self._log_map = None
+        self._tail = (n, pos)
+        if n != records or pos != offset:
+            self._sync(n, pos)
+
+    def _write_entries(self, n: int, entries: bytearray) -> int:
+        os.pwrite(self._idx, bytes(entries), n * OFFSET.size)
+        n += len(entries) // OFFSET.size
+        entries.clear()
+        return n
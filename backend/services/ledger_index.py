@@ -0,0 +1,154 @@
+"""
+Secondary indexes over the audit ledger.
+
+Every transaction gets one row in LEDGER_INDEX_PATH (SQLite, WAL) keyed by
+(block, position), carrying its user, event type, block time and a copy of
+its canonical JSON. Indexes on (user_id, ...), (event, ...) and
+(user_id, event, ...) plus block times keep a page at O(log n + page)
+however long the chain grows, without reading blocks back from the log.
+
+Rows are written by BlockchainService while it still holds the ledger lock,
+so the highest indexed block is a high-water mark shared by every worker.
+Each write first indexes anything between that mark and the new block,
+which covers blocks appended by a process that died before indexing them,
+and an existing ledger is indexed in full on first open.
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from services.merkle import canonical, leaf_hash
+from state_store import decode_cursor, encode_cursor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger_blocks (
+    block INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ledger_blocks_by_time ON ledger_blocks (timestamp);
+
+CREATE TABLE IF NOT EXISTS ledger_tx (
+    block INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    user_id TEXT,
+    event TEXT,
+    timestamp REAL NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (block, position)
+);
+CREATE INDEX IF NOT EXISTS ledger_tx_by_user ON ledger_tx (user_id, block, position);
+CREATE INDEX IF NOT EXISTS ledger_tx_by_event ON ledger_tx (event, block, position);
+CREATE INDEX IF NOT EXISTS ledger_tx_by_user_event ON ledger_tx (user_id, event, block, position);
+"""
+
+
+def transactions_of(block: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """A block's transactions; blocks from before Merkle batching hold one event in "data" """
+    if "transactions" in block:
+        return block["transactions"]
+    return [block["data"]] if isinstance(block.get("data"), dict) else []
+
+
+def _row(block: Dict[str, Any], position: int, tx: Dict[str, Any]) -> tuple:
+    # Anomaly events name their subject "user", everything else "user_id"
+    user_id = tx.get("user_id", tx.get("user"))
+    event = tx.get("event")
+    return (block["index"], position, None if user_id is None else str(user_id),
+            None if event is None else str(event), block["timestamp"], canonical(tx).decode())
+
+
+class LedgerIndex:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections are not shareable"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def indexed(self) -> int:
+        """Highest block indexed so far (0 when empty)"""
+        return self._conn().execute("SELECT max(block) FROM ledger_blocks").fetchone()[0] or 0
+
+    def add(self, blocks: Iterable[Dict[str, Any]]) -> int:
+        """Index `blocks` in one transaction; returns the number of transactions written"""
+        blocks = list(blocks)
+        rows = [_row(block, position, tx) for block in blocks for position, tx in enumerate(transactions_of(block))]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO ledger_blocks VALUES (?, ?)",
+                             [(block["index"], block["timestamp"]) for block in blocks])
+            conn.executemany("INSERT OR IGNORE INTO ledger_tx VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def _block_bound(self, timestamp: float, after: bool) -> Optional[int]:
+        """
+        First block stamped at or after `timestamp` (strictly after if `after`).
+        Blocks are stamped under the ledger lock, so their times only go
+        backwards if the wall clock does.
+        """
+        op = ">" if after else ">="
+        row = self._conn().execute(
+            f"SELECT block FROM ledger_blocks WHERE timestamp {op} ? ORDER BY timestamp LIMIT 1",
+            (timestamp,)).fetchone()
+        return row[0] if row else None
+
+    def query(self, user_id: Optional[str] = None, event: Optional[str] = None,
+              since: Optional[float] = None, until: Optional[float] = None,
+              cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Transactions matching the filters, newest first, from blocks stamped
+        within [since, until] (epoch seconds); returns (items, next_cursor).
+        """
+        sql = "SELECT block, position, timestamp, data FROM ledger_tx WHERE true"
+        params: list = []
+        if since is not None:
+            first = self._block_bound(since, after=False)
+            if first is None:
+                return [], None
+            sql += " AND block >= ?"
+            params.append(first)
+        if until is not None:
+            past = self._block_bound(until, after=True)
+            if past is not None:
+                sql += " AND block < ?"
+                params.append(past)
+        if user_id is not None:
+            sql += " AND user_id = ?"
+            params.append(user_id)
+        if event is not None:
+            sql += " AND event = ?"
+            params.append(event)
+        if cursor:
+            before = decode_cursor(cursor)
+            if len(before) != 2 or not all(isinstance(v, int) for v in before):
+                raise ValueError(f"Invalid cursor: {cursor}")
+            sql += " AND (block, position) < (?, ?)"
+            params.extend(before)
+        sql += " ORDER BY block DESC, position DESC LIMIT ?"
+        rows = self._conn().execute(sql, params + [limit + 1]).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][0], rows[-1][1])
+        items = []
+        for block, position, timestamp, data in rows:
+            tx = json.loads(data)
+            items.append({"tx_id": leaf_hash(tx).hex(), "block": block, "position": position,
+                          "timestamp": timestamp, "transaction": tx})
+        return items, next_cursor
@@ -0,0 +1,162 @@
+"""
+Group commit for the audit ledger.
+
+Request handlers hand transactions to LedgerWriter.submit() and get a
+Future back. One background thread drains the queue into blocks: a block is
+sealed once LEDGER_BATCH_SIZE transactions are waiting or LEDGER_BATCH_DELAY
+seconds after the first of them arrived, whichever comes first. Canonical
+encoding, Merkle hashing and the file append all happen on that thread, once
+per block rather than once per event.
+
+A future resolves to the transaction's receipt (tx_id, block, position)
+when its block has been appended to the ledger file, which makes it visible
+to every worker; the file itself is fsynced on the ledger's own interval.
+Appends only fsync when that interval has passed, so the thread also
+flushes once it has been idle for an interval, and the last blocks before a
+quiet spell are not left unsynced until the next write.
+Callers that need the receipt wait on the future; the rest can ignore it.
+submit_many() queues transactions as one unit that always lands in a single
+block, for events that must not be recorded apart. The queue is bounded, so
+a burst larger than LEDGER_QUEUE_SIZE submissions makes submit() wait
+instead of growing memory.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import LEDGER_BATCH_DELAY, LEDGER_BATCH_SIZE, LEDGER_QUEUE_SIZE
+from services.blockchain import BlockchainService, blockchain
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class LedgerWriter:
+    def __init__(self, chain: BlockchainService, max_batch: int = LEDGER_BATCH_SIZE,
+                 max_delay: float = LEDGER_BATCH_DELAY, queue_size: int = LEDGER_QUEUE_SIZE):
+        self.chain = chain
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.blocks = 0
+        self.transactions = 0
+        self.largest_batch = 0
+        self.failures = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+                    self._thread.start()
+
+    def submit(self, transaction: Dict[str, Any]) -> Future:
+        """Queue a transaction; the future resolves to its receipt once committed"""
+        return self.submit_many([transaction])[0]
+
+    def submit_many(self, transactions: List[Dict[str, Any]]) -> List[Future]:
+        """Queue transactions to be committed together, in order, in the same block"""
+        self._ensure_started()
+        group = []
+        for transaction in transactions:
+            future: Future = Future()
+            future.set_running_or_notify_cancel()  # queued work cannot be cancelled
+            group.append((transaction, future))
+        self._queue.put(group)
+        return [future for _, future in group]
+
+    def commit(self, transaction: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Queue a transaction and wait for its receipt"""
+        return self.submit(transaction).result(timeout)
+
+    def commit_many(self, transactions: List[Dict[str, Any]],
+                    timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Queue transactions as one unit and wait for their receipts (all in one block)"""
+        return [f.result(timeout) for f in self.submit_many(transactions)]
+
+    def _collect(self, first) -> Tuple[List[Tuple[Dict[str, Any], Future]], Optional[list], bool]:
+        """
+        Gather a batch starting with the group `first`; returns (batch, group
+        held over for the next batch, stop requested). Groups are never split,
+        so one that would overflow the batch starts the next one instead.
+        """
+        batch = list(first)
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is _STOP:
+                return batch, None, True
+            if len(batch) + len(item) > self.max_batch:
+                return batch, item, False
+            batch.extend(item)
+        return batch, None, False
+
+    def _run(self):
+        stopping = False
+        held = None
+        while not stopping:
+            if held is not None:
+                first, held = held, None
+            else:
+                try:
+                    first = self._queue.get(timeout=self.chain.ledger.fsync_interval)
+                except queue.Empty:
+                    self._flush()
+                    continue
+                if first is _STOP:
+                    break
+            batch, held, stopping = self._collect(first)
+            self._write(batch)
+
+    def _write(self, batch: List[Tuple[Dict[str, Any], Future]]):
+        try:
+            receipts = self.chain.add_transactions([tx for tx, _ in batch])
+        except Exception as e:
+            logger.exception("Ledger write of %d transactions failed", len(batch))
+            self.failures += 1
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.blocks += 1
+        self.transactions += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for (_, future), receipt in zip(batch, receipts):
+            future.set_result(receipt)
+
+    def _flush(self):
+        try:
+            self.chain.ledger.flush()
+        except Exception:
+            logger.exception("Ledger flush failed")
+
+    def close(self, timeout: Optional[float] = None):
+        """Commit everything queued, then stop the writer thread"""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"blocks": self.blocks, "transactions": self.transactions, "queued": self._queue.qsize(),
+                "largest_batch": self.largest_batch, "failures": self.failures,
+                "chain_length": len(self.chain)}
+
+
+# Singleton instance
+ledger_writer = LedgerWriter(blockchain)
@@ -0,0 +1,67 @@
+"""
+Merkle trees over ledger transactions.
+
+Leaves are SHA-256 of 0x00 + the transaction's canonical JSON (sorted keys,
+no whitespace); interior nodes are SHA-256 of 0x01 + left + right. The
+prefixes keep a leaf from being passed off as an interior node. A node
+without a sibling is carried up to the next level unchanged instead of
+being paired with a copy of itself.
+
+An inclusion proof is the list of sibling hashes from the leaf to the root,
+each marked with the side it sits on, so a verifier needs only the
+transaction, the proof and the block's merkle_root: O(log n) hashes.
+"""
+import hashlib
+import json
+from typing import Any, Dict, List
+
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def canonical(transaction: Any) -> bytes:
+    return json.dumps(transaction, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def leaf_hash(transaction: Any) -> bytes:
+    return hashlib.sha256(LEAF_PREFIX + canonical(transaction)).digest()
+
+
+def _node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def tree_levels(leaves: List[bytes]) -> List[List[bytes]]:
+    """Every level of the tree, leaves first and the root level last"""
+    levels = [leaves or [hashlib.sha256(b"").digest()]]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def merkle_root(leaves: List[bytes]) -> bytes:
+    return tree_levels(leaves)[-1][0]
+
+
+def inclusion_proof(levels: List[List[bytes]], position: int) -> List[Dict[str, str]]:
+    """Sibling hashes from leaf `position` up to the root"""
+    proof = []
+    for level in levels[:-1]:
+        sibling = position ^ 1
+        if sibling < len(level):
+            proof.append({"hash": level[sibling].hex(), "side": "left" if sibling < position else "right"})
+        position //= 2
+    return proof
+
+
+def verify_proof(transaction: Any, proof: List[Dict[str, str]], root: str) -> bool:
+    """Check that `transaction` is included under the hex `root`"""
+    node = leaf_hash(transaction)
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        node = _node(sibling, node) if step["side"] == "left" else _node(node, sibling)
+    return node.hex() == root
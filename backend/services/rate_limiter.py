@@ -0,0 +1,264 @@
+"""
+Rate limits shared by every worker process.
+
+Limits use GCRA (the generic cell rate algorithm, equivalent to a token
+bucket): each key stores its theoretical arrival time (TAT). A request is
+allowed when pushing the TAT forward by one emission interval keeps it
+within `burst` intervals of now. State lives in a backend chosen by
+RATE_LIMIT_BACKEND:
+
+- "sqlite": a small WAL database next to the other runtime state. A check
+  is a single upsert, so it is atomic across processes without explicit
+  locking.
+- "redis": any Redis-compatible server, updated by a Lua script.
+- "memory": per-process only, for single-worker runs and tests.
+
+Backends implement `update(now, checks)`, applying several limits in one
+round trip; anything with that method can be passed to RateLimiter. A
+backend that cannot answer in time raises LimiterBusy.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import redis
+except ImportError:  # optional dependency
+    redis = None
+
+from config import (
+    RATE_LIMITS, RATE_LIMIT_BACKEND, RATE_LIMIT_BUSY_TIMEOUT, RATE_LIMIT_DB_PATH, RATE_LIMIT_REDIS_URL,
+)
+
+
+class LimiterBusy(Exception):
+    """The backend could not be updated within its timeout"""
+
+
+@dataclass(frozen=True, slots=True)
+class Limit:
+    """`rate` requests per `period` seconds, allowing bursts of `burst`"""
+    rate: int
+    period: float
+    burst: int
+
+    @property
+    def interval(self) -> float:
+        return self.period / self.rate
+
+    @property
+    def capacity(self) -> float:
+        return self.interval * self.burst
+
+
+@dataclass(frozen=True, slots=True)
+class Decision:
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+# (key, interval, capacity) for each limit being checked
+Check = Tuple[str, float, float]
+
+
+class MemoryBackend:
+    """Process-local TAT table"""
+
+    def __init__(self):
+        self._tats: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def update(self, now: float, checks: Sequence[Check]) -> List[Tuple[bool, float]]:
+        results = []
+        with self._lock:
+            for key, interval, capacity in checks:
+                tat = max(self._tats.get(key, now), now) + interval
+                if tat - now > capacity:
+                    results.append((False, tat - interval))
+                else:
+                    self._tats[key] = tat
+                    results.append((True, tat))
+        return results
+
+    def expire(self, now: float, limit: int) -> int:
+        with self._lock:
+            stale = [k for k, tat in self._tats.items() if tat <= now][:limit]
+            for key in stale:
+                del self._tats[key]
+            return len(stale)
+
+    def count(self) -> int:
+        return len(self._tats)
+
+
+class SQLiteBackend:
+    """
+    TAT table in SQLite. One upsert covers every limit in a check: a row only
+    changes when its limit allows the request, and RETURNING reports which
+    rows did. Durability is not needed (losing the file resets limits), so
+    synchronous is off. Writers wait at most `timeout` seconds for the lock,
+    since the caller is usually the event loop.
+    """
+
+    def __init__(self, path: str, timeout: float = RATE_LIMIT_BUSY_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._statements: Dict[int, str] = {}
+        # Setup may race other workers starting up, so it gets a patient connection
+        with closing(sqlite3.connect(self.path, timeout=5, isolation_level=None)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS gcra (key TEXT PRIMARY KEY, tat REAL NOT NULL, "
+                         "interval REAL NOT NULL, capacity REAL NOT NULL) WITHOUT ROWID")
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections are not shareable"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("PRAGMA mmap_size=67108864")
+            self._local.conn = conn
+        return conn
+
+    def _statement(self, n: int) -> str:
+        sql = self._statements.get(n)
+        if sql is None:
+            values = ", ".join(f"(?{3 * i + 2}, ?{3 * i + 3}, ?{3 * i + 4})" for i in range(n))
+            sql = self._statements[n] = (
+                f"WITH checks (key, interval, capacity) AS (VALUES {values}) "
+                "INSERT INTO gcra (key, tat, interval, capacity) "
+                "SELECT key, ?1 + interval, interval, capacity FROM checks WHERE true "
+                "ON CONFLICT (key) DO UPDATE SET tat = max(tat, ?1) + excluded.interval, "
+                "interval = excluded.interval, capacity = excluded.capacity "
+                "WHERE max(tat, ?1) + excluded.interval - ?1 <= excluded.capacity "
+                "RETURNING key, tat"
+            )
+        return sql
+
+    def update(self, now: float, checks: Sequence[Check]) -> List[Tuple[bool, float]]:
+        conn = self._conn()
+        params = [now]
+        for check in checks:
+            params.extend(check)
+        try:
+            allowed = dict(conn.execute(self._statement(len(checks)), params).fetchall())
+        except sqlite3.OperationalError as e:
+            raise LimiterBusy(str(e)) from e
+        results = []
+        for key, _, _ in checks:
+            if key in allowed:
+                results.append((True, allowed[key]))
+            else:
+                row = conn.execute("SELECT tat FROM gcra WHERE key = ?", (key,)).fetchone()
+                results.append((False, row[0] if row else now))
+        return results
+
+    def expire(self, now: float, limit: int) -> int:
+        return self._conn().execute(
+            "DELETE FROM gcra WHERE key IN (SELECT key FROM gcra WHERE tat <= ? LIMIT ?)",
+            (now, limit)).rowcount
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM gcra").fetchone()[0]
+
+
+class RedisBackend:
+    """TAT per key in a Redis-compatible server; keys expire with their TAT"""
+
+    SCRIPT = """
+local now = tonumber(ARGV[1])
+local results = {}
+for i, key in ipairs(KEYS) do
+    local interval = tonumber(ARGV[2 * i])
+    local tat = math.max(tonumber(redis.call('GET', key) or ARGV[1]), now) + interval
+    if tat - now > tonumber(ARGV[2 * i + 1]) then
+        results[i] = {0, tostring(tat - interval)}
+    else
+        redis.call('SET', key, tostring(tat), 'PX', math.ceil((tat - now) * 1000))
+        results[i] = {1, tostring(tat)}
+    end
+end
+return results
+"""
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+
+    def update(self, now: float, checks: Sequence[Check]) -> List[Tuple[bool, float]]:
+        args = [repr(now)]
+        for _, interval, capacity in checks:
+            args += [repr(interval), repr(capacity)]
+        results = self._script(keys=[self.prefix + key for key, _, _ in checks], args=args)
+        return [(bool(allowed), float(tat)) for allowed, tat in results]
+
+    def expire(self, now: float, limit: int) -> int:
+        return 0  # Redis expires keys itself
+
+    def count(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+
+class RateLimiter:
+    """Named limits checked against one shared backend"""
+
+    def __init__(self, backend, limits: Dict[str, Limit]):
+        self.backend = backend
+        self.limits = limits
+        self.allowed = 0
+        self.denied = 0
+
+    def check_many(self, checks: Sequence[Tuple[str, str]], now: Optional[float] = None) -> List[Decision]:
+        """Check several (limit name, key) pairs in one backend round trip"""
+        now = time.time() if now is None else now
+        limits = [self.limits[name] for name, _ in checks]
+        results = self.backend.update(now, [(f"{name}:{key}", limit.interval, limit.capacity)
+                                            for (name, key), limit in zip(checks, limits)])
+        decisions = []
+        for limit, (allowed, tat) in zip(limits, results):
+            if allowed:
+                self.allowed += 1
+                decisions.append(Decision(True, int((limit.capacity - (tat - now)) / limit.interval + 1e-9), 0.0))
+            else:
+                self.denied += 1
+                decisions.append(Decision(False, 0, tat + limit.interval - limit.capacity - now))
+        return decisions
+
+    def check(self, name: str, key: str, now: Optional[float] = None) -> Decision:
+        return self.check_many([(name, key)], now)[0]
+
+    def allow(self, name: str, key: str) -> bool:
+        return self.check(name, key).allowed
+
+    def expire(self, limit: int) -> int:
+        """Drop keys whose bucket has refilled completely"""
+        return self.backend.expire(time.time(), limit)
+
+    def stats(self) -> Dict[str, object]:
+        return {"backend": type(self.backend).__name__, "keys": self.backend.count(),
+                "allowed": self.allowed, "denied": self.denied}
+
+
+def create_backend(kind: str = RATE_LIMIT_BACKEND):
+    if kind == "sqlite":
+        return SQLiteBackend(RATE_LIMIT_DB_PATH)
+    if kind == "redis":
+        return RedisBackend(RATE_LIMIT_REDIS_URL)
+    if kind == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {kind}")
+
+
+# Singleton instance
+rate_limiter = RateLimiter(create_backend(), {name: Limit(*spec) for name, spec in RATE_LIMITS.items()})
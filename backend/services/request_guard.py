@@ -0,0 +1,204 @@
+"""
+Per-route rate limiting and anomaly screening for every request.
+
+RequestGuardMiddleware is plain ASGI middleware, so it runs before Starlette
+builds a Request, reads the body or calls the route. The caller's identity
+(user_id query parameter and client address) is resolved once and left in
+scope["state"] for handlers as `request.state.identity`. The route's policy
+(ROUTE_POLICIES) decides which shared rate limits apply and whether the
+anomaly detector runs. Both are keyed by user only when the request names
+one; anonymous requests get the "ip" limit alone rather than all sharing
+one bucket. Every limit for a request, including the detector's shared
+frequency limit, goes to the rate limiter in a single check.
+
+A route whose caller is authenticated further in (request signatures) must
+not let an unverified request spend a user's limits or feed the anomaly
+detector under a user_id it merely claims. For paths matching `defer`,
+RequestGuardMiddleware applies only the "ip" limit, and
+DeferredGuardMiddleware, mounted inside the authentication middleware,
+applies the rest of the policy once the request has passed it.
+
+The check is synchronous: it is one short SQLite statement, cheaper than
+handing it to a worker thread. It waits at most RATE_LIMIT_BUSY_TIMEOUT for
+a locked database; past that the request is refused with 503.
+"""
+import json
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from starlette.datastructures import QueryParams
+
+from config import ROUTE_POLICIES
+from services.ai_engine import ai_engine
+from services.rate_limiter import LimiterBusy, rate_limiter
+
+
+@dataclass(frozen=True, slots=True)
+class Policy:
+    limits: Tuple[str, ...] = ()
+    anomaly: Optional[str] = None
+    anomaly_action: str = "block"
+
+
+@dataclass(frozen=True, slots=True)
+class Identity:
+    user_id: Optional[str]
+    ip: str
+
+
+@dataclass(frozen=True, slots=True)
+class Rejection:
+    reason: str
+    detail: str
+    retry_after: float = 0.0
+    status: int = 429
+
+
+def resolve_identity(scope: Dict[str, Any]) -> Identity:
+    client = scope.get("client")
+    user_id = QueryParams(scope.get("query_string", b"")).get("user_id") or None
+    return Identity(user_id, client[0] if client else "unknown")
+
+
+class RequestGuard:
+    """Route policy lookup and screening, shared by every middleware instance"""
+
+    def __init__(self, policies: Dict[str, Dict[str, Any]]):
+        self.policies = {
+            prefix.rstrip("/") or "/": Policy(tuple(spec.get("limits", ())), spec.get("anomaly"),
+                                              spec.get("anomaly_action", "block"))
+            for prefix, spec in policies.items()
+        }
+        unknown = {name for p in self.policies.values() for name in p.limits} - set(rate_limiter.limits)
+        if unknown:
+            raise ValueError(f"Route policies use undefined rate limits: {', '.join(sorted(unknown))}")
+        self.policy_for = lru_cache(maxsize=4096)(self._match)
+        self.split_for = lru_cache(maxsize=4096)(self._split)
+        self.screened = 0
+        self.rejected: Dict[str, int] = {}
+
+    def _match(self, path: str) -> Policy:
+        """Policy of the longest configured prefix, walking up one segment at a time"""
+        path = path.rstrip("/") or "/"
+        while path not in self.policies:
+            if path == "/":
+                return Policy()
+            path = path.rsplit("/", 1)[0] or "/"
+        return self.policies[path]
+
+    def _split(self, path: str) -> Tuple[Policy, Policy]:
+        """The path's policy as (checks on the client address, checks on the claimed user)"""
+        policy = self.policy_for(path)
+        return (Policy(tuple(name for name in policy.limits if name == "ip")),
+                Policy(tuple(name for name in policy.limits if name != "ip"), policy.anomaly,
+                       policy.anomaly_action))
+
+    def screen(self, policy: Policy, identity: Identity, state: Dict[str, Any]) -> Optional[Rejection]:
+        self.screened += 1
+        checks = []
+        for name in policy.limits:
+            key = identity.ip if name == "ip" else identity.user_id
+            if key is not None:
+                checks.append((name, key))
+        limit_checks = len(checks)
+        check_anomaly = policy.anomaly is not None and identity.user_id is not None
+        if check_anomaly:
+            checks.append(("anomaly", identity.user_id))
+        if not checks:
+            return None
+
+        try:
+            decisions = rate_limiter.check_many(checks)
+        except LimiterBusy:
+            return self._reject("busy", "Rate limiter busy, retry shortly", 1.0, status=503)
+        for (name, _), decision in zip(checks[:limit_checks], decisions):
+            if not decision.allowed:
+                return self._reject(name, f"Rate limit exceeded ({name})", decision.retry_after)
+
+        if check_anomaly:
+            result = ai_engine.check_behavior(identity.user_id, policy.anomaly, shared_ok=decisions[-1].allowed)
+            state["anomaly"] = result
+            if result[0] and policy.anomaly_action == "block":
+                return self._reject("anomaly", result[2], decisions[-1].retry_after)
+        return None
+
+    def _reject(self, reason: str, detail: str, retry_after: float, status: int = 429) -> Rejection:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return Rejection(reason, detail, retry_after, status)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"screened": self.screened, "rejected": dict(self.rejected),
+                "policy_cache": self.policy_for.cache_info()._asdict()}
+
+
+class RequestGuardMiddleware:
+    """
+    ASGI middleware applying the shared RequestGuard to HTTP requests; on
+    paths matching `defer` only the "ip" limit, leaving the rest to
+    DeferredGuardMiddleware
+    """
+
+    def __init__(self, app, guard: Optional[RequestGuard] = None,
+                 defer: Optional[Callable[[str], bool]] = None):
+        self.app = app
+        self.guard = guard or request_guard
+        self.defer = defer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        identity = resolve_identity(scope)
+        state = scope.setdefault("state", {})
+        state["identity"] = identity
+        path = scope["path"]
+        if self.defer is not None and self.defer(path):
+            policy = self.guard.split_for(path)[0]
+        else:
+            policy = self.guard.policy_for(path)
+        if policy.limits or policy.anomaly:
+            rejection = self.guard.screen(policy, identity, state)
+            if rejection is not None:
+                return await _send_rejection(send, rejection)
+        await self.app(scope, receive, send)
+
+
+class DeferredGuardMiddleware:
+    """
+    ASGI middleware applying what RequestGuardMiddleware deferred on paths
+    matching `defer`: the user limits and anomaly screening, once the
+    middleware outside this one has authenticated the request
+    """
+
+    def __init__(self, app, defer: Callable[[str], bool], guard: Optional[RequestGuard] = None):
+        self.app = app
+        self.guard = guard or request_guard
+        self.defer = defer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.defer(scope["path"]):
+            return await self.app(scope, receive, send)
+
+        state = scope.setdefault("state", {})
+        identity = state.get("identity") or resolve_identity(scope)
+        policy = self.guard.split_for(scope["path"])[1]
+        if policy.limits or policy.anomaly:
+            rejection = self.guard.screen(policy, identity, state)
+            if rejection is not None:
+                return await _send_rejection(send, rejection)
+        await self.app(scope, receive, send)
+
+
+async def _send_rejection(send, rejection: Rejection):
+    body = json.dumps({"detail": rejection.detail}).encode("utf-8")
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    if rejection.retry_after > 0:
+        headers.append((b"retry-after", str(math.ceil(rejection.retry_after)).encode()))
+    await send({"type": "http.response.start", "status": rejection.status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+# Singleton instance
+request_guard = RequestGuard(ROUTE_POLICIES)
@@ -0,0 +1,268 @@
+"""
+HMAC request signatures for routes under SIGNED_ROUTE_PREFIXES.
+
+A signed request carries X-Timestamp (milliseconds since the epoch) and
+X-Signature, the hex HMAC-SHA256 of
+
+    METHOD \\n PATH[?QUERY] \\n TIMESTAMP \\n hex SHA-256 of the body
+
+under one of REQUEST_SIGNING_SECRETS. Each secret is keyed into an HMAC
+object once at startup and copied per request, and every secret is compared
+in constant time so rotation does not leak which key matched.
+
+RequestSignatureMiddleware is plain ASGI. Missing headers, a timestamp
+outside SIGNATURE_MAX_SKEW and an already seen signature are rejected
+before the body is read. The body is hashed as it arrives and buffered
+exactly once (in memory, spilling to disk past SIGNATURE_SPOOL_BYTES), then
+replayed to the route, which therefore never sees an unverified byte. A body
+over SIGNATURE_MAX_BODY_BYTES gets 413: up front when Content-Length says
+so, otherwise as soon as the running total passes the limit.
+
+Accepted signatures are remembered in a ReplayCache bucketed by request
+timestamp, so a replay inside the skew window is refused and whole buckets
+expire once no timestamp in them can pass the skew check. The cache is per
+process: with several workers a replay can only be caught by the worker
+that saw the original.
+"""
+import hashlib
+import hmac
+import json
+import time
+from tempfile import SpooledTemporaryFile
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from config import (
+    REQUEST_SIGNING_SECRETS, SIGNATURE_MAX_BODY_BYTES, SIGNATURE_MAX_SKEW, SIGNATURE_REPLAY_CACHE_SIZE,
+    SIGNATURE_SPOOL_BYTES, SIGNED_ROUTE_PREFIXES,
+)
+
+REPLAY_CHUNK_BYTES = 65536
+
+
+class ReplayCache:
+    """
+    Signatures seen in the last 2 x `window` seconds, in buckets of `window`
+    seconds by request timestamp. A signature covers its timestamp, so a
+    replay always lands in the same bucket and lookups touch one set.
+    """
+
+    def __init__(self, window: float, max_entries: int):
+        self.bucket_ms = max(1, int(window * 1000))
+        self.max_entries = max_entries
+        self._buckets: Dict[int, Set[bytes]] = {}
+        self.size = 0
+
+    def _expire(self, now_ms: int):
+        # Timestamps older than now - window are refused, so a bucket ending before that is dead
+        oldest = (now_ms - self.bucket_ms) // self.bucket_ms
+        for bucket in [b for b in self._buckets if b < oldest]:
+            self.size -= len(self._buckets.pop(bucket))
+
+    def seen(self, signature: bytes, timestamp_ms: int) -> bool:
+        bucket = self._buckets.get(timestamp_ms // self.bucket_ms)
+        return bucket is not None and signature in bucket
+
+    def add(self, signature: bytes, timestamp_ms: int, now_ms: int) -> Optional[bool]:
+        """True if newly added, False if already seen, None if the cache is full"""
+        self._expire(now_ms)
+        bucket = self._buckets.setdefault(timestamp_ms // self.bucket_ms, set())
+        if signature in bucket:
+            return False
+        if self.size >= self.max_entries:
+            return None
+        bucket.add(signature)
+        self.size += 1
+        return True
+
+
+class SignatureVerifier:
+    def __init__(self, secrets: List[str], prefixes: Tuple[str, ...] = SIGNED_ROUTE_PREFIXES,
+                 max_skew: float = SIGNATURE_MAX_SKEW,
+                 replay_cache_size: int = SIGNATURE_REPLAY_CACHE_SIZE,
+                 max_body: int = SIGNATURE_MAX_BODY_BYTES):
+        if not secrets:
+            raise ValueError("Request signing needs at least one secret")
+        self._keys = [hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256) for secret in secrets]
+        self.prefixes = tuple(p.rstrip("/") for p in prefixes)
+        self.max_skew_ms = int(max_skew * 1000)
+        self.replays = ReplayCache(max_skew, replay_cache_size)
+        self.max_body = max_body
+        self.verified = 0
+        self.rejected: Dict[str, int] = {}
+
+    def signs(self, path: str) -> bool:
+        return any(path == p or path.startswith(p + "/") for p in self.prefixes)
+
+    def precheck(self, timestamp: Optional[bytes], signature: Optional[bytes],
+                 now_ms: int) -> Tuple[Optional[str], int, bytes]:
+        """Checks that need no body; returns (rejection reason or None, timestamp, signature)"""
+        if not timestamp or not signature:
+            return "missing", 0, b""
+        try:
+            timestamp_ms = int(timestamp)
+            digest = bytes.fromhex(signature.decode("ascii"))
+        except (ValueError, UnicodeDecodeError):
+            return "malformed", 0, b""
+        if abs(now_ms - timestamp_ms) > self.max_skew_ms:
+            return "skew", timestamp_ms, digest
+        if self.replays.seen(digest, timestamp_ms):
+            return "replay", timestamp_ms, digest
+        return None, timestamp_ms, digest
+
+    def matches(self, method: str, target: bytes, timestamp: bytes, body_sha256: str, signature: bytes) -> bool:
+        message = b"%s\n%s\n%s\n%s" % (method.encode("ascii"), target, timestamp, body_sha256.encode("ascii"))
+        matched = False
+        for key in self._keys:
+            mac = key.copy()
+            mac.update(message)
+            matched |= hmac.compare_digest(mac.digest(), signature)
+        return matched
+
+    def reject(self, reason: str):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"verified": self.verified, "rejected": dict(self.rejected),
+                "replay_cache": self.replays.size}
+
+
+REJECTIONS = {
+    "missing": (401, "Missing request signature"),
+    "malformed": (401, "Malformed request signature"),
+    "skew": (401, "Request timestamp outside the allowed window"),
+    "invalid": (401, "Invalid request signature"),
+    "replay": (401, "Request already processed"),
+    "full": (503, "Too many signed requests in flight, retry shortly"),
+    "too_large": (413, "Request body too large"),
+}
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class _BufferedBody:
+    """Replays a request body read once: a single message as is, or chunks from a spool"""
+
+    def __init__(self, receive, message: Optional[Dict[str, Any]] = None,
+                 spool: Optional[SpooledTemporaryFile] = None, size: int = 0):
+        self._receive = receive
+        self._message = message
+        self._spool = spool
+        self._size = size
+
+    async def receive(self):
+        if self._message is not None:
+            message, self._message = self._message, None
+            return message
+        if self._spool is not None:
+            chunk = self._spool.read(REPLAY_CHUNK_BYTES)
+            more = self._spool.tell() < self._size
+            if not more:
+                self._spool.close()
+                self._spool = None
+            return {"type": "http.request", "body": chunk, "more_body": more}
+        return await self._receive()
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+
+async def _read_body(receive, digest, max_size: int) -> Optional[_BufferedBody]:
+    """
+    Hash and buffer the whole body; None if the client disconnected. Raises
+    _BodyTooLarge once more than `max_size` bytes have arrived.
+    """
+    message = await receive()
+    if message["type"] == "http.disconnect":
+        return None
+    body = message.get("body", b"")
+    if len(body) > max_size:
+        raise _BodyTooLarge()
+    digest.update(body)
+    if not message.get("more_body"):
+        return _BufferedBody(receive, message=message)
+
+    spool = SpooledTemporaryFile(max_size=SIGNATURE_SPOOL_BYTES)
+    spool.write(body)
+    size = len(body)
+    while message.get("more_body"):
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            spool.close()
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > max_size:
+            spool.close()
+            raise _BodyTooLarge()
+        digest.update(chunk)
+        spool.write(chunk)
+    spool.seek(0)
+    return _BufferedBody(receive, spool=spool, size=size)
+
+
+class RequestSignatureMiddleware:
+    """ASGI middleware enforcing request signatures on signed routes"""
+
+    def __init__(self, app, verifier: Optional[SignatureVerifier] = None):
+        self.app = app
+        self.verifier = verifier or signature_verifier
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.verifier.signs(scope["path"]):
+            return await self.app(scope, receive, send)
+
+        timestamp = signature = content_length = None
+        for name, value in scope["headers"]:
+            if name == b"x-timestamp":
+                timestamp = value
+            elif name == b"x-signature":
+                signature = value
+            elif name == b"content-length":
+                content_length = value
+        verifier = self.verifier
+        reason, timestamp_ms, digest = verifier.precheck(timestamp, signature, int(time.time() * 1000))
+        if reason is not None:
+            return await self._reject(send, reason)
+        if content_length is not None and content_length.isdigit() and int(content_length) > verifier.max_body:
+            return await self._reject(send, "too_large")
+
+        body_hash = hashlib.sha256()
+        try:
+            body = await _read_body(receive, body_hash, verifier.max_body)
+        except _BodyTooLarge:
+            return await self._reject(send, "too_large")
+        if body is None:
+            return
+        target = scope.get("raw_path") or scope["path"].encode("utf-8")
+        if scope.get("query_string"):
+            target += b"?" + scope["query_string"]
+        if not verifier.matches(scope["method"], target, timestamp, body_hash.hexdigest(), digest):
+            body.close()
+            return await self._reject(send, "invalid")
+        added = verifier.replays.add(digest, timestamp_ms, int(time.time() * 1000))
+        if not added:
+            body.close()
+            return await self._reject(send, "replay" if added is False else "full")
+        verifier.verified += 1
+        await self.app(scope, body.receive, send)
+
+    async def _reject(self, send, reason: str):
+        self.verifier.reject(reason)
+        status, detail = REJECTIONS[reason]
+        payload = json.dumps({"detail": detail}).encode("utf-8")
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+        if status == 503:
+            headers.append((b"retry-after", b"1"))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": payload})
+
+
+if not REQUEST_SIGNING_SECRETS:
+    raise RuntimeError("REQUEST_SIGNING_SECRETS is not set; signed routes need at least one secret")
+
+# Singleton instance
+signature_verifier = SignatureVerifier(REQUEST_SIGNING_SECRETS)
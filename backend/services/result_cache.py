@@ -0,0 +1,109 @@
+"""
+Memoized verification and validation results.
+
+A result depends only on the profile contents, the rule definitions and the
+calendar date, so it is cached under (kind, user_id, profile _version,
+service_type, RULES_HASH, date). Profile writes drop the user's entries
+through a database listener; the version in the key keeps a stale entry from
+ever being served even if a write bypasses the listener.
+
+Cached results are shared between callers and must be treated as read-only.
+"""
+import hashlib
+import inspect
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from config import (
+    RESULT_CACHE_SIZE,
+    SECURITY_LEVELS,
+    SERVICE_VALIDATION_REQUIREMENTS,
+    USER_PROFILE_SCHEMA,
+)
+from database import add_profile_listener
+from knowledge_base import ELIGIBILITY_RULES
+from rules import RULE_CHECKS
+
+
+def _rules_hash() -> str:
+    """Fingerprint of everything besides the profile that a result depends on"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([ELIGIBILITY_RULES, SERVICE_VALIDATION_REQUIREMENTS, SECURITY_LEVELS,
+                              USER_PROFILE_SCHEMA], sort_keys=True).encode("utf-8"))
+    for rule_id in sorted(RULE_CHECKS):
+        digest.update(rule_id.encode("utf-8"))
+        digest.update(inspect.getsource(RULE_CHECKS[rule_id]).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+RULES_HASH = _rules_hash()
+
+CacheKey = Tuple[str, str, int, str, str, str]
+
+
+class ResultCache:
+    """Bounded LRU of per-user results with per-user invalidation"""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, Dict[str, Any]]" = OrderedDict()
+        self._by_user: Dict[str, Set[CacheKey]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, kind: str, user: Dict[str, Any], service_type: str,
+                       compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        key = (kind, user.get("user_id", ""), user.get("_version", 0), service_type,
+               RULES_HASH, date.today().isoformat())
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        result = compute()
+        with self._lock:
+            self._entries[key] = result
+            self._by_user.setdefault(key[1], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old, _ = self._entries.popitem(last=False)
+                self._discard_index(old)
+        return result
+
+    def _discard_index(self, key: CacheKey):
+        keys = self._by_user.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[1]]
+
+    def invalidate_user(self, user_id: str, version: Optional[int] = None, changed: Any = None):
+        """Drop every cached result for a user (profile listener signature)"""
+        with self._lock:
+            keys = self._by_user.pop(user_id, ())
+            for key in keys:
+                self._entries.pop(key, None)
+            if keys:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "users": len(self._by_user), "hits": self.hits,
+                    "misses": self.misses, "invalidations": self.invalidations, "rules_hash": RULES_HASH}
+
+
+# Singleton instance
+result_cache = ResultCache()
+add_profile_listener(result_cache.invalidate_user)
@@ -0,0 +1,116 @@
+"""
+Background expiry of tasks, chat sessions, documents, access logs and
+refilled rate-limit buckets.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+from config import (
+    TASK_TTLS,
+    CHAT_SESSION_TTL,
+    ACCESS_LOG_IDLE_TTL,
+    SWEEP_INTERVAL_SECONDS,
+    SWEEP_BATCH_SIZE,
+    SWEEP_MAX_SECONDS,
+)
+from state_store import state_store
+from services.ai_engine import ai_engine
+from services.rate_limiter import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+def _cutoff(ttl_seconds):
+    return (datetime.now() - timedelta(seconds=ttl_seconds)).isoformat()
+
+
+class StateSweeper:
+    """
+    Evicts expired state in small slices. Database slices run in a worker
+    thread and the in-memory access logs are checked SWEEP_BATCH_SIZE users at
+    a time, yielding to the event loop between slices. A sweep stops after
+    SWEEP_MAX_SECONDS; the next one starts with the job after the one that
+    ran out of time, so every kind gets a turn at the head of the sweep.
+    """
+
+    def __init__(self):
+        self.evicted = {"tasks": {}, "chat_sessions": 0, "documents": 0, "task_events": 0, "access_logs": 0,
+                        "rate_limit_keys": 0}
+        self.last_sweep = None
+        self.last_duration = None
+        self._jobs = list(self._build_jobs())
+        self._next_job = 0
+
+    def _build_jobs(self):
+        """(kind, status, job) triples; a job evicts one slice and returns (count, done)"""
+        def db_job(fn):
+            async def job():
+                count = await asyncio.to_thread(fn)
+                return count, count < SWEEP_BATCH_SIZE
+            return job
+
+        async def access_logs():
+            return ai_engine.evict_idle(ACCESS_LOG_IDLE_TTL, SWEEP_BATCH_SIZE)
+
+        for status, ttl in TASK_TTLS.items():
+            yield "tasks", status, db_job(lambda s=status, t=ttl: state_store.expire_tasks(s, _cutoff(t), SWEEP_BATCH_SIZE))
+        yield "chat_sessions", None, db_job(lambda: state_store.expire_sessions(_cutoff(CHAT_SESSION_TTL), SWEEP_BATCH_SIZE))
+        yield "documents", None, db_job(lambda: state_store.expire_orphan_documents(SWEEP_BATCH_SIZE))
+        yield "task_events", None, db_job(lambda: state_store.expire_orphan_task_events(SWEEP_BATCH_SIZE))
+        yield "rate_limit_keys", None, db_job(lambda: rate_limiter.expire(SWEEP_BATCH_SIZE))
+        yield "access_logs", None, access_logs
+
+    def _record(self, kind, status, count):
+        if status is None:
+            self.evicted[kind] += count
+        else:
+            self.evicted[kind][status] = self.evicted[kind].get(status, 0) + count
+
+    async def sweep_once(self):
+        """Run one time-bounded sweep over every entity type"""
+        started = time.monotonic()
+        deadline = started + SWEEP_MAX_SECONDS
+
+        first = self._next_job
+        self._next_job = 0
+        for offset in range(len(self._jobs)):
+            position = (first + offset) % len(self._jobs)
+            kind, status, job = self._jobs[position]
+            done = False
+            while not done and time.monotonic() < deadline:
+                count, done = await job()
+                self._record(kind, status, count)
+                await asyncio.sleep(0)
+            if not done:
+                # Out of time: the next sweep starts with the job after this one,
+                # so a backlog in one kind cannot starve the kinds behind it
+                self._next_job = (position + 1) % len(self._jobs)
+                break
+
+        self.last_sweep = datetime.now().isoformat()
+        self.last_duration = round(time.monotonic() - started, 4)
+
+    async def run(self):
+        """Sweep forever at SWEEP_INTERVAL_SECONDS"""
+        while True:
+            try:
+                await self.sweep_once()
+            except Exception:
+                logger.exception("State sweep failed")
+            await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+
+    def stats(self):
+        live = state_store.counts()
+        live["access_logs"] = len(ai_engine.access_logs)
+        return {
+            "live": live,
+            "evicted": self.evicted,
+            "last_sweep": self.last_sweep,
+            "last_sweep_seconds": self.last_duration,
+        }
+
+
+# Singleton instance
+sweeper = StateSweeper()
@@ -0,0 +1,285 @@
+"""
+Compact task records rendered against AGENTIC_SERVICES templates.
+
+A stored task holds only its template key, progress, status, timestamps and
+per-task overrides; name, icon, description and steps are resolved from the
+template when the task is rendered.
+"""
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from knowledge_base import AGENTIC_SERVICES
+from state_store import state_store
+from services.event_bus import event_bus
+
+
+@dataclass(slots=True)
+class TaskRecord:
+    id: str
+    type: str
+    user_id: str
+    status: str = "in_progress"
+    current_step: int = 1
+    created_at: str = ""
+    updated_at: str = ""
+    # Per-task overrides such as documents, auto_verification and user_data
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def new(cls, task_type: str, user_id: str, current_step: int = 1, **extra) -> "TaskRecord":
+        now = datetime.now().isoformat()
+        return cls(id=str(uuid.uuid4())[:8], type=task_type, user_id=user_id,
+                   current_step=current_step, created_at=now, updated_at=now, extra=extra)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TaskRecord":
+        extra = dict(data.get("extra", {}))
+        # Tasks written before records were compact carry overrides at top level
+        for key in ("documents", "auto_verification", "user_data"):
+            if key in data:
+                extra.setdefault(key, data[key])
+        return cls(id=data["id"], type=data["type"], user_id=data["user_id"],
+                   status=data["status"], current_step=data["current_step"],
+                   created_at=data["created_at"], updated_at=data["updated_at"], extra=extra)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"id": self.id, "type": self.type, "user_id": self.user_id, "status": self.status,
+                "current_step": self.current_step, "created_at": self.created_at,
+                "updated_at": self.updated_at}
+        if self.extra:
+            data["extra"] = self.extra
+        return data
+
+    @property
+    def template(self) -> Dict[str, Any]:
+        return AGENTIC_SERVICES[self.type]
+
+    @property
+    def total_steps(self) -> int:
+        return len(self.template["steps"])
+
+    def step(self, number: int) -> Optional[Dict[str, Any]]:
+        """Template step by 1-based number, or None past the end"""
+        steps = self.template["steps"]
+        return steps[number - 1] if 1 <= number <= len(steps) else None
+
+    def touch(self):
+        self.updated_at = datetime.now().isoformat()
+
+
+# Renderable fields, resolved only when requested
+TASK_FIELDS: Dict[str, Callable[[TaskRecord], Any]] = {
+    "id": lambda r: r.id,
+    "type": lambda r: r.type,
+    "name": lambda r: r.template["name"],
+    "icon": lambda r: r.template["icon"],
+    "description": lambda r: r.template["description"],
+    "steps": lambda r: r.template["steps"],
+    "current_step": lambda r: r.current_step,
+    "total_steps": lambda r: r.total_steps,
+    "status": lambda r: r.status,
+    "user_id": lambda r: r.user_id,
+    "created_at": lambda r: r.created_at,
+    "updated_at": lambda r: r.updated_at,
+    "documents": lambda r: r.extra.get("documents", []),
+}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Split a comma-separated `fields=` query parameter"""
+    if not fields:
+        return None
+    return [f.strip() for f in fields.split(",") if f.strip()]
+
+
+def render_task(record: TaskRecord, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Full task view, or only the requested fields"""
+    if fields is None:
+        rendered = {name: resolve(record) for name, resolve in TASK_FIELDS.items()}
+        for key, value in record.extra.items():
+            rendered.setdefault(key, value)
+        return rendered
+    rendered = {}
+    for name in fields:
+        if name in TASK_FIELDS:
+            rendered[name] = TASK_FIELDS[name](record)
+        elif name in record.extra:
+            rendered[name] = record.extra[name]
+    return rendered
+
+
+# ============== STATE MACHINE ==============
+
+class InvalidTransition(Exception):
+    """Raised when an action is not allowed from the task's current status"""
+
+    def __init__(self, task_id: str, action: str, status: str):
+        super().__init__(f"Cannot {action} task {task_id} while it is {status}")
+        self.task_id = task_id
+        self.action = action
+        self.status = status
+
+
+# action -> statuses it may be applied from
+TASK_TRANSITIONS: Dict[str, set] = {
+    "advance": {"in_progress"},
+    "cancel": {"in_progress"},
+    "delete": {"in_progress", "completed", "cancelled"},
+    "attach_document": {"in_progress", "completed", "cancelled"},
+}
+
+# Actions that need no event data, the only ones POST /tasks/batch applies
+BATCH_ACTIONS = ("advance", "cancel", "delete")
+
+
+def apply_event(record: Optional[TaskRecord], action: str,
+                data: Optional[Dict[str, Any]] = None) -> TaskRecord:
+    """
+    Pure transition function shared by live updates and replay. `create`
+    builds a record from its event data; every other action mutates `record`.
+    """
+    if action == "create":
+        return TaskRecord.from_dict(data)
+    if action not in TASK_TRANSITIONS:
+        raise ValueError(f"Unknown task action: {action}")
+    if record.status not in TASK_TRANSITIONS[action]:
+        raise InvalidTransition(record.id, action, record.status)
+
+    if action == "advance":
+        if record.current_step >= record.total_steps:
+            record.status = "completed"
+        else:
+            record.current_step += 1
+    elif action == "cancel":
+        record.status = "cancelled"
+    elif action == "delete":
+        record.status = "deleted"
+    elif action == "attach_document":
+        record.extra.setdefault("documents", []).append(data)
+    return record
+
+
+def _event(record: TaskRecord, action: str, from_status: Optional[str],
+           idempotency_key: Optional[str] = None, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {"action": action, "from_status": from_status, "to_status": record.status,
+            "step": record.current_step, "idempotency_key": idempotency_key,
+            "at": record.updated_at, "data": data}
+
+
+@dataclass(slots=True)
+class TransitionResult:
+    task_id: str
+    action: str
+    record: Optional[TaskRecord] = None
+    duplicate: bool = False
+    missing: bool = False
+    error: Optional[str] = None
+
+
+def _transition_in_tx(task_id: str, action: str, idempotency_key: Optional[str],
+                      data: Optional[Dict[str, Any]]) -> TransitionResult:
+    """Apply one transition inside an open state_store transaction"""
+    if idempotency_key:
+        seen = state_store.event_by_key(idempotency_key)
+        if seen and (seen["task_id"], seen["action"]) != (task_id, action):
+            return TransitionResult(task_id, action, error=(
+                f"Idempotency-Key already used to {seen['action']} task {seen['task_id']}"))
+        if seen:
+            record = get_task(seen["task_id"], include_deleted=True)
+            if record is None:
+                # The key outlived its task (swept before its events were)
+                return TransitionResult(task_id, action, duplicate=True, missing=True,
+                                        error=f"Task for this Idempotency-Key no longer exists: {seen['task_id']}")
+            return TransitionResult(task_id, action, record, duplicate=True)
+
+    stored = state_store.get_task(task_id)
+    if not stored or stored["status"] == "deleted":
+        return TransitionResult(task_id, action, missing=True, error=f"Task not found: {task_id}")
+    record = TaskRecord.from_dict(stored)
+
+    # Tasks created before the event log existed get a snapshot to replay from
+    if state_store.last_task_seq(task_id) == 0:
+        state_store.append_task_event(task_id, _event(record, "create", None, data=record.to_dict()))
+
+    from_status = record.status
+    try:
+        apply_event(record, action, data)
+    except (InvalidTransition, ValueError) as e:
+        return TransitionResult(task_id, action, error=str(e))
+    record.touch()
+    state_store.put_task(record.to_dict())
+    state_store.append_task_event(task_id, _event(record, action, from_status, idempotency_key, data))
+    return TransitionResult(task_id, action, record)
+
+
+def _publish(result: TransitionResult):
+    if result.record and not result.error and not result.duplicate:
+        event_bus.publish(result.record.user_id, "task", {
+            "action": result.action, "task_id": result.task_id, "status": result.record.status,
+            "current_step": result.record.current_step, "updated_at": result.record.updated_at,
+        })
+
+
+def transition(task_id: str, action: str, idempotency_key: Optional[str] = None,
+               data: Optional[Dict[str, Any]] = None) -> TransitionResult:
+    """Apply one action atomically; a repeated idempotency_key is a no-op"""
+    with state_store.transaction():
+        result = _transition_in_tx(task_id, action, idempotency_key, data)
+    _publish(result)
+    return result
+
+
+def transition_many(requests: List[Dict[str, Any]]) -> List[TransitionResult]:
+    """
+    Apply many {task_id, action, idempotency_key} requests in one database
+    transaction. Only BATCH_ACTIONS are accepted; rejected items are reported
+    and do not affect the others.
+    """
+    with state_store.transaction():
+        results = [
+            _transition_in_tx(r["task_id"], r["action"], r.get("idempotency_key"), None)
+            if r["action"] in BATCH_ACTIONS else
+            TransitionResult(r["task_id"], r["action"], error=f"Action not allowed in a batch: {r['action']}")
+            for r in requests
+        ]
+    for result in results:
+        _publish(result)
+    return results
+
+
+def rebuild_task(task_id: str) -> Optional[TaskRecord]:
+    """Recompute a task's state purely from its event log"""
+    record = None
+    for event in state_store.task_events(task_id):
+        record = apply_event(record, event["action"], event["data"])
+        record.updated_at = event["at"]
+    return record
+
+
+# ============== STORAGE ==============
+
+def create_task(record: TaskRecord):
+    """Persist a new task together with its creation event"""
+    with state_store.transaction():
+        state_store.put_task(record.to_dict())
+        state_store.append_task_event(record.id, _event(record, "create", None, data=record.to_dict()))
+    _publish(TransitionResult(record.id, "create", record))
+
+
+def get_task(task_id: str, include_deleted: bool = False) -> Optional[TaskRecord]:
+    data = state_store.get_task(task_id)
+    if not data or (data["status"] == "deleted" and not include_deleted):
+        return None
+    return TaskRecord.from_dict(data)
+
+
+def find_task(user_id: str, task_type: str, status: str) -> Optional[TaskRecord]:
+    data = state_store.find_task(user_id, task_type, status)
+    return TaskRecord.from_dict(data) if data else None
+
+
+def tasks_for_user(user_id: str, task_type: Optional[str] = None,
+                   status: Optional[str] = None) -> List[TaskRecord]:
+    return [TaskRecord.from_dict(d) for d in state_store.tasks_for_user(user_id, task_type, status)]
@@ -0,0 +1,132 @@
+"""
+Service requirement validators compiled once from config.
+
+SERVICE_VALIDATION_REQUIREMENTS and SECURITY_LEVELS are flattened at import
+into per-service tuples with labels already resolved, so validating a user is
+a set lookup per field rather than a walk over the schema.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+from config import USER_PROFILE_SCHEMA, SECURITY_LEVELS, SERVICE_VALIDATION_REQUIREMENTS
+
+FIELD_LABELS: Dict[str, str] = {
+    field: spec["label"] for fields in USER_PROFILE_SCHEMA.values() for field, spec in fields.items()
+}
+
+SECURITY_HIERARCHY = {"basic": 1, "verified": 2, "premium": 3}
+
+
+def get_field_label(field_name: str) -> str:
+    """Get human-readable label for a field"""
+    label = FIELD_LABELS.get(field_name)
+    return label if label is not None else field_name.replace("_", " ").title()
+
+
+# (field, label) pairs
+Labelled = Tuple[Tuple[str, str], ...]
+
+
+def _labelled(fields) -> Labelled:
+    return tuple((f, get_field_label(f)) for f in fields)
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledRequirement:
+    service_type: str
+    description: str
+    fields: Labelled
+    business_fields: Labelled
+    documents: Labelled
+    security_level: str
+    security_rank: int
+    security_requirements: Labelled
+
+    @property
+    def total_required(self) -> int:
+        return len(self.fields) + len(self.documents)
+
+    def evaluate(self, user: Dict[str, Any], present: FrozenSet[str]) -> Dict[str, Any]:
+        """Validation result for a user whose non-blank required fields are `present`"""
+        missing_fields = [{"field": f, "label": label} for f, label in self.fields if f not in present]
+        present_fields = [{"field": f, "label": label, "value": user[f]} for f, label in self.fields if f in present]
+        missing_fields += [{"field": f, "label": label, "category": "business"}
+                           for f, label in self.business_fields if f not in present]
+        missing_documents = [{"field": f, "label": label} for f, label in self.documents if not user.get(f)]
+
+        security_issues = []
+        user_security = user.get("security_level", "basic")
+        if SECURITY_HIERARCHY.get(user_security, 0) < self.security_rank:
+            security_issues.append({
+                "issue": "insufficient_security_level",
+                "current_level": user_security,
+                "required_level": self.security_level,
+                "message": f"This service requires '{self.security_level}' security level."
+            })
+            security_issues += [{"issue": "missing_security_requirement", "requirement": f, "label": label}
+                                for f, label in self.security_requirements if not user.get(f)]
+
+        total_present = len(present_fields) + len(self.documents) - len(missing_documents)
+        return {
+            "valid": not missing_fields and not missing_documents and not security_issues,
+            "service_type": self.service_type,
+            "service_description": self.description,
+            "missing_fields": missing_fields,
+            "missing_documents": missing_documents,
+            "security_issues": security_issues,
+            "present_fields": present_fields,
+            "user_security_level": user_security,
+            "required_security_level": self.security_level,
+            "total_required": self.total_required,
+            "total_present": total_present,
+            "completion_percentage": round(total_present / max(1, self.total_required) * 100)
+        }
+
+
+def compile_requirement(service_type: str, requirements: Dict[str, Any]) -> CompiledRequirement:
+    level = requirements.get("required_security_level", "basic")
+    return CompiledRequirement(
+        service_type=service_type,
+        description=requirements["description"],
+        fields=_labelled(requirements["required_fields"]),
+        business_fields=_labelled(requirements.get("required_business_fields", [])),
+        documents=_labelled(requirements["required_documents"]),
+        security_level=level,
+        security_rank=SECURITY_HIERARCHY.get(level, 1),
+        security_requirements=_labelled(SECURITY_LEVELS.get(level, {}).get("requirements", [])),
+    )
+
+
+COMPILED_REQUIREMENTS: Dict[str, CompiledRequirement] = {
+    service: compile_requirement(service, requirements)
+    for service, requirements in SERVICE_VALIDATION_REQUIREMENTS.items()
+}
+
+# Every required field any service looks at, so a profile is scanned once per request
+CHECKED_FIELDS: FrozenSet[str] = frozenset(
+    f for req in COMPILED_REQUIREMENTS.values() for f, _ in req.fields + req.business_fields
+)
+
+
+def present_fields(user: Dict[str, Any]) -> FrozenSet[str]:
+    """Checked fields that hold a non-blank value"""
+    present = set()
+    for field in CHECKED_FIELDS:
+        value = user.get(field)
+        if value and not (isinstance(value, str) and not value.strip()):
+            present.add(field)
+    return frozenset(present)
+
+
+def validate_profile_for_service(user: Dict[str, Any], service_type: str,
+                                 present: Optional[FrozenSet[str]] = None) -> Dict[str, Any]:
+    requirement = COMPILED_REQUIREMENTS.get(service_type)
+    if requirement is None:
+        return {"error": f"Unknown service type: {service_type}"}
+    return requirement.evaluate(user, present_fields(user) if present is None else present)
+
+
+def eligibility_matrix(user: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Validate a user against every service from a single scan of the profile"""
+    present = present_fields(user)
+    return {service: req.evaluate(user, present) for service, req in COMPILED_REQUIREMENTS.items()}
@@ -0,0 +1,470 @@
+"""
+Persistent task, chat history and document state shared across worker processes.
+
+Backed by SQLite in WAL mode so any number of uvicorn workers can read and
+write the same file concurrently, and in-progress tasks survive restarts.
+Each record is stored as a JSON document next to the columns it is looked up by.
+"""
+import base64
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import STATE_DB_PATH
+
+PREVIEW_LENGTH = 120
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    updated_at TEXT,
+    data TEXT NOT NULL
+);
+-- Serves both per-user listing (leading column) and duplicate detection.
+-- SQLite updates it in the same transaction as the row, so create, advance,
+-- cancel and delete keep it consistent without extra bookkeeping.
+CREATE INDEX IF NOT EXISTS tasks_by_user_type_status ON tasks (user_id, type, status);
+
+-- Append-only history of every task transition; the tasks table is the
+-- current-state snapshot and can be rebuilt from these events.
+CREATE TABLE IF NOT EXISTS task_events (
+    task_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    from_status TEXT,
+    to_status TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    idempotency_key TEXT,
+    at TEXT NOT NULL,
+    data TEXT,
+    PRIMARY KEY (task_id, seq)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS task_events_by_key
+    ON task_events (idempotency_key) WHERE idempotency_key IS NOT NULL;
+
+-- Session summaries are kept apart from message bodies so listing a user's
+-- sessions never touches chat_messages.
+CREATE TABLE IF NOT EXISTS chat_session_summaries (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    last_message TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chat_sessions_by_user
+    ON chat_session_summaries (user_id, updated_at DESC, session_id DESC);
+
+CREATE TABLE IF NOT EXISTS chat_messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_by_task ON documents (task_id);
+
+-- Materialized per-service eligibility for a profile version; rows are
+-- rewritten only for the services a profile change can affect.
+CREATE TABLE IF NOT EXISTS eligibility_state (
+    user_id TEXT NOT NULL,
+    service TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    computed_on TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user_id, service)
+) WITHOUT ROWID;
+
+-- Field-level profile edits not yet folded into the users table
+-- (database.ProfileChangeLog). Kept here so every worker sees the same
+-- pending edits; the key refuses a second write of the same version.
+CREATE TABLE IF NOT EXISTS profile_changes (
+    user_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    changes TEXT NOT NULL,
+    at TEXT NOT NULL,
+    PRIMARY KEY (user_id, version)
+) WITHOUT ROWID;
+
+-- Let the sweeper find expired rows without scanning
+CREATE INDEX IF NOT EXISTS tasks_by_status_age ON tasks (status, updated_at);
+CREATE INDEX IF NOT EXISTS chat_sessions_by_age ON chat_session_summaries (updated_at);
+"""
+
+
+class StateStore:
+    """SQLite-backed store for tasks, chat sessions, uploaded documents and pending profile edits"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections are not shareable"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction that takes the database lock up front"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _fetch_one(self, sql: str, params: tuple) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(sql, params).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _fetch_all(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        return [json.loads(row[0]) for row in self._conn().execute(sql, params)]
+
+    # ============== TASKS ==============
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return self._fetch_one("SELECT data FROM tasks WHERE id = ?", (task_id,))
+
+    def put_task(self, task: Dict[str, Any]):
+        self._conn().execute(
+            "INSERT INTO tasks (id, user_id, type, status, updated_at, data) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET user_id = excluded.user_id, type = excluded.type, "
+            "status = excluded.status, updated_at = excluded.updated_at, data = excluded.data",
+            (task["id"], task["user_id"], task["type"], task["status"], task["updated_at"],
+             json.dumps(task)),
+        )
+
+    def tasks_for_user(self, user_id: str, task_type: Optional[str] = None,
+                       status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """A user's tasks; deleted tasks are only returned when asked for by status"""
+        sql = "SELECT data FROM tasks WHERE user_id = ?"
+        params = [user_id]
+        if task_type is not None:
+            sql += " AND type = ?"
+            params.append(task_type)
+        if status is not None:
+            sql += " AND status = ?"
+            params.append(status)
+        else:
+            sql += " AND status != 'deleted'"
+        return self._fetch_all(sql + " ORDER BY rowid", tuple(params))
+
+    def find_task(self, user_id: str, task_type: str, status: str) -> Optional[Dict[str, Any]]:
+        """First task matching (user_id, type, status), via the composite index"""
+        return self._fetch_one(
+            "SELECT data FROM tasks WHERE user_id = ? AND type = ? AND status = ? ORDER BY rowid LIMIT 1",
+            (user_id, task_type, status),
+        )
+
+    def last_task_seq(self, task_id: str) -> int:
+        """Sequence number of a task's latest event, 0 if it has none"""
+        return self._conn().execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM task_events WHERE task_id = ?", (task_id,)).fetchone()[0]
+
+    def append_task_event(self, task_id: str, event: Dict[str, Any]) -> int:
+        """Append an event to a task's history and return its sequence number"""
+        conn = self._conn()
+        seq = self.last_task_seq(task_id) + 1
+        conn.execute(
+            "INSERT INTO task_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (task_id, seq, event["action"], event.get("from_status"), event["to_status"],
+             event["step"], event.get("idempotency_key"), event["at"],
+             json.dumps(event["data"]) if event.get("data") is not None else None),
+        )
+        return seq
+
+    def _event(self, row: tuple) -> Dict[str, Any]:
+        task_id, seq, action, from_status, to_status, step, key, at, data = row
+        return {"task_id": task_id, "seq": seq, "action": action, "from_status": from_status,
+                "to_status": to_status, "step": step, "idempotency_key": key, "at": at,
+                "data": json.loads(data) if data is not None else None}
+
+    def event_by_key(self, idempotency_key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT * FROM task_events WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+        return self._event(row) if row else None
+
+    def task_events(self, task_id: str) -> List[Dict[str, Any]]:
+        return [self._event(row) for row in self._conn().execute(
+            "SELECT * FROM task_events WHERE task_id = ? ORDER BY seq", (task_id,))]
+
+    # ============== CHAT SESSIONS ==============
+
+    def _summary(self, row: tuple) -> Dict[str, Any]:
+        session_id, user_id, title, last_message, count, created_at, updated_at = row
+        return {"session_id": session_id, "user_id": user_id, "title": title,
+                "last_message": last_message, "message_count": count,
+                "created_at": created_at, "updated_at": updated_at}
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Session summary without message bodies"""
+        row = self._conn().execute(
+            "SELECT * FROM chat_session_summaries WHERE session_id = ?", (session_id,)).fetchone()
+        return self._summary(row) if row else None
+
+    def _write_messages(self, session_id: str, user_id: str, title: Optional[str],
+                        messages: List[Dict[str, Any]], start_seq: int, created_at: str):
+        now = datetime.now().isoformat()
+        self._conn().executemany(
+            "INSERT INTO chat_messages (session_id, seq, data) VALUES (?, ?, ?)",
+            [(session_id, start_seq + i, json.dumps(m)) for i, m in enumerate(messages)],
+        )
+        last = _preview(messages[-1]) if messages else None
+        self._conn().execute(
+            "INSERT INTO chat_session_summaries VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET "
+            "title = COALESCE(?, title), "
+            "last_message = COALESCE(excluded.last_message, last_message), "
+            "message_count = message_count + ?, updated_at = excluded.updated_at",
+            (session_id, user_id, title or f"Chat {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+             last, len(messages), created_at, now, title, len(messages)),
+        )
+
+    def _replace_messages(self, session_id: str, user_id: str, title: Optional[str],
+                          messages: List[Dict[str, Any]], created_at: str):
+        conn = self._conn()
+        conn.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM chat_session_summaries WHERE session_id = ?", (session_id,))
+        self._write_messages(session_id, user_id, title, messages, 1, created_at)
+
+    def save_session(self, session_id: str, user_id: str, messages: List[Dict[str, Any]],
+                     title: Optional[str] = None):
+        """Replace a session's whole transcript"""
+        with self.transaction():
+            existing = self.get_session(session_id)
+            created_at = existing["created_at"] if existing else datetime.now().isoformat()
+            self._replace_messages(session_id, user_id, title, messages, created_at)
+
+    def append_messages(self, session_id: str, user_id: str, messages: List[Dict[str, Any]],
+                        title: Optional[str] = None) -> Dict[str, Any]:
+        """Add new messages to the end of a session, creating it if needed"""
+        with self.transaction() as conn:
+            (last_seq,) = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM chat_messages WHERE session_id = ?",
+                (session_id,)).fetchone()
+            self._write_messages(session_id, user_id, title, messages, last_seq + 1,
+                                 datetime.now().isoformat())
+            return self.get_session(session_id)
+
+    def list_messages(self, session_id: str, cursor: Optional[str] = None,
+                      limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Messages in order, paginated by an opaque cursor; returns (messages, next_cursor)"""
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be at least 1")
+        after = 0
+        if cursor:
+            position = decode_cursor(cursor)
+            if len(position) != 1 or not isinstance(position[0], int):
+                raise ValueError(f"Invalid cursor: {cursor}")
+            after = position[0]
+        sql = "SELECT seq, data FROM chat_messages WHERE session_id = ? AND seq > ? ORDER BY seq"
+        params: tuple = (session_id, after)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit + 1,)
+        rows = self._conn().execute(sql, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][0])
+        return [json.loads(data) for _, data in rows], next_cursor
+
+    def list_sessions(self, user_id: str, cursor: Optional[str] = None,
+                      limit: int = 20) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Session summaries, most recently updated first; returns (sessions, next_cursor)"""
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+        sql = "SELECT * FROM chat_session_summaries WHERE user_id = ?"
+        params: tuple = (user_id,)
+        if cursor:
+            position = decode_cursor(cursor)
+            if len(position) != 2 or not all(isinstance(v, str) for v in position):
+                raise ValueError(f"Invalid cursor: {cursor}")
+            updated_at, session_id = position
+            sql += " AND (updated_at, session_id) < (?, ?)"
+            params += (updated_at, session_id)
+        sql += " ORDER BY updated_at DESC, session_id DESC LIMIT ?"
+        rows = self._conn().execute(sql, params + (limit + 1,)).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1][6], rows[-1][0])
+        return [self._summary(row) for row in rows], next_cursor
+
+    def delete_session(self, session_id: str) -> bool:
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
+            return conn.execute(
+                "DELETE FROM chat_session_summaries WHERE session_id = ?", (session_id,)).rowcount > 0
+
+    # ============== DOCUMENTS ==============
+
+    def add_document(self, task_id: str, doc: Dict[str, Any]):
+        self._conn().execute(
+            "INSERT INTO documents (id, task_id, data) VALUES (?, ?, ?)",
+            (doc["id"], task_id, json.dumps(doc)),
+        )
+
+    def documents_for_task(self, task_id: str) -> List[Dict[str, Any]]:
+        return self._fetch_all("SELECT data FROM documents WHERE task_id = ? ORDER BY rowid", (task_id,))
+
+    # ============== ELIGIBILITY ==============
+
+    def eligibility_for_user(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Stored per-service state, each with its version and computed_on date"""
+        rows = self._conn().execute(
+            "SELECT service, version, computed_on, data FROM eligibility_state WHERE user_id = ?",
+            (user_id,)).fetchall()
+        return {service: {**json.loads(data), "version": version, "computed_on": computed_on}
+                for service, version, computed_on, data in rows}
+
+    def put_eligibility(self, user_id: str, version: int, computed_on: str,
+                        services: Dict[str, Dict[str, Any]]):
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO eligibility_state (user_id, service, version, computed_on, data) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (user_id, service) DO UPDATE SET "
+                "version = excluded.version, computed_on = excluded.computed_on, data = excluded.data "
+                "WHERE excluded.version >= eligibility_state.version",
+                [(user_id, service, version, computed_on, json.dumps(state))
+                 for service, state in services.items()],
+            )
+
+    def bump_eligibility_version(self, user_id: str, version: int):
+        """Mark unaffected services as current for a new profile version"""
+        self._conn().execute(
+            "UPDATE eligibility_state SET version = ? WHERE user_id = ? AND version < ?",
+            (version, user_id, version))
+
+    def has_eligibility(self, user_id: str) -> bool:
+        return self._conn().execute(
+            "SELECT 1 FROM eligibility_state WHERE user_id = ? LIMIT 1", (user_id,)).fetchone() is not None
+
+    # ============== PROFILE CHANGES ==============
+
+    def add_profile_changes(self, entries: List[Tuple[str, int, Dict[str, Any]]], at: str):
+        """Store (user_id, version, changes) entries in one transaction"""
+        with self.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO profile_changes (user_id, version, changes, at) VALUES (?, ?, ?, ?)",
+                [(user_id, version, json.dumps(changes), at) for user_id, version, changes in entries])
+
+    def profile_changes(self, user_id: Optional[str] = None) -> Dict[str, Tuple[Dict[str, Any], int]]:
+        """Pending changes merged per user, with the latest version: {user_id: (fields, version)}"""
+        sql = "SELECT user_id, version, changes FROM profile_changes"
+        params: tuple = ()
+        if user_id is not None:
+            sql += " WHERE user_id = ?"
+            params = (user_id,)
+        merged: Dict[str, Tuple[Dict[str, Any], int]] = {}
+        for uid, version, changes in self._conn().execute(sql + " ORDER BY user_id, version", params):
+            fields = merged[uid][0] if uid in merged else {}
+            fields.update(json.loads(changes))
+            merged[uid] = (fields, version)
+        return merged
+
+    def profile_change_count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM profile_changes").fetchone()[0]
+
+    def delete_profile_changes(self, versions: Dict[str, int]):
+        """Drop each user's changes up to and including the given version"""
+        with self.transaction() as conn:
+            conn.executemany("DELETE FROM profile_changes WHERE user_id = ? AND version <= ?",
+                             list(versions.items()))
+
+    # ============== EXPIRY ==============
+
+    def expire_tasks(self, status: str, older_than: str, limit: int) -> int:
+        """Delete up to `limit` tasks in `status` last updated before `older_than`"""
+        return self._conn().execute(
+            "DELETE FROM tasks WHERE rowid IN "
+            "(SELECT rowid FROM tasks WHERE status = ? AND updated_at < ? LIMIT ?)",
+            (status, older_than, limit),
+        ).rowcount
+
+    def expire_orphan_task_events(self, limit: int) -> int:
+        """Delete events of up to `limit` tasks that have already been expired"""
+        with self.transaction() as conn:
+            ids = [row[0] for row in conn.execute(
+                "SELECT DISTINCT e.task_id FROM task_events e LEFT JOIN tasks t ON t.id = e.task_id "
+                "WHERE t.id IS NULL LIMIT ?", (limit,))]
+            for task_id in ids:
+                conn.execute("DELETE FROM task_events WHERE task_id = ?", (task_id,))
+        return len(ids)
+
+    def expire_sessions(self, older_than: str, limit: int) -> int:
+        """Delete up to `limit` chat sessions idle since before `older_than`"""
+        with self.transaction() as conn:
+            ids = [row[0] for row in conn.execute(
+                "SELECT session_id FROM chat_session_summaries WHERE updated_at < ? LIMIT ?",
+                (older_than, limit))]
+            for session_id in ids:
+                conn.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
+                conn.execute("DELETE FROM chat_session_summaries WHERE session_id = ?", (session_id,))
+        return len(ids)
+
+    def expire_orphan_documents(self, limit: int) -> int:
+        """Delete up to `limit` documents whose task no longer exists"""
+        return self._conn().execute(
+            "DELETE FROM documents WHERE rowid IN (SELECT d.rowid FROM documents d "
+            "LEFT JOIN tasks t ON t.id = d.task_id WHERE t.id IS NULL LIMIT ?)",
+            (limit,),
+        ).rowcount
+
+    def counts(self) -> Dict[str, Any]:
+        """Live object counts, with tasks broken down by status"""
+        conn = self._conn()
+        return {
+            "tasks": dict(conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()),
+            "chat_sessions": conn.execute("SELECT COUNT(*) FROM chat_session_summaries").fetchone()[0],
+            "chat_messages": conn.execute("SELECT COUNT(*) FROM chat_messages").fetchone()[0],
+            "documents": conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+            "task_events": conn.execute("SELECT COUNT(*) FROM task_events").fetchone()[0],
+            "eligibility_users": conn.execute(
+                "SELECT COUNT(DISTINCT user_id) FROM eligibility_state").fetchone()[0],
+        }
+
+
+def _preview(message: Dict[str, Any]) -> str:
+    return str(message.get("content", ""))[:PREVIEW_LENGTH]
+
+
+def encode_cursor(*values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return values
+
+
+# Singleton instance
+state_store = StateStore(STATE_DB_PATH)
@@ -0,0 +1,130 @@
+"""
+TinyDB storage with selectable on-disk encodings.
+
+Formats:
+- json:    stdlib json with indent=2 (the original, diff-friendly layout)
+- orjson:  compact JSON without indentation, encoded with orjson
+- msgpack: msgpack payload behind a versioned binary header
+
+The format is auto-detected on load, so a database written in any format can
+be opened regardless of DB_FORMAT. Convert an existing file with:
+
+    python storage.py data/database.json --to msgpack
+"""
+import argparse
+import json
+import os
+import struct
+from typing import Any, Dict, Optional
+
+from tinydb.storages import Storage, touch
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+# msgpack files start with a magic string and a format version so the loader
+# never has to guess and future layout changes can be detected.
+MSGPACK_MAGIC = b"TDBM"
+MSGPACK_VERSION = 1
+MSGPACK_HEADER = MSGPACK_MAGIC + struct.pack(">B", MSGPACK_VERSION)
+
+FORMATS = ("json", "orjson", "msgpack")
+
+
+def encode(data: Dict[str, Any], fmt: str) -> bytes:
+    """Serialize database contents in the given format"""
+    if fmt == "json":
+        return json.dumps(data, indent=2).encode("utf-8")
+    if fmt == "orjson":
+        if orjson is None:
+            raise RuntimeError("DB_FORMAT=orjson requires the 'orjson' package")
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    if fmt == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("DB_FORMAT=msgpack requires the 'msgpack' package")
+        return MSGPACK_HEADER + msgpack.packb(data, use_bin_type=True)
+    raise ValueError(f"Unknown database format: {fmt}")
+
+
+def detect_format(raw: bytes) -> str:
+    """Identify the format of a serialized database"""
+    if raw.startswith(MSGPACK_MAGIC):
+        return "msgpack"
+    return "json"
+
+
+def decode(raw: bytes) -> Optional[Dict[str, Any]]:
+    """Deserialize database contents, auto-detecting the format"""
+    if not raw.strip():
+        return None
+    if detect_format(raw) == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("Database is msgpack-encoded but 'msgpack' is not installed")
+        version = raw[len(MSGPACK_MAGIC)]
+        if version > MSGPACK_VERSION:
+            raise ValueError(f"Unsupported msgpack database version: {version}")
+        return msgpack.unpackb(raw[len(MSGPACK_HEADER):], raw=False, strict_map_key=False)
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+class AutoStorage(Storage):
+    """File storage that writes in `fmt` and reads any supported format"""
+
+    def __init__(self, path: str, fmt: str = "json", create_dirs: bool = False):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown database format: {fmt}")
+        self.fmt = fmt
+        touch(path, create_dirs=create_dirs)
+        self._handle = open(path, "r+b")
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        self._handle.seek(0)
+        return decode(self._handle.read())
+
+    def write(self, data: Dict[str, Any]):
+        self._handle.seek(0)
+        self._handle.write(encode(data, self.fmt))
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+        self._handle.truncate()
+
+    def close(self):
+        self._handle.close()
+
+
+def convert(src: str, fmt: str, dst: Optional[str] = None) -> str:
+    """Re-encode a database file in another format (in place unless dst is given)"""
+    with open(src, "rb") as fh:
+        data = decode(fh.read()) or {}
+    dst = dst or src
+    tmp = dst + ".tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(encode(data, fmt))
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, dst)
+    return dst
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a TinyDB database file between formats")
+    parser.add_argument("path", help="database file to convert")
+    parser.add_argument("--to", dest="fmt", choices=FORMATS, required=True)
+    parser.add_argument("--out", help="write to this path instead of converting in place")
+    args = parser.parse_args()
+
+    with open(args.path, "rb") as fh:
+        before = detect_format(fh.read(len(MSGPACK_MAGIC)))
+    before_size = os.path.getsize(args.path)
+    out = convert(args.path, args.fmt, args.out)
+    print(f"{args.path} ({before}, {before_size} bytes) -> "
+          f"{out} ({args.fmt}, {os.path.getsize(out)} bytes)")
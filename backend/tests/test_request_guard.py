@@ -0,0 +1,62 @@
+import json
+import uuid
+from collections import Counter
+
+from fastapi.testclient import TestClient
+
+import main
+from config import RATE_LIMITS
+from services.request_guard import request_guard, resolve_identity
+
+USER_BURST = RATE_LIMITS["user"][2]
+
+
+def client_at(n):
+    return TestClient(main.app, client=(f"172.16.{n // 256}.{n % 256}", 50000))
+
+
+def test_user_id_is_read_like_the_routes_read_it():
+    assert resolve_identity({"query_string": b"user%5Fid=al%20ice"}).user_id == "al ice"
+    assert resolve_identity({"query_string": b"user_id="}).user_id is None
+    assert resolve_identity({"query_string": b"a=1"}).user_id is None
+
+
+def test_anonymous_requests_do_not_share_a_user_bucket():
+    statuses = Counter(client_at(n).get("/config").status_code for n in range(2 * USER_BURST))
+    assert statuses == {200: 2 * USER_BURST}
+
+
+def test_user_limit_follows_the_user_across_addresses():
+    user = f"user-{uuid.uuid4().hex[:8]}"
+    statuses = [client_at(1000 + n).get(f"/tasks?user%5Fid={user}").status_code
+                for n in range(USER_BURST + 5)]
+    assert statuses[:USER_BURST] == [200] * USER_BURST
+    assert set(statuses[USER_BURST:]) == {429}
+
+
+def test_read_routes_under_security_are_not_bot_screened(signed):
+    user = f"user-{uuid.uuid4().hex[:8]}"
+    statuses = Counter(signed("GET", f"/security/ledger?user_id={user}").status_code for _ in range(15))
+    assert statuses == {200: 15}
+
+
+def test_generate_proof_is_bot_screened(signed):
+    user = f"user-{uuid.uuid4().hex[:8]}"
+    body = json.dumps({"user_id": user, "attribute": "citizenship"}).encode()
+    rejected = request_guard.rejected.get("anomaly", 0)
+    statuses = [signed("POST", f"/security/generate_proof?user_id={user}", body,
+                       headers={"content-type": "application/json"}).status_code
+                for _ in range(12)]
+    assert 429 not in statuses[:10]
+    assert statuses[10:] == [429, 429]
+    assert request_guard.rejected["anomaly"] == rejected + 2
+
+
+def test_generate_proof_screens_the_body_user_without_a_query_user(signed):
+    user = f"user-{uuid.uuid4().hex[:8]}"
+    body = json.dumps({"user_id": user, "attribute": "citizenship"}).encode()
+    statuses = [signed("POST", "/security/generate_proof", body,
+                       headers={"content-type": "application/json"}).status_code
+                for _ in range(12)]
+    assert 429 not in statuses[:10]
+    assert statuses[10:] == [429, 429]
@@ -0,0 +1,104 @@
+import json
+import time
+import uuid
+from collections import Counter
+
+from fastapi.testclient import TestClient
+
+from config import RATE_LIMITS
+from conftest import SIGNING_SECRET, sign
+from services.request_signing import RequestSignatureMiddleware, SignatureVerifier
+
+USER_BURST = RATE_LIMITS["user"][2]
+
+
+def ledger_target():
+    return f"/security/ledger?user_id=user-{uuid.uuid4().hex[:8]}"
+
+
+def test_admin_routes_require_a_signature(client, signed):
+    assert client.get("/admin/state").status_code == 401
+    assert client.post("/admin/sweep").status_code == 401
+    assert signed("GET", "/admin/state").status_code == 200
+
+
+def test_valid_signature_is_accepted(signed):
+    assert signed("GET", ledger_target()).status_code == 200
+
+
+def test_missing_or_malformed_signature_is_refused(client):
+    target = ledger_target()
+    assert client.get(target).status_code == 401
+    assert client.get(target, headers={"X-Timestamp": str(int(time.time() * 1000))}).status_code == 401
+    headers = {**sign("GET", target), "X-Signature": "not-hex"}
+    assert client.get(target, headers=headers).json()["detail"] == "Malformed request signature"
+
+
+def test_signature_under_another_secret_is_refused(client):
+    target = ledger_target()
+    response = client.get(target, headers=sign("GET", target, secret="someone-elses-secret"))
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Invalid request signature"
+
+
+def test_signature_covers_the_query(client):
+    headers = sign("GET", ledger_target())
+    assert client.get(ledger_target(), headers=headers).status_code == 401
+
+
+def test_replayed_signature_is_refused(client):
+    target = ledger_target()
+    headers = sign("GET", target)
+    assert client.get(target, headers=headers).status_code == 200
+    response = client.get(target, headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Request already processed"
+
+
+def test_stale_timestamp_is_refused(client):
+    target = ledger_target()
+    stale = int(time.time() * 1000) - 10 * 60 * 1000
+    response = client.get(target, headers=sign("GET", target, timestamp_ms=stale))
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Request timestamp outside the allowed window"
+
+
+def test_tampered_body_is_refused(client):
+    user = f"user-{uuid.uuid4().hex[:8]}"
+    body = json.dumps({"user_id": user, "attribute": "citizenship"}).encode()
+    headers = {**sign("POST", "/security/generate_proof", body), "content-type": "application/json"}
+    forged = body.replace(b"citizenship", b"age")
+    response = client.post("/security/generate_proof", content=forged, headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Invalid request signature"
+
+
+def test_unsigned_requests_do_not_spend_the_user_limit(client, signed):
+    target = ledger_target()
+    statuses = Counter(client.get(target).status_code for _ in range(USER_BURST + 10))
+    assert statuses == {401: USER_BURST + 10}
+    assert signed("GET", target).status_code == 200
+
+
+async def echo_length(scope, receive, send):
+    size = 0
+    while True:
+        message = await receive()
+        size += len(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": str(size).encode()})
+
+
+def test_oversized_body_is_refused():
+    verifier = SignatureVerifier([SIGNING_SECRET], prefixes=("/",), max_body=1024)
+    client = TestClient(RequestSignatureMiddleware(echo_length, verifier=verifier))
+    small, large = b"x" * 1024, b"x" * 1025
+    assert client.post("/upload", content=small, headers=sign("POST", "/upload", small)).text == "1024"
+    assert client.post("/upload", content=large, headers=sign("POST", "/upload", large)).status_code == 413
+
+    # Without Content-Length the limit is enforced as the chunks arrive
+    chunked = client.post("/upload", content=iter([small, b"x"]), headers=sign("POST", "/upload", large))
+    assert chunked.status_code == 413
+    assert verifier.rejected["too_large"] == 2
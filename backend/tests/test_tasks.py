@@ -0,0 +1,70 @@
+import uuid
+
+import pytest
+
+from knowledge_base import AGENTIC_SERVICES
+from services import task_manager
+from services.task_manager import TaskRecord
+
+
+@pytest.fixture
+def new_task():
+    def create():
+        record = TaskRecord.new(next(iter(AGENTIC_SERVICES)), f"user-{uuid.uuid4().hex[:8]}")
+        task_manager.create_task(record)
+        return record.id
+    return create
+
+
+def test_batch_rejects_unknown_actions(client, new_task):
+    task_id = new_task()
+    for action in ("create", "attach_document", "bogus"):
+        response = client.post("/tasks/batch", json={"transitions": [{"task_id": task_id, "action": action}]})
+        assert response.status_code == 422
+    assert task_manager.get_task(task_id).current_step == 1
+
+
+def test_batch_item_errors_do_not_roll_back_other_items(new_task):
+    first, second = new_task(), new_task()
+    results = task_manager.transition_many([
+        {"task_id": first, "action": "advance"},
+        {"task_id": second, "action": "create"},
+        {"task_id": second, "action": "attach_document"},
+        {"task_id": "missing", "action": "cancel"},
+    ])
+    assert [r.error is None for r in results] == [True, False, False, False]
+    assert task_manager.get_task(first).current_step == 2
+    assert "documents" not in task_manager.get_task(second).extra
+
+
+def test_repeated_idempotency_key_replays_the_first_result(client, new_task):
+    task_id = new_task()
+    key = uuid.uuid4().hex
+    first = client.post(f"/task/{task_id}/advance", headers={"Idempotency-Key": key})
+    again = client.post(f"/task/{task_id}/advance", headers={"Idempotency-Key": key})
+    assert first.status_code == again.status_code == 200
+    assert again.json()["task"]["current_step"] == 2
+    assert task_manager.get_task(task_id).current_step == 2
+
+
+def test_idempotency_key_reused_for_another_task_or_action_conflicts(client, new_task):
+    task_a, task_b = new_task(), new_task()
+    key = uuid.uuid4().hex
+    assert client.post(f"/task/{task_a}/advance", headers={"Idempotency-Key": key}).status_code == 200
+
+    assert client.post(f"/task/{task_b}/cancel", headers={"Idempotency-Key": key}).status_code == 409
+    assert client.post(f"/task/{task_a}/cancel", headers={"Idempotency-Key": key}).status_code == 409
+    assert task_manager.get_task(task_b).status == "in_progress"
+    assert task_manager.get_task(task_a).status == "in_progress"
+
+
+def test_idempotency_key_of_a_swept_task_is_not_found(client, new_task):
+    from state_store import state_store
+
+    task_id = new_task()
+    key = uuid.uuid4().hex
+    client.post(f"/task/{task_id}/advance", headers={"Idempotency-Key": key})
+    state_store.expire_tasks("in_progress", "9999", 1000)
+
+    response = client.post(f"/task/{task_id}/advance", headers={"Idempotency-Key": key})
+    assert response.status_code == 404
@@ -6,9 +6,13 @@ class ApiService {
   static const String _backendUrl = 'http://127.0.0.1:8000';
   static const String _secretKey = 'my-secret-key-123'; // Matches backend
 
-  Map<String, String> _getSecurityHeaders(String method, String path, String body) {
+  // Signs METHOD, path (with query), timestamp and the body's SHA-256, as
+  // checked by the backend's request signature middleware
+  Map<String, String> _getSecurityHeaders(String method, Uri uri, String body) {
     final timestamp = DateTime.now().millisecondsSinceEpoch.toString();
-    final stringToSign = '$method:$path:$timestamp:$body';
+    final target = uri.hasQuery ? '${uri.path}?${uri.query}' : uri.path;
+    final bodyHash = sha256.convert(utf8.encode(body));
+    final stringToSign = '$method\n$target\n$timestamp\n$bodyHash';
     final hmacSha256 = Hmac(sha256, utf8.encode(_secretKey));
     final digest = hmacSha256.convert(utf8.encode(stringToSign));
     return {
@@ -60,7 +64,7 @@ class ApiService {
   Future<Map<String, dynamic>> getDigitalId() async {
     try {
       final uri = Uri.parse('$_backendUrl/user/id');
-      final headers = _getSecurityHeaders('GET', uri.path, '');
+      final headers = _getSecurityHeaders('GET', uri, '');
       final response = await http.get(uri, headers: headers);
       if (response.statusCode == 200) {
         return jsonDecode(response.body);
@@ -94,7 +98,7 @@ class ApiService {
     try {
       final uri = Uri.parse('$_backendUrl/security/generate_proof');
       final body = jsonEncode({'attribute': attribute});
-      final headers = _getSecurityHeaders('POST', uri.path, body);
+      final headers = _getSecurityHeaders('POST', uri, body);
       final response = await http.post(uri, headers: headers, body: body);
       if (response.statusCode == 200) {
         return jsonDecode(response.body);
@@ -108,7 +112,7 @@ class ApiService {
   Future<bool> checkRevocationStatus() async {
     try {
       final uri = Uri.parse('$_backendUrl/security/status');
-      final headers = _getSecurityHeaders('GET', uri.path, '');
+      final headers = _getSecurityHeaders('GET', uri, '');
       final response = await http.get(uri, headers: headers);
       if (response.statusCode == 200) {
         final data = jsonDecode(response.body);